@@ -0,0 +1,72 @@
+"""
+SQLフィンガープリントのベンチマーク
+同じ文とみなすべきSQLの組（tests/fingerprint_cases.py）で fingerprint() の判定を確認し、
+生成したSQLのコーパスで、結果キャッシュ・コストチェックのキー（空白のみ正規化）と
+スループット（CPU時間）・異なるキーの数を比較します
+
+実行方法:
+    python -m benchmarks.bench_fingerprint [--queries 5000] [--repeat 5]
+    python benchmarks/bench_fingerprint.py [--queries 5000] [--repeat 5]
+"""
+
+import argparse
+import hashlib
+import sys
+from pathlib import Path
+
+if __package__ in (None, ""):
+    # スクリプトとして実行された場合もリポジトリのルートから import できるようにする
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.bench_query_checker import _corpus, _cpu_time  # noqa: E402
+from src.external.db.result_cache import normalize_query  # noqa: E402
+from src.services.fingerprint import fingerprint, normalize  # noqa: E402
+from tests.fingerprint_cases import EQUIVALENT_GROUPS  # noqa: E402
+
+
+def _check_corpus() -> int:
+    """コーパスの判定の誤り（組の中で値が異なる・組の間で値が同じ）の件数"""
+    errors = 0
+    seen: dict[str, int] = {}
+    for index, group in enumerate(EQUIVALENT_GROUPS):
+        values = {fingerprint(query) for query in group}
+        if len(values) != 1:
+            errors += 1
+            print(f"NG 組{index}: 値が一致しない")
+            for query in group:
+                print(f"    {normalize(query)}")
+        for value in values:
+            if value in seen and seen[value] != index:
+                errors += 1
+                print(f"NG 組{seen[value]} と 組{index}: 値が衝突")
+            seen.setdefault(value, index)
+    print(f"コーパス: {len(EQUIVALENT_GROUPS)}組 / 誤り {errors}件")
+    return errors
+
+
+def _cache_key(query: str) -> str:
+    """結果キャッシュ・コストチェックと同じ正規化（空白のみ）のキー"""
+    return hashlib.sha1(normalize_query(query).encode()).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    errors = _check_corpus()
+
+    queries = _corpus(args.queries)
+    print(f"\nqueries={len(queries)} repeat={args.repeat}")
+    print(f"{'key':<14}{'cpu ms':>10}{'queries/s':>12}{'distinct':>10}")
+    for label, func in [("whitespace", _cache_key), ("fingerprint", fingerprint)]:
+        seconds = _cpu_time(func, queries, args.repeat)
+        distinct = len({func(query) for query in queries})
+        print(f"{label:<14}{seconds * 1000:>10.1f}{len(queries) / seconds:>12.0f}{distinct:>10}")
+
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+クエリチェッカーのベンチマーク
+生成したSQLのコーパスで、トークナイザを使う check_query と従来の正規表現による実装の
+スループット（CPU時間）と判定の違いを比較します。
+check_query はメモを無効にした場合（tokenizer）と有効にした場合（memoized、
+同じコーパスを繰り返しチェックするので2回目以降はメモから返る）を測ります
+
+実行方法:
+    python -m benchmarks.bench_query_checker [--queries 5000] [--repeat 5]
+"""
+
+import argparse
+import random
+import re
+import time
+from collections import Counter
+
+from src.services.query_checker import (
+    ALLOWED_TABLES,
+    check_query,
+    clear_query_check_cache,
+    get_query_check_stats,
+)
+from src.settings import settings
+
+# 以下、従来の実装（正規表現で複数回走査する）
+_DENY_RE = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|ALTER|DROP|CREATE|REPLACE|TRUNCATE|GRANT|REVOKE)\b",
+    re.I,
+)
+_DANGEROUS_RE = re.compile(r"(--|#|/\*|\*/|;\s*\w)", re.I)
+_HAS_LIMIT_RE = re.compile(r"\bLIMIT\s+(\d+)(?:\s*,\s*\d+)?\s*;?\s*$", re.I)
+_FROM_RE = re.compile(r"\bFROM\s+([`\"\[]?\w+[`\"\]]?)", re.I)
+_JOIN_RE = re.compile(r"\bJOIN\s+([`\"\[]?\w+[`\"\]]?)", re.I)
+
+
+def _legacy_check(query: str) -> tuple[bool, str]:
+    """従来の check_query（結果は (is_valid, 修正後のクエリまたはエラー)）"""
+    query = query.strip()
+    if not query:
+        return False, "クエリが空です"
+    semicolon_count = query.count(";")
+    if semicolon_count > 1 or (semicolon_count == 1 and not query.rstrip().endswith(";")):
+        return False, "複数のSQL文は許可されていません"
+    query = query.rstrip(";").strip()
+    if not query.upper().startswith("SELECT"):
+        return False, "SELECT文のみ実行可能です"
+    if _DENY_RE.search(query):
+        return False, "INSERT/UPDATE/DELETE/ALTER/DROP等のDML/DDL文は許可されていません"
+    if _DANGEROUS_RE.search(query):
+        return False, "SQLコメントや複数文の実行は許可されていません"
+    tables = set()
+    for pattern in (_FROM_RE, _JOIN_RE):
+        for match in pattern.finditer(query):
+            tables.add(re.sub(r'^[`"\[]|[`"\]]$', "", match.group(1)).lower())
+    if not tables:
+        return False, "テーブル名を特定できませんでした"
+    disallowed = tables - ALLOWED_TABLES
+    if disallowed:
+        return False, f"アクセスが許可されていないテーブル: {', '.join(sorted(disallowed))}"
+    match = _HAS_LIMIT_RE.search(query)
+    if match is None:
+        query = f"{query} LIMIT {settings.default_limit}"
+    elif int(match.group(1)) > settings.max_limit:
+        query = _HAS_LIMIT_RE.sub(f"LIMIT {settings.max_limit}", query)
+    return True, query
+
+
+# 以下、コーパスの生成
+_METRICS = ["impressions", "clicks", "cost", "conversions", "conversion_value"]
+_TEMPLATES = [
+    # 単純な集計
+    "SELECT campaign_id, SUM({m}) AS {m} FROM campaign_daily_stats"
+    " WHERE date BETWEEN '{d1}' AND '{d2}' GROUP BY campaign_id ORDER BY {m} DESC{limit}",
+    # JOIN
+    "SELECT c.name, SUM(s.{m}) AS total FROM campaign_daily_stats s"
+    " JOIN campaigns c ON c.id = s.campaign_id WHERE s.date >= '{d1}'"
+    " GROUP BY c.name ORDER BY total DESC{limit}",
+    # カンマ区切りの結合と別名
+    "SELECT a.name, ag.name FROM ad_accounts a, campaigns c, ad_groups ag"
+    " WHERE c.ad_account_id = a.id AND ag.campaign_id = c.id{limit}",
+    # 文字列リテラル中の # や --（従来の実装では誤って拒否される）
+    "SELECT id, name FROM campaigns WHERE name LIKE '%#{n}%' OR name = 'A -- B'{limit}",
+    # 関数内の FROM（従来の実装では date をテーブルとみなす）
+    "SELECT EXTRACT(MONTH FROM date) AS month, SUM({m}) FROM campaign_daily_stats"
+    " WHERE date >= '{d1}' GROUP BY month{limit}",
+    # サブクエリ
+    "SELECT name FROM campaigns WHERE id IN"
+    " (SELECT campaign_id FROM campaign_daily_stats WHERE {m} > {n}){limit}",
+    # 許可されていないテーブル（カンマ区切りの2つ目）
+    "SELECT * FROM campaigns, mysql_users{limit}",
+    # 禁止されている構文
+    "SELECT * FROM campaigns; DELETE FROM campaigns",
+    "SELECT * FROM campaigns /* {n} */{limit}",
+]
+_LIMITS = ["", " LIMIT 10", " LIMIT 5000", " LIMIT 20, 50", " LIMIT 20, 5000", ";"]
+
+
+def _corpus(count: int) -> list[str]:
+    rng = random.Random(0)
+    queries = []
+    for _ in range(count):
+        year = rng.randint(2020, 2024)
+        queries.append(
+            rng.choice(_TEMPLATES).format(
+                m=rng.choice(_METRICS),
+                n=rng.randint(1, 999),
+                d1=f"{year}-01-01",
+                d2=f"{year}-12-31",
+                limit=rng.choice(_LIMITS),
+            )
+        )
+    return queries
+
+
+def _cpu_time(func, queries: list[str], repeat: int) -> float:
+    start = time.process_time()
+    for _ in range(repeat):
+        for query in queries:
+            func(query)
+    return (time.process_time() - start) / repeat
+
+
+def _new_check(query: str) -> tuple[bool, str]:
+    result = check_query(query)
+    return result.is_valid, result.query if result.is_valid else result.error
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    queries = _corpus(args.queries)
+    memo_size = settings.query_check_cache_size or 1024
+    print(f"queries={len(queries)} repeat={args.repeat}")
+    print(f"{'checker':<12}{'cpu ms':>10}{'queries/s':>12}{'valid':>8}")
+    for label, func, cache_size in [
+        ("legacy", _legacy_check, 0),
+        ("tokenizer", _new_check, 0),
+        ("memoized", _new_check, max(memo_size, len(queries))),
+    ]:
+        settings.query_check_cache_size = cache_size
+        clear_query_check_cache()
+        seconds = _cpu_time(func, queries, args.repeat)
+        valid = sum(func(query)[0] for query in queries)
+        print(f"{label:<12}{seconds * 1000:>10.1f}{len(queries) / seconds:>12.0f}{valid:>8}")
+    print(f"memo: {get_query_check_stats()}")
+    settings.query_check_cache_size = 0
+
+    # 判定・書き換えが異なるクエリ（どちらも拒否した場合はエラーメッセージの違いを問わない）
+    differences = Counter()
+    examples = {}
+    for query in queries:
+        legacy, new = _legacy_check(query), _new_check(query)
+        if legacy != new and (legacy[0] or new[0]):
+            kind = f"legacy={'ok' if legacy[0] else 'ng'} tokenizer={'ok' if new[0] else 'ng'}"
+            differences[kind] += 1
+            examples.setdefault(kind, (query, legacy[1], new[1]))
+    print(f"\n判定・書き換えが異なるクエリ: {sum(differences.values())}件")
+    for kind, count in differences.most_common():
+        query, legacy, new = examples[kind]
+        print(f"  {kind}: {count}件\n    SQL: {query}\n    legacy: {legacy}\n    tokenizer: {new}")
+
+
+if __name__ == "__main__":
+    main()
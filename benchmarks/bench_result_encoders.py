@@ -0,0 +1,100 @@
+"""
+実行結果エンコーダのベンチマーク
+形式ごとのCPU時間（process_time）とプロンプトのトークン数を比較します
+
+実行方法:
+    python -m benchmarks.bench_result_encoders [--rows 1000] [--repeat 20]
+"""
+
+import argparse
+import datetime
+import json
+import random
+import time
+from decimal import Decimal
+
+from src.external.db.columnar import ColumnarResult
+from src.services.result_encoder import ENCODERS, encode_result
+from src.settings import settings
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+def _sample_rows(count: int) -> list[dict]:
+    """campaign_daily_stats を集計した結果に近い行を生成"""
+    rng = random.Random(0)
+    start = datetime.date(2024, 1, 1)
+    rows = []
+    for i in range(count):
+        impressions = rng.randint(1_000, 500_000)
+        clicks = rng.randint(0, impressions // 20)
+        cost = Decimal(rng.randint(0, 5_000_000)) / 100
+        rows.append(
+            {
+                "date": start + datetime.timedelta(days=i % 365),
+                "campaign_name": f"キャンペーン_{i % 40:03d}",
+                "impressions": impressions,
+                "clicks": clicks,
+                "cost": cost,
+                "conversions": Decimal(rng.randint(0, 2_000)) / 10,
+            }
+        )
+    return rows
+
+
+def _legacy(rows: list[dict]) -> str:
+    """従来の整形（行ごとに json.dumps(default=str)）"""
+    return f"[{', '.join(json.dumps(row, ensure_ascii=False, default=str) for row in rows)}]"
+
+
+def _cpu_time(func, repeat: int) -> float:
+    start = time.process_time()
+    for _ in range(repeat):
+        func()
+    return (time.process_time() - start) / repeat
+
+
+def _load_encoding():
+    """gpt-4o系のトークナイザを読み込む（取得できない場合はNone）"""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(settings.llm_model)
+    except Exception:
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception:
+            return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    encoding = _load_encoding()
+    if encoding is None:
+        print("tiktokenのエンコーディングを取得できないため、トークン数は表示しません")
+    rows = _sample_rows(args.rows)
+    columnar = ColumnarResult.from_rows(list(rows[0]), [tuple(r.values()) for r in rows])
+
+    cases = [("legacy json", lambda: _legacy(rows))]
+    for name in ENCODERS:
+        cases.append((name, lambda name=name: encode_result([rows], name)))
+        cases.append((f"{name} (columnar)", lambda name=name: encode_result([columnar], name)))
+
+    print(f"rows={args.rows} repeat={args.repeat}")
+    print(f"{'format':<26}{'cpu ms':>10}{'chars':>10}{'tokens':>10}")
+    for label, func in cases:
+        text = func()
+        cpu = _cpu_time(func, args.repeat) * 1000
+        tokens = len(encoding.encode(text)) if encoding else "-"
+        print(f"{label:<26}{cpu:>10.2f}{len(text):>10}{tokens:>10}")
+
+
+if __name__ == "__main__":
+    main()
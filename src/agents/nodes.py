@@ -3,22 +3,41 @@ LangGraphノード定義
 各処理ステップを関数として定義
 """
 
-import json
+from collections.abc import Iterable
+from functools import lru_cache
 
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
+from sqlalchemy.exc import SQLAlchemyError
 
 from src.agents.state import AgentState
-from src.external.db.session import execute_sql
+from src.external.db.admission import AdmissionRejected
+from src.external.db.columnar import ColumnarResult
+from src.external.db.session import (
+    execute_sql,
+    execute_sql_async,
+    stream_sql,
+    stream_sql_async,
+)
+from src.external.db.timeout import is_timeout_error
 from src.schemas.database_schema import SCHEMA_INFO
-from src.services.query_checker import check_query
+from src.services.ad_metrics import add_metrics
+from src.services.cost_gate import check_cost
+from src.services.pagination import KeysetTracker
+from src.services.query_checker import QueryMetadata, check_query
+from src.services.result_encoder import ResultFormatter
+from src.services.scatter_gather import execute_scatter_gather, execute_scatter_gather_async
+from src.services.stats_snapshot import answer_from_snapshot, answer_from_snapshot_async
 from src.settings import settings
 
 
+@lru_cache(maxsize=1)
 def get_llm():
     """
     LLMインスタンスを取得
 
+    クライアント（とHTTPの接続プール）を使い回すため、インスタンスは1つだけ生成する。
+
     Returns:
         ChatOpenAI: OpenAI LLMインスタンス
     """
@@ -29,16 +48,16 @@ def get_llm():
     )
 
 
-def generate_sql_node(state: AgentState) -> AgentState:
-    """
-    SQLを生成するノード
+# 指標を実行結果から計算する場合のSQL生成ルール
+_METRICS_RULE = """- CTR・CPC・CVR・CPA・ROAS は実行結果から自動で計算されるため、SQLでは計算しない。
+  impressions / clicks / cost / conversions / conversion_value を
+  SUM(clicks) AS clicks のように元の列名の別名で合計して取得する
+- 指標で並べ替え・絞り込みをする場合のみSQLで計算し、分母は NULLIF(..., 0) で0除算を避ける
+"""
 
-    Args:
-        state: 現在のエージェント状態
 
-    Returns:
-        AgentState: 更新された状態（sql_queryが設定される）
-    """
+def _build_sql_messages(state: AgentState) -> list:
+    """SQL生成用のプロンプトを組み立てる"""
     # エラー時のリトライプロンプト
     retry_context = ""
     if state.get("error") and state.get("retry_count", 0) > 0:
@@ -50,9 +69,32 @@ def generate_sql_node(state: AgentState) -> AgentState:
 エラー: {state['error']}
 
 ポリシーに準拠したSQLを生成してください。
-- SELECT文のみ使用可能
-- サブクエリ、UNION、WITH句は使用不可
-- 許可されたテーブルのみアクセス可能
+- SELECT文のみ使用可能（WITH句で始めない）
+- SQLコメント、複数文は使用不可
+- サブクエリ・UNIONは使用可能だが、その中でも許可されたテーブルのみアクセス可能
+- LIMITは LIMIT 行数 / LIMIT 開始位置, 行数 / LIMIT 行数 OFFSET 開始位置 の形式で指定
+"""
+        elif error_type == "cost":
+            retry_context = f"""
+【前回のエラー - 実行コスト超過】
+生成したSQL: {state.get('sql_query', '')}
+エラー: {state.get('error', '')}
+
+実行計画の見積もりが大きすぎるため実行しませんでした。より軽いSQLを生成してください。
+- date列の範囲条件を付けてインデックスを使えるようにする
+- search_query_keyword_ad_daily_stats の全件走査を避ける
+- 可能なら campaign_daily_stats / display_ad_daily_stats で集計する
+"""
+        elif error_type == "timeout":
+            retry_context = f"""
+【前回のエラー - 実行時間超過】
+生成したSQL: {state.get('sql_query', '')}
+エラー: {state.get('error', '')}
+
+クエリが制限時間（{settings.query_timeout:g}秒）内に終わりませんでした。より軽いSQLを生成してください。
+- 日付範囲を必要な期間に絞る
+- 実績テーブル同士のJOINを避け、可能なら campaign_daily_stats で集計する
+- 必要な列と集計だけを取得する
 """
         else:
             retry_context = f"""
@@ -73,26 +115,59 @@ def generate_sql_node(state: AgentState) -> AgentState:
 - MySQL構文を使用
 - 日付は 'YYYY-MM-DD' 形式
 - 集計時はGROUP BYを忘れずに
-- サブクエリ、UNION、WITH句（CTE）は使用禁止
+- サブクエリ・UNIONは使用可能、WITH句（CTE）とSQLコメントは使用禁止
 - LIMITは自動で追加されるので不要
 - SQLのみを出力（説明不要、マークダウン不要）
-"""
+{_METRICS_RULE if settings.derived_metrics_enabled else ""}"""
 
     user_prompt = f"{retry_context}質問: {state['question']}"
 
-    llm = get_llm()
-    response = llm.invoke(
-        [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt),
-        ]
-    )
+    return [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=user_prompt),
+    ]
 
-    sql = response.content.strip()
+
+def _extract_sql(content: str) -> str:
+    """LLMの応答からSQLを取り出す"""
+    sql = content.strip()
     # マークダウンのコードブロックを除去
     if sql.startswith("```"):
         lines = sql.split("\n")
         sql = "\n".join(lines[1:-1] if lines[-1] == "```" else lines[1:])
+    return sql
+
+
+def generate_sql_node(state: AgentState) -> AgentState:
+    """
+    SQLを生成するノード
+
+    Args:
+        state: 現在のエージェント状態
+
+    Returns:
+        AgentState: 更新された状態（sql_queryが設定される）
+    """
+    llm = get_llm()
+    response = llm.invoke(_build_sql_messages(state))
+    sql = _extract_sql(response.content)
+
+    return {**state, "sql_query": sql, "error": None, "error_type": None}
+
+
+async def generate_sql_node_async(state: AgentState) -> AgentState:
+    """
+    SQLを生成するノード（非同期版）
+
+    Args:
+        state: 現在のエージェント状態
+
+    Returns:
+        AgentState: 更新された状態（sql_queryが設定される）
+    """
+    llm = get_llm()
+    response = await llm.ainvoke(_build_sql_messages(state))
+    sql = _extract_sql(response.content)
 
     return {**state, "sql_query": sql, "error": None, "error_type": None}
 
@@ -113,6 +188,7 @@ def check_query_node(state: AgentState) -> AgentState:
         return {
             **state,
             "checked_query": result.query,
+            "query_metadata": result.metadata,
             "error": None,
             "error_type": None,
         }
@@ -120,47 +196,203 @@ def check_query_node(state: AgentState) -> AgentState:
         return {
             **state,
             "checked_query": "",
+            "query_metadata": None,
             "error": result.error,
             "error_type": "check",
             "retry_count": state.get("retry_count", 0) + 1,
         }
 
 
-def execute_sql_node(state: AgentState) -> AgentState:
+def check_cost_node(state: AgentState) -> AgentState:
     """
-    SQLを実行するノード
+    SQLの実行コストをチェックするノード
+
+    settings.cost_gate_enabled が無効の場合は何もしない。
 
     Args:
         state: 現在のエージェント状態
 
     Returns:
-        AgentState: 更新された状態（sql_resultまたはerrorが設定される）
+        AgentState: 更新された状態（コスト超過の場合はerrorが設定される）
+    """
+    if not settings.cost_gate_enabled:
+        return state
+
+    result = check_cost(state["checked_query"], state.get("query_metadata"))
+
+    if result.is_allowed:
+        return {**state, "error": None, "error_type": None}
+    else:
+        return {
+            **state,
+            "error": result.error,
+            "error_type": "cost",
+            "retry_count": state.get("retry_count", 0) + 1,
+        }
+
+
+class _RowFormatter:
+    """
+    行のバッチを逐次 settings.result_format の形式へ整形する
+
+    バッチごとに文字列化するため、全行の辞書を同時に保持する必要がない。
+    """
+
+    def __init__(self, tracker: KeysetTracker | None = None):
+        self._formatter = ResultFormatter(settings.result_format)
+        self._tracker = tracker
+
+    @property
+    def row_count(self) -> int:
+        return self._formatter.row_count
+
+    def add(self, batch: list[dict] | ColumnarResult) -> None:
+        if settings.derived_metrics_enabled:
+            batch = add_metrics(batch)
+        self._formatter.add(batch)
+        if self._tracker is not None:
+            self._tracker.observe(batch)
+
+    def render(self) -> str:
+        return f"結果: {self.row_count}件\n{self._formatter.render()}"
+
+
+def format_rows(
+    batches: Iterable[list[dict] | ColumnarResult], tracker: KeysetTracker | None = None
+) -> str:
     """
-    result = execute_sql(state["checked_query"])
+    行のバッチをプロンプト用の文字列へ整形する
 
+    Args:
+        batches: 行のバッチ
+        tracker: 指定した場合、整形しながら次のページの継続トークン用に行を記録する
+
+    Returns:
+        str: 整形した実行結果
+    """
+    formatter = _RowFormatter(tracker)
+    for batch in batches:
+        formatter.add(batch)
+    return formatter.render()
+
+
+def _stream_error(error: SQLAlchemyError | AdmissionRejected) -> dict:
+    """ストリーミング実行中の例外を実行結果の形式に変換する"""
+    result = {"success": False, "error": str(error)}
+    if isinstance(error, AdmissionRejected):
+        result["error_type"] = "busy"
+    elif is_timeout_error(error):
+        result["error_type"] = "timeout"
+    return result
+
+
+def _stream_and_format(query: str, metadata: QueryMetadata | None) -> dict:
+    """サーバーサイドカーソルで実行しながら結果を整形する"""
+    tracker = KeysetTracker(query, metadata)
+    try:
+        formatted = format_rows(stream_sql(query), tracker)
+    except (SQLAlchemyError, AdmissionRejected) as e:
+        return _stream_error(e)
+    return {"success": True, "formatted": formatted, "continuation_token": tracker.token()}
+
+
+async def _stream_and_format_async(query: str, metadata: QueryMetadata | None) -> dict:
+    """サーバーサイドカーソルで非同期実行しながら結果を整形する"""
+    tracker = KeysetTracker(query, metadata)
+    formatter = _RowFormatter(tracker)
+    try:
+        async for batch in stream_sql_async(query):
+            formatter.add(batch)
+    except (SQLAlchemyError, AdmissionRejected) as e:
+        return _stream_error(e)
+    return {
+        "success": True,
+        "formatted": formatter.render(),
+        "continuation_token": tracker.token(),
+    }
+
+
+def _is_range_aggregate(metadata: QueryMetadata | None) -> bool:
+    """スナップショット・scatter-gatherの対象になり得る（日付範囲で絞り込んだ集計の）SQLか"""
+    return metadata is None or bool(metadata.aggregates and metadata.date_ranges)
+
+
+def _apply_execute_result(state: AgentState, result: dict) -> AgentState:
+    """SQL実行結果を状態に反映する"""
     if result["success"]:
-        formatted = f"結果: {result['row_count']}件\n{json.dumps(result['data'], ensure_ascii=False, default=str)}"
-        return {**state, "sql_result": formatted, "error": None, "error_type": None}
+        formatted = result.get("formatted")
+        token = result.get("continuation_token")
+        if formatted is None:
+            tracker = KeysetTracker(state["checked_query"], state.get("query_metadata"))
+            formatted = format_rows([result["data"]], tracker)
+            token = tracker.token()
+        return {
+            **state,
+            "sql_result": formatted,
+            "continuation_token": token,
+            "error": None,
+            "error_type": None,
+        }
     else:
         return {
             **state,
             "sql_result": "",
+            "continuation_token": None,
             "error": result["error"],
-            "error_type": "execute",
+            "error_type": result.get("error_type", "execute"),
             "retry_count": state.get("retry_count", 0) + 1,
         }
 
 
-def generate_answer_node(state: AgentState) -> AgentState:
+def execute_sql_node(state: AgentState) -> AgentState:
     """
-    回答を生成するノード
+    SQLを実行するノード
 
     Args:
         state: 現在のエージェント状態
 
     Returns:
-        AgentState: 更新された状態（answerが設定される）
+        AgentState: 更新された状態（sql_resultまたはerrorが設定される）
+    """
+    query = state["checked_query"]
+    result = None
+    # スナップショットで回答できる集計、期間で分割できる集計の順に試す（対象外ならNone）
+    if _is_range_aggregate(state.get("query_metadata")):
+        result = answer_from_snapshot(query)
+        if result is None:
+            result = execute_scatter_gather(query)
+    if result is None and settings.db_stream_results:
+        result = _stream_and_format(query, state.get("query_metadata"))
+    elif result is None:
+        result = execute_sql(query, columnar=settings.db_columnar_results)
+    return _apply_execute_result(state, result)
+
+
+async def execute_sql_node_async(state: AgentState) -> AgentState:
+    """
+    SQLを実行するノード（非同期版）
+
+    Args:
+        state: 現在のエージェント状態
+
+    Returns:
+        AgentState: 更新された状態（sql_resultまたはerrorが設定される）
     """
+    query = state["checked_query"]
+    result = None
+    if _is_range_aggregate(state.get("query_metadata")):
+        result = await answer_from_snapshot_async(query)
+        if result is None:
+            result = await execute_scatter_gather_async(query)
+    if result is None and settings.db_stream_results:
+        result = await _stream_and_format_async(query, state.get("query_metadata"))
+    elif result is None:
+        result = await execute_sql_async(query, columnar=settings.db_columnar_results)
+    return _apply_execute_result(state, result)
+
+
+def _build_answer_messages(state: AgentState) -> list:
+    """回答生成用のプロンプトを組み立てる"""
     prompt = f"""以下のSQL実行結果をもとに、ユーザーの質問に回答してください。
 
 【質問】
@@ -175,13 +407,40 @@ def generate_answer_node(state: AgentState) -> AgentState:
 数値はカンマ区切りで見やすく、必要に応じて考察も加えてください。
 """
 
+    return [
+        SystemMessage(content="あなたはGoogle広告のデータアナリストです。"),
+        HumanMessage(content=prompt),
+    ]
+
+
+def generate_answer_node(state: AgentState) -> AgentState:
+    """
+    回答を生成するノード
+
+    Args:
+        state: 現在のエージェント状態
+
+    Returns:
+        AgentState: 更新された状態（answerが設定される）
+    """
     llm = get_llm()
-    response = llm.invoke(
-        [
-            SystemMessage(content="あなたはGoogle広告のデータアナリストです。"),
-            HumanMessage(content=prompt),
-        ]
-    )
+    response = llm.invoke(_build_answer_messages(state))
+
+    return {**state, "answer": response.content}
+
+
+async def generate_answer_node_async(state: AgentState) -> AgentState:
+    """
+    回答を生成するノード（非同期版）
+
+    Args:
+        state: 現在のエージェント状態
+
+    Returns:
+        AgentState: 更新された状態（answerが設定される）
+    """
+    llm = get_llm()
+    response = await llm.ainvoke(_build_answer_messages(state))
 
     return {**state, "answer": response.content}
 
@@ -196,13 +455,18 @@ def handle_error_node(state: AgentState) -> AgentState:
     Returns:
         AgentState: 更新された状態（answerにエラーメッセージが設定される）
     """
+    if state.get("error_type") == "busy":
+        advice = "データベースが混み合っているため、時間をおいて再度お試しください。"
+    else:
+        advice = "質問を変えて再度お試しください。"
+
     error_msg = f"""申し訳ありません。クエリの実行に失敗しました。
 
 エラー: {state.get('error', '不明')}
 試行したSQL: {state.get('sql_query', 'なし')}
 リトライ回数: {state.get('retry_count')}/{settings.max_retries}
 
-質問を変えて再度お試しください。"""
+{advice}"""
 
     return {**state, "answer": error_msg}
 
@@ -225,6 +489,23 @@ def check_query_result(state: AgentState) -> str:
     return "success"
 
 
+def check_cost_result(state: AgentState) -> str:
+    """
+    コストチェック結果を判定
+
+    Args:
+        state: 現在のエージェント状態
+
+    Returns:
+        str: 次のノード名（"success", "retry", "error"）
+    """
+    if state.get("error"):
+        if state.get("retry_count", 0) < settings.max_retries:
+            return "retry"
+        return "error"
+    return "success"
+
+
 def check_execute_result(state: AgentState) -> str:
     """
     SQL実行結果を判定
@@ -236,6 +517,9 @@ def check_execute_result(state: AgentState) -> str:
         str: 次のノード名（"success", "retry", "error"）
     """
     if state.get("error"):
+        # 混雑で断られた場合はSQLを作り直しても解決しないため、リトライしない
+        if state.get("error_type") == "busy":
+            return "error"
         if state.get("retry_count", 0) < settings.max_retries:
             return "retry"
         return "error"
@@ -4,41 +4,67 @@ Google広告 SQLエージェント（LangGraph版）
 """
 
 from langgraph.graph import END, StateGraph
+from sqlalchemy.exc import SQLAlchemyError
 
 from src.agents.nodes import (
+    check_cost_node,
+    check_cost_result,
     check_execute_result,
     check_query_node,
     check_query_result,
     execute_sql_node,
+    execute_sql_node_async,
+    format_rows,
     generate_answer_node,
+    generate_answer_node_async,
     generate_sql_node,
+    generate_sql_node_async,
     handle_error_node,
 )
 from src.agents.state import AgentState
+from src.external.db.admission import AdmissionRejected
+from src.services.pagination import (
+    InvalidContinuationToken,
+    fetch_next_page,
+    fetch_next_page_async,
+)
 
 
-def build_graph():
+def build_graph(use_async: bool = False):
     """
     LangGraphのワークフローを構築
 
     ワークフロー:
     1. generate_sql: 自然言語からSQLを生成
     2. check_query: SQLの安全性をチェック
-    3. execute_sql: SQLを実行
-    4. generate_answer: 結果から回答を生成
+    3. check_cost: EXPLAINで実行コストをチェック（設定で有効な場合）
+    4. execute_sql: SQLを実行
+    5. generate_answer: 結果から回答を生成
 
     エラー時はリトライまたはエラーハンドリングに分岐
 
+    Args:
+        use_async: Trueの場合、LLM呼び出しとSQL実行を非同期ノードで構成する
+            （ainvokeで実行すること）
+
     Returns:
         CompiledGraph: コンパイル済みのLangGraphワークフロー
     """
     workflow = StateGraph(AgentState)
 
     # ノード追加
-    workflow.add_node("generate_sql", generate_sql_node)
-    workflow.add_node("check_query", check_query_node)
-    workflow.add_node("execute_sql", execute_sql_node)
-    workflow.add_node("generate_answer", generate_answer_node)
+    if use_async:
+        workflow.add_node("generate_sql", generate_sql_node_async)
+        workflow.add_node("check_query", check_query_node)
+        workflow.add_node("check_cost", check_cost_node)
+        workflow.add_node("execute_sql", execute_sql_node_async)
+        workflow.add_node("generate_answer", generate_answer_node_async)
+    else:
+        workflow.add_node("generate_sql", generate_sql_node)
+        workflow.add_node("check_query", check_query_node)
+        workflow.add_node("check_cost", check_cost_node)
+        workflow.add_node("execute_sql", execute_sql_node)
+        workflow.add_node("generate_answer", generate_answer_node)
     workflow.add_node("handle_error", handle_error_node)
 
     # エントリーポイント
@@ -51,6 +77,17 @@ def build_graph():
     workflow.add_conditional_edges(
         "check_query",
         check_query_result,
+        {
+            "success": "check_cost",
+            "retry": "generate_sql",
+            "error": "handle_error",
+        },
+    )
+
+    # 条件分岐: コストチェック後
+    workflow.add_conditional_edges(
+        "check_cost",
+        check_cost_result,
         {
             "success": "execute_sql",
             "retry": "generate_sql",
@@ -77,30 +114,49 @@ def build_graph():
 
 # グラフをコンパイル
 agent = build_graph()
+async_agent = build_graph(use_async=True)
 
 
-def ask(question: str) -> str:
-    """
-    自然言語で質問してSQLを実行し、回答を得る
-
-    Args:
-        question: 自然言語での質問
-
-    Returns:
-        str: 回答
-    """
-    initial_state: AgentState = {
+def _initial_state(question: str) -> AgentState:
+    """質問から初期状態を作成"""
+    return {
         "question": question,
         "sql_query": "",
         "checked_query": "",
+        "query_metadata": None,
         "sql_result": "",
+        "continuation_token": None,
         "answer": "",
         "error": None,
         "error_type": None,
         "retry_count": 0,
     }
 
-    result = agent.invoke(initial_state)
+
+def _to_details(result: AgentState) -> dict:
+    """最終状態から詳細情報を取り出す"""
+    return {
+        "question": result["question"],
+        "sql_query": result["sql_query"],
+        "checked_query": result["checked_query"],
+        "sql_result": result["sql_result"],
+        "continuation_token": result.get("continuation_token"),
+        "answer": result["answer"],
+        "error": result.get("error"),
+    }
+
+
+def ask(question: str) -> str:
+    """
+    自然言語で質問してSQLを実行し、回答を得る
+
+    Args:
+        question: 自然言語での質問
+
+    Returns:
+        str: 回答
+    """
+    result = agent.invoke(_initial_state(question))
     return result["answer"]
 
 
@@ -117,26 +173,92 @@ def ask_with_details(question: str) -> dict:
             - sql_query: 生成されたSQL
             - checked_query: チェック済みSQL
             - sql_result: SQL実行結果
+            - continuation_token: 実行結果の続きを取得する継続トークン（続きが無ければNone）
             - answer: 回答
             - error: エラー（あれば）
     """
-    initial_state: AgentState = {
-        "question": question,
-        "sql_query": "",
-        "checked_query": "",
-        "sql_result": "",
-        "answer": "",
-        "error": None,
-        "error_type": None,
-        "retry_count": 0,
-    }
+    result = agent.invoke(_initial_state(question))
+    return _to_details(result)
 
-    result = agent.invoke(initial_state)
+
+async def ask_async(question: str) -> str:
+    """
+    自然言語で質問してSQLを実行し、回答を得る（非同期版）
+
+    1つのイベントループ上で複数の質問を並行して処理できる。
+
+    Args:
+        question: 自然言語での質問
+
+    Returns:
+        str: 回答
+    """
+    result = await async_agent.ainvoke(_initial_state(question))
+    return result["answer"]
+
+
+async def ask_with_details_async(question: str) -> dict:
+    """
+    詳細情報付きで質問を実行（非同期版）
+
+    Args:
+        question: 自然言語での質問
+
+    Returns:
+        dict: ask_with_detailsと同じ形式の結果
+    """
+    result = await async_agent.ainvoke(_initial_state(question))
+    return _to_details(result)
+
+
+# 次のページの取得で、結果の辞書ではなく例外として返るエラー
+_PAGE_ERRORS = (InvalidContinuationToken, SQLAlchemyError, AdmissionRejected)
+
+
+def _page_error(error: Exception | str) -> dict:
+    return {"sql_result": "", "continuation_token": None, "error": str(error)}
+
+
+def _to_page(result: dict) -> dict:
+    """次のページの実行結果を fetch_more の形式に変換"""
+    if not result["success"]:
+        return _page_error(result["error"])
     return {
-        "question": result["question"],
-        "sql_query": result["sql_query"],
-        "checked_query": result["checked_query"],
-        "sql_result": result["sql_result"],
-        "answer": result["answer"],
-        "error": result.get("error"),
+        "sql_result": format_rows([result["data"]]),
+        "continuation_token": result["continuation_token"],
+        "error": None,
     }
+
+
+def fetch_more(token: str) -> dict:
+    """
+    前回の実行結果の続き（次のページ）を取得
+
+    SQLを生成し直さず、継続トークンに記録した並び順のキーで続きを取得する（LLMは呼び出さない）。
+
+    Args:
+        token: ask_with_details が返した continuation_token
+
+    Returns:
+        dict: 取得結果
+            - sql_result: SQL実行結果
+            - continuation_token: さらに続きがある場合の継続トークン（無ければNone）
+            - error: エラー（あれば）
+    """
+    try:
+        return _to_page(fetch_next_page(token))
+    except _PAGE_ERRORS as e:
+        return _page_error(e)
+
+
+async def fetch_more_async(token: str) -> dict:
+    """
+    前回の実行結果の続き（次のページ）を取得（非同期版）
+
+    Returns:
+        dict: fetch_moreと同じ形式の結果
+    """
+    try:
+        return _to_page(await fetch_next_page_async(token))
+    except _PAGE_ERRORS as e:
+        return _page_error(e)
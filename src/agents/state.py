@@ -4,6 +4,8 @@
 
 from typing import TypedDict
 
+from src.services.query_checker import QueryMetadata
+
 
 class AgentState(TypedDict):
     """
@@ -13,17 +15,21 @@ class AgentState(TypedDict):
         question: ユーザーの質問
         sql_query: 生成されたSQL
         checked_query: チェック済みSQL
+        query_metadata: チェック済みSQLの解析結果
         sql_result: 実行結果
+        continuation_token: 実行結果の続き（次のページ）を取得する継続トークン
         answer: 最終回答
         error: エラーメッセージ
-        error_type: エラー種別（"check" or "execute"）
+        error_type: エラー種別（"check" / "cost" / "execute" / "timeout" / "busy"）
         retry_count: リトライ回数
     """
 
     question: str
     sql_query: str
     checked_query: str
+    query_metadata: QueryMetadata | None
     sql_result: str
+    continuation_token: str | None
     answer: str
     error: str | None
     error_type: str | None
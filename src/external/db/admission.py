@@ -0,0 +1,230 @@
+"""
+クエリ実行のアドミッション制御
+同時に実行するクエリ数を制限し、超えた分はFIFOの待ち行列で順番を待たせます
+
+待ち行列が満杯の場合や待ち時間が上限を超えた場合は AdmissionRejected を送出し、
+DBの接続枯渇やレプリカの過負荷を呼び出し側へ背圧として返す。
+同期（スレッド）と非同期（asyncio）の呼び出しで同じ上限と待ち行列を共有する。
+"""
+
+import asyncio
+import contextlib
+import threading
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Iterator
+
+
+class AdmissionRejected(Exception):
+    """
+    アドミッション制御でクエリの実行を断った
+
+    Attributes:
+        reason: "queue_full"（待ち行列が満杯）または "timeout"（待ち時間の上限超過）
+    """
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class _Waiter:
+    """待ち行列の1エントリ（スレッドはEvent、コルーチンはFutureで起こす）"""
+
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, event=None, loop=None, future=None):
+        self.event = event
+        self.loop = loop
+        self.future = future
+        self.granted = False
+
+    def wake(self) -> None:
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionController:
+    """
+    同時実行数の制限とFIFOの待ち行列
+
+    Attributes:
+        max_concurrent: 同時に実行できるクエリ数（0以下なら制限しない）
+        max_queue: 待ち行列の最大長
+        queue_timeout: 待ち行列で待つ最大秒数
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._waiters: deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    def _try_admit(self) -> bool:
+        """空きがあり、先に待っているものがいなければ枠を確保（ロック内で呼ぶ）"""
+        if self.in_flight < self.max_concurrent and not self._waiters:
+            self.in_flight += 1
+            self._record(0.0)
+            return True
+        return False
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        """待ち行列に追加（ロック内で呼ぶ）"""
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected(
+                "queue_full",
+                f"データベースが混み合っています（待ち行列が満杯: {self.max_queue}件）",
+            )
+        self._waiters.append(waiter)
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+
+    def _settle(self, waiter: _Waiter, started: float) -> bool:
+        """
+        待機を終えたエントリの判定（ロック内で呼ぶ）
+
+        Returns:
+            bool: 枠が割り当てられていればTrue、そうでなければ待ち行列から外してFalse
+        """
+        if waiter.granted:
+            self._record(time.perf_counter() - started)
+            return True
+        self._waiters.remove(waiter)
+        return False
+
+    def _record(self, wait: float) -> None:
+        self.admitted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def _timeout_error(self) -> AdmissionRejected:
+        self.rejected_timeout += 1
+        return AdmissionRejected(
+            "timeout",
+            f"データベースが混み合っています（{self.queue_timeout:g}秒以内に実行できませんでした）",
+        )
+
+    def release(self) -> None:
+        """枠を返す（待っているものがいれば先頭へ引き継ぐ）"""
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                waiter.wake()
+            else:
+                self.in_flight -= 1
+
+    def acquire(self) -> None:
+        """
+        枠を確保（空くまでブロック）
+
+        Raises:
+            AdmissionRejected: 待ち行列が満杯、または待ち時間の上限を超えた場合
+        """
+        started = time.perf_counter()
+        with self._lock:
+            if self._try_admit():
+                return
+            waiter = _Waiter(event=threading.Event())
+            self._enqueue(waiter)
+
+        waiter.event.wait(self.queue_timeout)
+        with self._lock:
+            if self._settle(waiter, started):
+                return
+            raise self._timeout_error()
+
+    async def acquire_async(self) -> None:
+        """
+        枠を確保（空くまで待機、非同期版）
+
+        Raises:
+            AdmissionRejected: 待ち行列が満杯、または待ち時間の上限を超えた場合
+        """
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_admit():
+                return
+            waiter = _Waiter(loop=loop, future=loop.create_future())
+            self._enqueue(waiter)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            # キャンセルされた場合、割り当て済みの枠は次へ引き継ぐ
+            with self._lock:
+                granted = self._settle(waiter, started)
+            if granted:
+                self.release()
+            raise
+        with self._lock:
+            if self._settle(waiter, started):
+                return
+            raise self._timeout_error()
+
+    @contextlib.contextmanager
+    def admit(self) -> Iterator[None]:
+        """枠を確保してブロックを実行し、終了時に返す"""
+        if not self.enabled:
+            yield
+            return
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextlib.asynccontextmanager
+    async def admit_async(self) -> AsyncIterator[None]:
+        """枠を確保してブロックを実行し、終了時に返す（非同期版）"""
+        if not self.enabled:
+            yield
+            return
+        await self.acquire_async()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        """
+        統計を取得
+
+        Returns:
+            dict: max_concurrent, in_flight, queued, max_queue_depth, admitted,
+                rejected_queue_full, rejected_timeout, avg_wait_ms, max_wait_ms
+        """
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "in_flight": self.in_flight,
+                "queued": len(self._waiters),
+                "max_queue_depth": self.max_queue_depth,
+                "admitted": self.admitted,
+                "rejected_queue_full": self.rejected_queue_full,
+                "rejected_timeout": self.rejected_timeout,
+                "avg_wait_ms": (self.total_wait / self.admitted * 1000) if self.admitted else 0.0,
+                "max_wait_ms": self.max_wait * 1000,
+            }
@@ -0,0 +1,128 @@
+"""
+列指向のSQL実行結果
+列名を1回だけ持ち、数値列は型付き配列に詰めて保持する
+"""
+
+import sys
+from array import array
+from collections.abc import Iterable, Iterator, Sequence
+from decimal import Decimal
+
+
+def _pack(values: list) -> array | list:
+    """
+    列の値を可能であれば型付き配列に変換
+
+    - 全て整数: array("q")（int64）
+    - 整数/浮動小数点/Decimalの混在: array("d")（float64）
+    - NULLや文字列・日付を含む列: listのまま
+    """
+    if not values:
+        return values
+
+    kinds = set(map(type, values))
+    if kinds == {int}:
+        try:
+            return array("q", values)
+        except OverflowError:
+            return values
+    if kinds <= {int, float, Decimal}:
+        return array("d", map(float, values))
+    return values
+
+
+class ColumnarResult:
+    """
+    列指向のSQL実行結果
+
+    Attributes:
+        columns: 列名
+        arrays: 列ごとの値（columnsと同じ順序）
+        row_count: 行数
+    """
+
+    __slots__ = ("columns", "arrays", "row_count", "_index")
+
+    def __init__(self, columns: Sequence[str], arrays: Sequence[array | list], row_count: int):
+        self.columns = list(columns)
+        self.arrays = list(arrays)
+        self.row_count = row_count
+        self._index = {name: i for i, name in enumerate(self.columns)}
+
+    @classmethod
+    def from_rows(cls, columns: Sequence[str], rows: Sequence[Sequence]) -> "ColumnarResult":
+        """
+        行（タプル）のシーケンスから作成
+
+        Args:
+            columns: 列名
+            rows: 行のシーケンス
+
+        Returns:
+            ColumnarResult: 列指向の結果
+        """
+        if rows:
+            arrays = [_pack(list(values)) for values in zip(*rows)]
+        else:
+            arrays = [[] for _ in columns]
+        return cls(columns, arrays, len(rows))
+
+    @classmethod
+    def from_batches(
+        cls, columns: Sequence[str], batches: Iterable[Sequence[Sequence]]
+    ) -> "ColumnarResult":
+        """
+        行バッチのイテラブルから逐次作成
+
+        Args:
+            columns: 列名
+            batches: 行（タプル）のバッチ
+
+        Returns:
+            ColumnarResult: 列指向の結果
+        """
+        values: list[list] = [[] for _ in columns]
+        row_count = 0
+        for batch in batches:
+            row_count += len(batch)
+            for column, batch_values in zip(values, zip(*batch)):
+                column.extend(batch_values)
+        return cls(columns, [_pack(column) for column in values], row_count)
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    def __repr__(self):
+        return f"ColumnarResult(columns={self.columns}, row_count={self.row_count})"
+
+    def column(self, name: str) -> array | list:
+        """列名から列の値を取得"""
+        return self.arrays[self._index[name]]
+
+    def iter_rows(self) -> Iterator[dict]:
+        """行を辞書として1行ずつ返す"""
+        columns = self.columns
+        for values in zip(*self.arrays):
+            yield dict(zip(columns, values))
+
+    def to_rows(self) -> list[dict]:
+        """行の辞書のリストに変換"""
+        return list(self.iter_rows())
+
+    def to_dict(self) -> dict:
+        """JSONへそのまま変換できる列指向の辞書に変換"""
+        return {
+            "columns": self.columns,
+            "data": [list(values) for values in self.arrays],
+            "row_count": self.row_count,
+        }
+
+    def nbytes(self) -> int:
+        """保持している値のおおよそのメモリ使用量（バイト）"""
+        total = 0
+        for values in self.arrays:
+            if isinstance(values, array):
+                total += values.itemsize * len(values)
+            else:
+                total += sum(map(sys.getsizeof, values))
+        return total
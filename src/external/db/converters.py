@@ -0,0 +1,76 @@
+"""
+DECIMAL/DATE列の型変換
+ドライバが行を組み立てる段階で、DECIMALをfloatに、DATEをISO文字列に変換します
+
+MySQLのテキストプロトコルでは値が文字列で届くため、Decimal/dateオブジェクトを
+経由せずに変換することで行ごとの生成コストと後段の整形コストを減らす。
+変換後もエージェントの指標計算・回答プロンプトでそのまま使える値（元の単位）にする。
+"""
+
+from collections.abc import Callable
+
+# MySQLのカラム型コード（pymysql / asyncmy 共通）
+FIELD_TYPE_DECIMAL = 0
+FIELD_TYPE_NEWDECIMAL = 246
+FIELD_TYPE_DATE = 10
+
+DECIMAL_MODES = ("exact", "float")
+DATE_MODES = ("date", "iso")
+
+# 型変換を組み込めるドライバ
+CONVERTER_DRIVERS = ("pymysql", "asyncmy")
+
+
+def iso_date(value: str) -> str:
+    """DATEの文字列をそのまま返す（MySQLはYYYY-MM-DD形式で返す）"""
+    return value
+
+
+def _decoders(decimal_mode: str, date_mode: str) -> dict[int, Callable]:
+    if decimal_mode not in DECIMAL_MODES:
+        raise ValueError(f"未対応のDECIMAL変換モードです: {decimal_mode}")
+    if date_mode not in DATE_MODES:
+        raise ValueError(f"未対応のDATE変換モードです: {date_mode}")
+
+    decoders: dict[int, Callable] = {}
+    if decimal_mode == "float":
+        decoders[FIELD_TYPE_DECIMAL] = decoders[FIELD_TYPE_NEWDECIMAL] = float
+    if date_mode == "iso":
+        decoders[FIELD_TYPE_DATE] = iso_date
+    return decoders
+
+
+def converter_connect_args(
+    driver: str, decimal_mode: str = "exact", date_mode: str = "date"
+) -> dict:
+    """
+    型変換を組み込んだドライバの接続引数を生成
+
+    exact/date（既定）の場合はドライバ標準の変換（Decimal/date）のまま何も渡さない。
+
+    Args:
+        driver: ドライバ名（pymysql / asyncmy、既定のモードではその他のドライバも可）
+        decimal_mode: DECIMALの変換（exact: Decimal / float: float）
+        date_mode: DATEの変換（date: datetime.date / iso: ISO文字列）
+
+    Returns:
+        dict: create_engine の connect_args に渡す辞書
+
+    Raises:
+        ValueError: 未対応のモード、または型変換を組み込めないドライバ（aiomysql など）の場合
+    """
+    decoders = _decoders(decimal_mode, date_mode)
+    if not decoders:
+        return {}
+
+    if driver == "pymysql":
+        from pymysql.converters import conversions
+    elif driver == "asyncmy":
+        from asyncmy.converters import conversions
+    else:
+        # 同期・非同期で同じ設定の結果の型が変わらないよう、黙って無視しない
+        raise ValueError(
+            f"ドライバ {driver} では型変換を指定できません"
+            f"（{' / '.join(CONVERTER_DRIVERS)} を使うか、exact / date にしてください）"
+        )
+    return {"conv": {**conversions, **decoders}}
@@ -0,0 +1,535 @@
+"""
+組み込み分析バックエンド（SQLite）
+sql/ddl.sql・sql/insert.sql をプロセス内のSQLiteに読み込み、ネットワークを介さずに実行する
+
+check_query が許可する範囲のMySQL構文を対象に、以下の互換処理を行う。
+- DDL: AUTO_INCREMENT / ENUM / インデックス定義などをSQLiteの構文に変換
+- 関数: YEAR / MONTH / DAY / QUARTER / DATE_FORMAT / CONCAT / IF / DATEDIFF / GREATEST などを登録
+- 日付演算: DATE_ADD / DATE_SUB の INTERVAL と「日付 ± INTERVAL n 単位」を関数呼び出しに書き換え
+- 演算: 整数同士の除算がMySQLと同じく小数になるよう "/" を書き換え
+"""
+
+import calendar
+import datetime
+import math
+import re
+import sqlite3
+from pathlib import Path
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+
+from src.services.sql_tokenizer import NUMBER, PARAM, QUOTED, STRING, WORD, significant, tokenize
+
+# CREATE TABLE 文（テーブル名と本体）
+CREATE_TABLE_RE = re.compile(r"CREATE\s+TABLE\s+`?(\w+)`?\s*\((.*?)\)\s*;", re.I | re.S)
+
+# 行コメント
+LINE_COMMENT_RE = re.compile(r"--[^\n]*")
+
+# 引用符で囲まれた部分、または除算演算子
+QUOTED_OR_DIVIDE_RE = re.compile(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`)|/")
+
+# MySQLのDATE_FORMAT指定子からstrftime指定子への対応
+DATE_FORMAT_CODES = {
+    "Y": "%Y",
+    "y": "%y",
+    "m": "%m",
+    "d": "%d",
+    "H": "%H",
+    "i": "%M",
+    "s": "%S",
+    "S": "%S",
+    "M": "%B",
+    "b": "%b",
+    "W": "%A",
+    "a": "%a",
+    "j": "%j",
+    "%": "%%",
+}
+
+# 先頭の0を付けない数値の指定子（strftimeでは環境依存のため個別に変換）
+DATE_FORMAT_NUMBERS = {"c": lambda moment: moment.month, "e": lambda moment: moment.day}
+
+# INTERVAL の単位（timedelta の引数名、または月数）
+INTERVAL_UNITS = {
+    "SECOND": "seconds",
+    "MINUTE": "minutes",
+    "HOUR": "hours",
+    "DAY": "days",
+    "WEEK": "weeks",
+}
+INTERVAL_MONTHS = {"MONTH": 1, "QUARTER": 3, "YEAR": 12}
+
+# INTERVAL を第2引数に取る関数（SQLiteでは (日付, 量, 単位) の3引数で登録する）
+INTERVAL_FUNCTIONS = {"DATE_ADD", "DATE_SUB", "ADDDATE", "SUBDATE"}
+
+# 型付きリテラルのキーワード（DATE '2024-01-01' など）
+TYPED_LITERALS = {"DATE", "TIME", "TIMESTAMP"}
+
+
+# 以下ヘルパー関数たち。
+def _split_top_level(body: str) -> list[str]:
+    """括弧と引用符の外側にあるカンマで分割"""
+    items, depth, quote, start = [], 0, None, 0
+    for i, ch in enumerate(body):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"`":
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            items.append(body[start:i].strip())
+            start = i + 1
+    items.append(body[start:].strip())
+    return [item for item in items if item]
+
+
+def _convert_column(item: str) -> str:
+    item = re.sub(
+        r"\bBIGINT\s+PRIMARY\s+KEY\s+AUTO_INCREMENT\b", "INTEGER PRIMARY KEY", item, flags=re.I
+    )
+    item = re.sub(r"\bAUTO_INCREMENT\b", "", item, flags=re.I)
+    item = re.sub(r"\bENUM\s*\([^)]*\)", "TEXT", item, flags=re.I)
+    item = re.sub(r"\bON\s+UPDATE\s+CURRENT_TIMESTAMP\b", "", item, flags=re.I)
+    return re.sub(r"\bUNIQUE\s+KEY\s+(?:`?\w+`?\s*)?\(", "UNIQUE (", item, flags=re.I)
+
+
+def convert_ddl(ddl: str) -> list[str]:
+    """
+    MySQLのCREATE TABLE文をSQLiteのDDLに変換
+
+    Args:
+        ddl: MySQLのDDL（sql/ddl.sql の内容）
+
+    Returns:
+        list[str]: SQLiteで実行するDDL文
+    """
+    ddl = LINE_COMMENT_RE.sub("", ddl)
+    statements = []
+    for match in CREATE_TABLE_RE.finditer(ddl):
+        table, body = match.group(1), match.group(2)
+        columns, indexes = [], []
+        for item in _split_top_level(body):
+            index = re.match(r"(?:INDEX|KEY)\s+`?(\w+)`?\s*(\(.*\))$", item, re.I | re.S)
+            if index:
+                indexes.append(f"CREATE INDEX {table}_{index.group(1)} ON {table} {index.group(2)}")
+            else:
+                columns.append(_convert_column(item))
+        statements.append(f"CREATE TABLE {table} ({', '.join(columns)})")
+        statements.extend(indexes)
+    return statements
+
+
+def _closing(tokens: list, i: int) -> int | None:
+    """tokens[i] の "(" に対応する ")" の位置"""
+    depth = 0
+    for j in range(i, len(tokens)):
+        if tokens[j].value == "(":
+            depth += 1
+        elif tokens[j].value == ")":
+            depth -= 1
+            if depth == 0:
+                return j
+    return None
+
+
+def _opening(tokens: list, i: int) -> int | None:
+    """tokens[i] の ")" に対応する "(" の位置"""
+    depth = 0
+    for j in range(i, -1, -1):
+        if tokens[j].value == ")":
+            depth += 1
+        elif tokens[j].value == "(":
+            depth -= 1
+            if depth == 0:
+                return j
+    return None
+
+
+def _function(tokens: list, i: int) -> str | None:
+    """tokens[i] を引数に含む関数の名前（大文字）"""
+    depth = 0
+    for j in range(i - 1, 0, -1):
+        depth += {")": 1, "(": -1}.get(tokens[j].value, 0)
+        if depth < 0:
+            return tokens[j - 1].upper if tokens[j - 1].kind == WORD else None
+    return None
+
+
+def _operand_start(tokens: list, end: int) -> int | None:
+    """tokens[end] で終わる演算の被演算子（関数呼び出し・括弧・列・リテラル）の先頭"""
+    token = tokens[end]
+    if token.value == ")":
+        start = _opening(tokens, end)
+        if start is not None and start > 0 and tokens[start - 1].kind == WORD:
+            start -= 1
+        return start
+    if token.kind in (STRING, NUMBER, PARAM):
+        if token.kind == STRING and end > 0 and tokens[end - 1].is_keyword(*TYPED_LITERALS):
+            return end - 1
+        return end
+    if token.kind in (WORD, QUOTED):
+        while end >= 2 and tokens[end - 1].value == "." and tokens[end - 2].kind in (WORD, QUOTED):
+            end -= 2
+        return end
+    return None
+
+
+def _operand_end(tokens: list, start: int) -> int | None:
+    """tokens[start] から始まる被演算子の末尾"""
+    if start >= len(tokens):
+        return None
+    token = tokens[start]
+    if token.value == "(":
+        return _closing(tokens, start)
+    if token.kind == WORD and start + 1 < len(tokens) and tokens[start + 1].value == "(":
+        return _closing(tokens, start + 1)
+    if token.is_keyword(*TYPED_LITERALS) and start + 1 < len(tokens):
+        return start + 1 if tokens[start + 1].kind == STRING else start
+    if token.kind in (STRING, NUMBER, PARAM):
+        return start
+    if token.kind in (WORD, QUOTED):
+        end = start
+        while (
+            end + 2 < len(tokens)
+            and tokens[end + 1].value == "."
+            and tokens[end + 2].kind in (WORD, QUOTED)
+        ):
+            end += 2
+        return end
+    return None
+
+
+def _rewrite_interval(query: str, tokens: list, i: int) -> str | None:
+    """
+    tokens[i] の INTERVAL を DATE_ADD / DATE_SUB の呼び出しに書き換える
+
+    Returns:
+        str | None: 書き換えたSQL（対応していない形の場合はNone）
+    """
+    depth, unit = 0, None
+    for j in range(i + 1, len(tokens)):
+        if tokens[j].value == "(":
+            depth += 1
+        elif tokens[j].value == ")":
+            depth -= 1
+            if depth < 0:
+                return None
+        elif (
+            depth == 0 and j > i + 1 and tokens[j].upper in INTERVAL_UNITS.keys() | INTERVAL_MONTHS
+        ):
+            unit = j
+            break
+    if unit is None:
+        return None
+
+    def text(start: int, end: int) -> str:
+        return query[tokens[start].start : tokens[end].start + len(tokens[end].value)]
+
+    amount = f"({text(i + 1, unit - 1)}), '{tokens[unit].upper}'"
+    previous = tokens[i - 1] if i > 0 else None
+
+    # DATE_ADD(日付, INTERVAL n 単位) → DATE_ADD(日付, (n), '単位')
+    if (
+        previous is not None
+        and previous.value == ","
+        and _function(tokens, i) in INTERVAL_FUNCTIONS
+    ):
+        return (
+            query[: tokens[i].start]
+            + amount
+            + query[tokens[unit].start + len(tokens[unit].value) :]
+        )
+
+    # 日付 ± INTERVAL n 単位 → DATE_ADD(日付, (n), '単位') / DATE_SUB(...)
+    if previous is not None and previous.value in ("+", "-") and i >= 2:
+        start = _operand_start(tokens, i - 2)
+        if start is None:
+            return None
+        function = "DATE_ADD" if previous.value == "+" else "DATE_SUB"
+        return (
+            query[: tokens[start].start]
+            + f"{function}({text(start, i - 2)}, {amount})"
+            + query[tokens[unit].start + len(tokens[unit].value) :]
+        )
+
+    # INTERVAL n 単位 + 日付 → DATE_ADD(日付, (n), '単位')
+    if unit + 2 < len(tokens) and tokens[unit + 1].value == "+":
+        end = _operand_end(tokens, unit + 2)
+        if end is None:
+            return None
+        return (
+            query[: tokens[i].start]
+            + f"DATE_ADD({text(unit + 2, end)}, {amount})"
+            + query[tokens[end].start + len(tokens[end].value) :]
+        )
+    return None
+
+
+def _rewrite_intervals(query: str) -> str:
+    """INTERVAL を含む日付演算を、SQLiteに登録した DATE_ADD / DATE_SUB の呼び出しに書き換える"""
+    skipped = 0
+    while True:
+        tokens = significant(tokenize(query))
+        intervals = [i for i, token in enumerate(tokens) if token.is_keyword("INTERVAL")]
+        if len(intervals) <= skipped:
+            return query
+        rewritten = _rewrite_interval(query, tokens, intervals[skipped])
+        if rewritten is None:
+            skipped += 1
+        else:
+            query = rewritten
+
+
+def to_sqlite(query: str) -> str:
+    """
+    MySQL向けのSELECT文をSQLiteで同じ結果になるよう書き換え
+
+    SQLiteには INTERVAL が無いため日付演算を関数呼び出しにし、
+    整数同士の除算が切り捨てになるため除算の左辺を実数にする。
+    """
+    if "INTERVAL" in query.upper():
+        query = _rewrite_intervals(query)
+    return QUOTED_OR_DIVIDE_RE.sub(lambda m: m.group(1) or "* 1.0 /", query)
+
+
+def _to_date(value) -> datetime.date | None:
+    if value is None:
+        return None
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.datetime.fromisoformat(str(value)).date()
+    except ValueError:
+        return None
+
+
+def _to_datetime(value) -> datetime.datetime | None:
+    if value is None:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _date_part(func):
+    def wrapper(value):
+        date = _to_date(value)
+        return None if date is None else func(date)
+
+    return wrapper
+
+
+def _date_format(value, fmt):
+    moment = _to_datetime(value)
+    if moment is None or fmt is None:
+        return None
+
+    def convert(match: re.Match) -> str:
+        code = match.group(1)
+        if code in DATE_FORMAT_NUMBERS:
+            return str(DATE_FORMAT_NUMBERS[code](moment))
+        if code in DATE_FORMAT_CODES:
+            return moment.strftime(DATE_FORMAT_CODES[code])
+        return code
+
+    # 指定子ごとに変換し、それ以外の文字はそのまま残す
+    return re.sub(r"%(.)", convert, str(fmt), flags=re.S)
+
+
+def _date_add(value, amount, unit):
+    moment = _to_datetime(value)
+    if moment is None or amount is None or unit is None:
+        return None
+    unit = str(unit).upper()
+    try:
+        if unit in INTERVAL_MONTHS:
+            months = (
+                moment.year * 12 + moment.month - 1 + round(float(amount)) * INTERVAL_MONTHS[unit]
+            )
+            year, month = divmod(months, 12)
+            # 月末を超える日はその月の末日にする（MySQLと同じ）
+            day = min(moment.day, calendar.monthrange(year, month + 1)[1])
+            moment = moment.replace(year=year, month=month + 1, day=day)
+        elif unit in INTERVAL_UNITS:
+            moment += datetime.timedelta(**{INTERVAL_UNITS[unit]: float(amount)})
+        else:
+            return None
+    except (ValueError, OverflowError):
+        return None
+
+    # DATEに日単位以上を加算した場合はDATEを返す（MySQLと同じ）
+    if len(str(value).strip()) <= 10 and unit not in ("SECOND", "MINUTE", "HOUR"):
+        return moment.date().isoformat()
+    return moment.isoformat(sep=" ")
+
+
+def _date_sub(value, amount, unit):
+    if amount is None:
+        return None
+    return _date_add(value, -float(amount), unit)
+
+
+def _greatest(*values):
+    if any(value is None for value in values):
+        return None
+    return max(values)
+
+
+def _least(*values):
+    if any(value is None for value in values):
+        return None
+    return min(values)
+
+
+def _concat(*values):
+    if any(value is None for value in values):
+        return None
+    return "".join(_to_text(value) for value in values)
+
+
+def _concat_ws(separator, *values):
+    if separator is None:
+        return None
+    return str(separator).join(_to_text(value) for value in values if value is not None)
+
+
+def _to_text(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _datediff(left, right):
+    left, right = _to_date(left), _to_date(right)
+    if left is None or right is None:
+        return None
+    return (left - right).days
+
+
+def _last_day(value):
+    date = _to_date(value)
+    if date is None:
+        return None
+    return date.replace(day=calendar.monthrange(date.year, date.month)[1]).isoformat()
+
+
+def _truncate(value, digits):
+    if value is None or digits is None:
+        return None
+    factor = 10 ** int(digits)
+    return math.trunc(value * factor) / factor
+
+
+def _regexp(pattern, value):
+    if pattern is None or value is None:
+        return None
+    return int(re.search(str(pattern), str(value), re.I) is not None)
+
+
+# SQLiteに登録するMySQL互換関数（名前, 引数の数, 関数）
+MYSQL_FUNCTIONS = [
+    ("YEAR", 1, _date_part(lambda d: d.year)),
+    ("MONTH", 1, _date_part(lambda d: d.month)),
+    ("DAY", 1, _date_part(lambda d: d.day)),
+    ("DAYOFMONTH", 1, _date_part(lambda d: d.day)),
+    ("QUARTER", 1, _date_part(lambda d: (d.month - 1) // 3 + 1)),
+    ("DAYOFWEEK", 1, _date_part(lambda d: d.isoweekday() % 7 + 1)),
+    ("WEEKDAY", 1, _date_part(lambda d: d.weekday())),
+    ("LAST_DAY", 1, _last_day),
+    ("DATE_FORMAT", 2, _date_format),
+    ("DATEDIFF", 2, _datediff),
+    ("DATE_ADD", 3, _date_add),
+    ("DATE_SUB", 3, _date_sub),
+    ("ADDDATE", 3, _date_add),
+    ("SUBDATE", 3, _date_sub),
+    ("ADDDATE", 2, lambda value, days: _date_add(value, days, "DAY")),
+    ("SUBDATE", 2, lambda value, days: _date_sub(value, days, "DAY")),
+    ("CURDATE", 0, lambda: datetime.date.today().isoformat()),
+    ("NOW", 0, lambda: datetime.datetime.now().isoformat(sep=" ", timespec="seconds")),
+    ("CONCAT", -1, _concat),
+    ("CONCAT_WS", -1, _concat_ws),
+    ("IF", 3, lambda cond, a, b: a if cond else b),
+    ("GREATEST", -1, _greatest),
+    ("LEAST", -1, _least),
+    ("TRUNCATE", 2, _truncate),
+    ("REGEXP", 2, _regexp),
+]
+
+
+def register_mysql_functions(connection: sqlite3.Connection) -> None:
+    """SQLiteのコネクションにMySQL互換関数を登録"""
+    for name, num_args, func in MYSQL_FUNCTIONS:
+        connection.create_function(
+            name, num_args, func, deterministic=name not in ("CURDATE", "NOW")
+        )
+
+
+def build_snapshot(path: Path, sql_dir: Path) -> None:
+    """
+    DDLとINSERT文を読み込んだSQLiteのスナップショットを作成
+
+    Args:
+        path: 作成するSQLiteファイル
+        sql_dir: ddl.sql・insert.sql のあるディレクトリ
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.unlink(missing_ok=True)
+
+    connection = sqlite3.connect(tmp_path)
+    try:
+        for statement in convert_ddl((sql_dir / "ddl.sql").read_text(encoding="utf-8")):
+            connection.execute(statement)
+        connection.executescript((sql_dir / "insert.sql").read_text(encoding="utf-8"))
+        connection.execute("ANALYZE")
+        connection.commit()
+    finally:
+        connection.close()
+    tmp_path.replace(path)
+
+
+def _is_stale(path: Path, sql_dir: Path) -> bool:
+    if not path.exists():
+        return True
+    built_at = path.stat().st_mtime
+    return any((sql_dir / name).stat().st_mtime > built_at for name in ("ddl.sql", "insert.sql"))
+
+
+def create_embedded_engine(path: str, sql_dir: str, **pool_options) -> Engine:
+    """
+    組み込みバックエンドのエンジンを生成
+
+    スナップショットが無いか、SQLファイルの方が新しい場合は作り直す。
+    コネクションは読み取り専用（query_only）で開く。
+
+    Args:
+        path: SQLiteのスナップショットファイル
+        sql_dir: ddl.sql・insert.sql のあるディレクトリ
+        **pool_options: create_engine に渡すプール設定
+
+    Returns:
+        Engine: SQLAlchemyエンジン
+    """
+    snapshot, sql_path = Path(path), Path(sql_dir)
+    if _is_stale(snapshot, sql_path):
+        build_snapshot(snapshot, sql_path)
+
+    engine = create_engine(
+        f"sqlite:///{snapshot}",
+        connect_args={"check_same_thread": False},
+        **pool_options,
+    )
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        register_mysql_functions(dbapi_connection)
+        dbapi_connection.execute("PRAGMA query_only = ON")
+
+    return engine
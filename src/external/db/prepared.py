@@ -0,0 +1,185 @@
+"""
+サーバーサイドのプリペアドステートメント
+パラメータ化したSQLをコネクションごとに1回だけPREPAREし、以降はEXECUTEで再利用する
+"""
+
+import itertools
+import threading
+from collections import OrderedDict
+
+from sqlalchemy.engine import Connection, CursorResult
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+# 存在しないプリペアドステートメントを実行した場合のMySQLのエラーコード
+UNKNOWN_STATEMENT_ERROR = 1243
+
+# Connection.info にステートメントキャッシュを保持するキー
+_INFO_KEY = "prepared_statements"
+
+_names = itertools.count()
+
+
+class PreparedStatementStats:
+    """プリペアドステートメントの再利用状況（全コネクション合計）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def record(self, hit: bool, evicted: int = 0) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.evictions += evicted
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+stats = PreparedStatementStats()
+
+
+class StatementCache:
+    """
+    1コネクション分のプリペアドステートメント（LRU）
+
+    MySQLのプリペアドステートメントはコネクション単位のため、
+    プールされたコネクションごとに1つ保持する。
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._statements: OrderedDict[str, str] = OrderedDict()  # template -> 名前
+
+    def get(self, template: str) -> str | None:
+        name = self._statements.get(template)
+        if name is not None:
+            self._statements.move_to_end(template)
+        return name
+
+    def add(self, template: str, name: str) -> list[str]:
+        """
+        ステートメントを登録
+
+        Returns:
+            list[str]: 上限を超えて追い出された（DEALLOCATEすべき）ステートメント名
+        """
+        self._statements[template] = name
+        evicted = []
+        while len(self._statements) > self.max_size:
+            _, old = self._statements.popitem(last=False)
+            evicted.append(old)
+        return evicted
+
+    def discard(self, template: str) -> None:
+        self._statements.pop(template, None)
+
+
+def _cache_for(info: dict, max_size: int) -> StatementCache:
+    cache = info.get(_INFO_KEY)
+    if cache is None:
+        cache = info[_INFO_KEY] = StatementCache(max_size)
+    return cache
+
+
+def _plan(cache: StatementCache, template: str, params: tuple) -> tuple[list, tuple]:
+    """
+    実行する文の組み立て
+
+    Returns:
+        tuple: (事前に実行する (SQL, 引数) のリスト, EXECUTE の (SQL, 引数))
+    """
+    before = []
+    name = cache.get(template)
+    hit = name is not None
+    evicted = []
+    if not hit:
+        name = f"agent_stmt_{next(_names)}"
+        evicted = cache.add(template, name)
+        before.extend((f"DEALLOCATE PREPARE {old}", None) for old in evicted)
+        before.append((f"PREPARE {name} FROM %s", (template,)))
+    stats.record(hit, len(evicted))
+
+    if not params:
+        return before, (f"EXECUTE {name}", None)
+
+    variables = [f"@agent_p{i}" for i in range(len(params))]
+    before.append((f"SET {', '.join(f'{v} = %s' for v in variables)}", tuple(params)))
+    return before, (f"EXECUTE {name} USING {', '.join(variables)}", None)
+
+
+def _is_unknown_statement(error: DBAPIError) -> bool:
+    args = getattr(error.orig, "args", ())
+    return bool(args) and args[0] == UNKNOWN_STATEMENT_ERROR
+
+
+def execute_prepared(conn: Connection, template: str, params: tuple, max_size: int) -> CursorResult:
+    """
+    プリペアドステートメントとしてSQLを実行
+
+    Args:
+        conn: コネクション
+        template: "?" プレースホルダ付きのSQL
+        params: プレースホルダの値
+        max_size: コネクションごとに保持するステートメント数の上限
+
+    Returns:
+        CursorResult: 実行結果
+    """
+    cache = _cache_for(conn.info, max_size)
+    for attempt in range(2):
+        before, (sql, args) = _plan(cache, template, params)
+        try:
+            for statement, statement_args in before:
+                conn.exec_driver_sql(statement, statement_args)
+            statement = sql
+            return conn.exec_driver_sql(sql, args)
+        except DBAPIError as e:
+            # PREPAREに失敗した、またはサーバー側でステートメントが失われた場合は
+            # キャッシュから外す（後者は作り直して1回だけ再試行）
+            if statement.startswith("PREPARE") or _is_unknown_statement(e):
+                cache.discard(template)
+            if attempt or not _is_unknown_statement(e):
+                raise
+
+
+async def execute_prepared_async(
+    conn: AsyncConnection, template: str, params: tuple, max_size: int
+) -> CursorResult:
+    """
+    プリペアドステートメントとしてSQLを実行（非同期版）
+
+    Args:
+        conn: 非同期コネクション
+        template: "?" プレースホルダ付きのSQL
+        params: プレースホルダの値
+        max_size: コネクションごとに保持するステートメント数の上限
+
+    Returns:
+        CursorResult: 実行結果
+    """
+    cache = _cache_for(conn.info, max_size)
+    for attempt in range(2):
+        before, (sql, args) = _plan(cache, template, params)
+        try:
+            for statement, statement_args in before:
+                await conn.exec_driver_sql(statement, statement_args)
+            statement = sql
+            return await conn.exec_driver_sql(sql, args)
+        except DBAPIError as e:
+            if statement.startswith("PREPARE") or _is_unknown_statement(e):
+                cache.discard(template)
+            if attempt or not _is_unknown_statement(e):
+                raise
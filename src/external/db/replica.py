@@ -0,0 +1,294 @@
+"""
+リードレプリカへの振り分け
+重み付き／最小接続数でレプリカを選び、ヘルスチェックとフェイルオーバーを行う
+"""
+
+import random
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# 接続断を表すMySQLクライアントのエラーコード
+CONNECTION_ERROR_CODES = {2002, 2003, 2005, 2006, 2013, 2055}
+
+# 遅延のEWMAの平滑化係数
+EWMA_ALPHA = 0.2
+
+
+def parse_replica(spec: str) -> tuple[str, int, int]:
+    """
+    レプリカ指定をパース
+
+    Args:
+        spec: "host"、"host:port"、"host:port:weight" のいずれか
+
+    Returns:
+        tuple[str, int, int]: (ホスト, ポート, 重み)
+    """
+    parts = spec.strip().split(":")
+    host = parts[0]
+    port = int(parts[1]) if len(parts) > 1 and parts[1] else 3306
+    weight = int(parts[2]) if len(parts) > 2 and parts[2] else 1
+    return host, port, max(weight, 1)
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """例外が接続断（別のレプリカで再試行できるもの）かを判定"""
+    if isinstance(error, DBAPIError) and error.connection_invalidated:
+        return True
+    if not isinstance(error, (OperationalError, InterfaceError)):
+        return False
+    args = getattr(error.orig, "args", ())
+    return bool(args) and args[0] in CONNECTION_ERROR_CODES
+
+
+class Replica:
+    """
+    1台のリードレプリカ
+
+    Attributes:
+        host: ホスト
+        port: ポート
+        weight: 重み（weighted戦略で使用）
+        healthy: 利用可能か
+        down_since: 利用不可になった時刻（time.monotonic）
+        in_flight: 実行中のクエリ数
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        weight: int,
+        engine_factory: Callable[[str, int], Engine],
+        async_engine_factory: Callable[[str, int], AsyncEngine],
+    ):
+        self.host = host
+        self.port = port
+        self.weight = weight
+        self.healthy = True
+        self.down_since: float | None = None
+        self.in_flight = 0
+        self.queries = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.ewma_latency: float | None = None
+        self._engine_factory = engine_factory
+        self._async_engine_factory = async_engine_factory
+        self._engine: Engine | None = None
+        self._async_engine: AsyncEngine | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    @property
+    def engine(self) -> Engine:
+        """レプリカ用のエンジン（初回利用時に生成）"""
+        with self._lock:
+            if self._engine is None:
+                self._engine = self._engine_factory(self.host, self.port)
+            return self._engine
+
+    @property
+    def async_engine(self) -> AsyncEngine:
+        """レプリカ用の非同期エンジン（初回利用時に生成）"""
+        with self._lock:
+            if self._async_engine is None:
+                self._async_engine = self._async_engine_factory(self.host, self.port)
+            return self._async_engine
+
+    def record(self, latency: float, failed: bool) -> None:
+        """クエリ1回分の遅延を記録"""
+        with self._lock:
+            self.queries += 1
+            if failed:
+                self.errors += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            if self.ewma_latency is None:
+                self.ewma_latency = latency
+            else:
+                self.ewma_latency += EWMA_ALPHA * (latency - self.ewma_latency)
+
+    def stats(self) -> dict:
+        """レプリカの統計"""
+        with self._lock:
+            return {
+                "name": self.name,
+                "healthy": self.healthy,
+                "weight": self.weight,
+                "in_flight": self.in_flight,
+                "queries": self.queries,
+                "errors": self.errors,
+                "avg_latency_ms": (
+                    self.total_latency / self.queries * 1000 if self.queries else 0.0
+                ),
+                "ewma_latency_ms": (self.ewma_latency or 0.0) * 1000,
+                "max_latency_ms": self.max_latency * 1000,
+            }
+
+    def set_healthy(self, healthy: bool) -> None:
+        """利用可否を更新（利用不可になった時刻を記録）"""
+        if not healthy and (self.healthy or self.down_since is None):
+            self.down_since = time.monotonic()
+        elif healthy:
+            self.down_since = None
+        self.healthy = healthy
+
+    def dispose(self) -> None:
+        """
+        エンジンを破棄
+
+        非同期エンジンの接続はイベントループの外では閉じられないため、プールから切り離すだけにする。
+        イベントループ内では先に dispose_async_engine を呼ぶこと。
+        """
+        with self._lock:
+            if self._engine is not None:
+                self._engine.dispose()
+                self._engine = None
+            if self._async_engine is not None:
+                self._async_engine.sync_engine.dispose(close=False)
+                self._async_engine = None
+
+    async def dispose_async_engine(self) -> None:
+        """非同期エンジンを破棄（接続も閉じる）"""
+        with self._lock:
+            engine, self._async_engine = self._async_engine, None
+        if engine is not None:
+            await engine.dispose()
+
+
+class ReplicaRouter:
+    """
+    リードレプリカの振り分けとヘルスチェック
+
+    Attributes:
+        replicas: 管理しているレプリカ
+        strategy: "weighted"（重み付きランダム）または "least_connections"
+        health_interval: ヘルスチェックの間隔（秒、0以下で無効）
+        retry_after: ヘルスチェックが無効な場合に、利用不可のレプリカへ再び振り分けるまでの秒数
+    """
+
+    def __init__(
+        self,
+        replicas: list[Replica],
+        strategy: str,
+        health_interval: float,
+        retry_after: float = 30.0,
+    ):
+        if strategy not in ("weighted", "least_connections"):
+            raise ValueError(f"未対応のレプリカ振り分け方式です: {strategy}")
+        self.replicas = replicas
+        self.strategy = strategy
+        self.health_interval = health_interval
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._health_thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    def choose(self, exclude: list[Replica] | tuple = ()) -> Replica | None:
+        """
+        クエリを送るレプリカを選択
+
+        Args:
+            exclude: 今回のクエリで既に失敗したレプリカ
+
+        Returns:
+            Replica | None: 選ばれたレプリカ（利用可能なものが無ければNone）
+        """
+        self._ensure_health_checks()
+        self._retry_down_replicas()
+        candidates = [r for r in self.replicas if r.healthy and r not in exclude]
+        if not candidates:
+            return None
+        if self.strategy == "least_connections":
+            return min(candidates, key=lambda r: (r.in_flight / r.weight, r.ewma_latency or 0.0))
+        return random.choices(candidates, weights=[r.weight for r in candidates])[0]
+
+    @contextmanager
+    def track(self, replica: Replica | None) -> Iterator[None]:
+        """実行中のクエリ数と遅延を記録する（replicaがNoneなら何もしない）"""
+        if replica is None:
+            yield
+            return
+
+        with self._lock:
+            replica.in_flight += 1
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            with self._lock:
+                replica.in_flight -= 1
+            replica.record(time.perf_counter() - started, failed)
+
+    def mark_down(self, replica: Replica) -> None:
+        """レプリカを利用不可にする（ヘルスチェックか retry_after 秒後の再試行で復帰）"""
+        replica.set_healthy(False)
+
+    def check_health(self) -> None:
+        """全レプリカに SELECT 1 を発行して利用可否を更新"""
+        for replica in self.replicas:
+            try:
+                with replica.engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                replica.set_healthy(True)
+            except Exception:
+                replica.set_healthy(False)
+
+    def stats(self) -> list[dict]:
+        """レプリカごとの統計"""
+        return [replica.stats() for replica in self.replicas]
+
+    def close(self) -> None:
+        """ヘルスチェックを止めてエンジンを破棄"""
+        self._stopped.set()
+        for replica in self.replicas:
+            replica.dispose()
+
+    async def dispose_async_engines(self) -> None:
+        """レプリカの非同期エンジンを破棄"""
+        for replica in self.replicas:
+            await replica.dispose_async_engine()
+
+    def _ensure_health_checks(self) -> None:
+        if self._health_thread is not None or self.health_interval <= 0:
+            return
+        with self._lock:
+            if self._health_thread is None:
+                self._health_thread = threading.Thread(
+                    target=self._run_health_checks, name="replica-health", daemon=True
+                )
+                self._health_thread.start()
+
+    def _retry_down_replicas(self) -> None:
+        """
+        ヘルスチェックが無効な場合、利用不可になってから retry_after 秒経ったレプリカを復帰させる
+
+        復帰したレプリカへの次のクエリが確認を兼ね、接続できなければ再び mark_down される。
+        """
+        if self.health_interval > 0 or self.retry_after < 0:
+            return
+        now = time.monotonic()
+        for replica in self.replicas:
+            down_since = replica.down_since
+            if not replica.healthy and down_since is not None:
+                if now - down_since >= self.retry_after:
+                    replica.set_healthy(True)
+
+    def _run_health_checks(self) -> None:
+        while not self._stopped.wait(self.health_interval):
+            self.check_health()
@@ -0,0 +1,164 @@
+"""
+SQL実行結果のキャッシュ
+チェック済みSQLをキーに、TTL・容量上限付きLRUで実行結果を保持する
+"""
+
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from src.external.db.columnar import ColumnarResult
+
+# 引用符で囲まれた部分、または連続する空白
+_QUOTED_OR_SPACE_RE = re.compile(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`)|\s+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    キャッシュキー用にSQLを正規化
+
+    文字列リテラルと引用符付き識別子の外側にある空白を1つにまとめる。
+    """
+    return _QUOTED_OR_SPACE_RE.sub(lambda m: m.group(1) or " ", query).strip()
+
+
+def estimate_size(data) -> int:
+    """
+    実行結果のおおよそのメモリ使用量（バイト）
+
+    行の辞書のリストは先頭行のサイズから推定する。
+    """
+    if isinstance(data, ColumnarResult):
+        return data.nbytes()
+    if not data:
+        return sys.getsizeof(data)
+    first = data[0]
+    row_size = sys.getsizeof(first) + sum(map(sys.getsizeof, first.values()))
+    return sys.getsizeof(data) + row_size * len(data)
+
+
+class ResultCache:
+    """
+    TTLと容量上限（バイト）付きのLRUキャッシュ
+
+    Attributes:
+        max_bytes: 保持する結果の合計サイズの上限
+        ttl: エントリの有効期間（秒）
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """キーに対応する値を取得（無い・期限切れの場合はNone）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, size: int) -> None:
+        """値を格納し、容量を超えた分を古い順に追い出す"""
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """全エントリを破棄（無効化として計上）"""
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """
+        キャッシュの統計を取得
+
+        Returns:
+            dict: hits, misses, hit_rate, evictions, expirations, invalidations,
+                entries, bytes, max_bytes
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class WatermarkTracker:
+    """
+    データのウォーターマーク（例: 実績テーブルの MAX(date)）の変化を検知する
+
+    確認は interval 秒に1回までに間引く。
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.marks: dict | None = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def due(self) -> bool:
+        """
+        確認のタイミングかどうか
+
+        Trueを返した呼び出し元が確認を担当し、他のスレッドには
+        次の間隔までFalseを返す。
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked_at < self.interval:
+                return False
+            self._checked_at = now
+            return True
+
+    def update(self, marks: dict) -> bool:
+        """
+        最新のウォーターマークを記録
+
+        Returns:
+            bool: 前回の値から変化した場合True（初回はFalse）
+        """
+        with self._lock:
+            changed = self.marks is not None and marks != self.marks
+            self.marks = marks
+            return changed
@@ -2,39 +2,1124 @@
 データベース接続・SQL実行モジュール
 """
 
-from sqlalchemy import create_engine, text
-from sqlalchemy.exc import SQLAlchemyError
+import asyncio
+import contextlib
+import json
+import threading
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+from concurrent.futures import Future
 
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DisconnectionError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+
+from src.external.db import prepared
+from src.external.db.admission import AdmissionController, AdmissionRejected
+from src.external.db.columnar import ColumnarResult
+from src.external.db.converters import converter_connect_args
+from src.external.db.embedded import create_embedded_engine, to_sqlite
+from src.external.db.prepared import execute_prepared, execute_prepared_async
+from src.external.db.replica import (
+    Replica,
+    ReplicaRouter,
+    is_connection_error,
+    parse_replica,
+)
+from src.external.db.result_cache import (
+    ResultCache,
+    WatermarkTracker,
+    estimate_size,
+    normalize_query,
+)
+from src.external.db.timeout import (
+    DeadlineExceeded,
+    QueryDeadline,
+    Watchdog,
+    is_timeout_error,
+    kill_query,
+)
+from src.services.parameterizer import parameterize
+from src.services.sql_tokenizer import COMMENT, WS, tokenize
 from src.settings import settings
 
+# sql_select_limit の最大値（制限なし）
+UNLIMITED_SELECT_LIMIT = 18446744073709551615
+
+# プロセス内で共有するエンジン（初回利用時に生成）
+_engine: Engine | None = None
+_async_engine: AsyncEngine | None = None
+_router: ReplicaRouter | None = None
+_router_initialized = False
+_engine_lock = threading.Lock()
+
+
+class PoolStats:
+    """コネクションプールのチェックアウト待ち時間の統計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record_wait(self, seconds: float) -> None:
+        """チェックアウト1回分の待ち時間を記録"""
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += seconds
+            if seconds > self.max_wait:
+                self.max_wait = seconds
+
+    def reset(self) -> None:
+        """統計をリセット"""
+        with self._lock:
+            self.checkouts = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+
+
+_pool_stats = PoolStats()
+
+
+class SingleFlight:
+    """
+    実行中の同一クエリを1回の実行にまとめる
+
+    同じキーの呼び出しが実行中であれば、後から来た呼び出しは新たに実行せず、
+    先行する実行の結果（同じオブジェクト）を待って受け取る。
+    スレッドとasyncioの両方から同じ実行中の表を参照する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[tuple, Future] = {}
+        self.executions = 0
+        self.shared = 0
+
+    def _join(self, key: tuple) -> tuple[Future, bool]:
+        """実行中の呼び出しに相乗りする（先行する呼び出しが無ければ自分が実行役になる）"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = self._calls[key] = Future()
+            self.executions += 1
+            return future, True
+
+    def _finish(self, key: tuple, future: Future, result=None, error=None) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def run(self, key: tuple, func: Callable[[], dict]) -> dict:
+        """func を実行（同じキーが実行中ならその結果を待つ）"""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = func()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def run_async(self, key: tuple, func: Callable[[], Awaitable[dict]]) -> dict:
+        """func を実行（同じキーが実行中ならその結果を待つ、非同期版）"""
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.shield(asyncio.wrap_future(future))
+        try:
+            result = await func()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def stats(self) -> dict:
+        """
+        統計を取得
+
+        Returns:
+            dict: executions（実行回数）, shared（相乗りした回数）, in_flight（実行中のキー数）
+        """
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "shared": self.shared,
+                "in_flight": len(self._calls),
+            }
+
+
+# 実行中の同一クエリの重複排除
+_single_flight = SingleFlight()
+
+# チェック済みSQLの実行結果キャッシュ
+_result_cache = ResultCache(settings.result_cache_max_bytes, settings.result_cache_ttl)
+_watermark = WatermarkTracker(settings.result_cache_watermark_interval)
+
+# 実行時間を超えたクエリを中断する監視スレッド
+_watchdog = Watchdog()
+
+# 同時に実行するクエリ数の制限（同期・非同期で共有）
+_admission = AdmissionController(
+    settings.db_max_concurrent_queries,
+    settings.db_admission_queue_size,
+    settings.db_admission_timeout,
+)
+
+
+def _build_connection_string(
+    driver: str = "pymysql", host: str | None = None, port: int | None = None
+) -> str:
+    return (
+        f"mysql+{driver}://{settings.db_user}:{settings.db_password}"
+        f"@{host or settings.db_host}:{port or settings.db_port}/{settings.db_name}"
+    )
+
+
+def _install_pre_ping(engine: Engine, interval: float) -> None:
+    """
+    一定時間以上アイドルだったコネクションのみチェックアウト時にpingする
+
+    pool_pre_pingは毎回のチェックアウトでpingするため、
+    連続したクエリではping分の往復が無駄になる。
+    """
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        connection_record.info["last_used"] = time.monotonic()
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        last_used = connection_record.info.get("last_used")
+        if last_used is None or time.monotonic() - last_used < interval:
+            return
+        try:
+            cursor = dbapi_connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+        except Exception as e:
+            # プールが切断済みと判断してコネクションを作り直す
+            raise DisconnectionError() from e
+
+
+def _is_embedded() -> bool:
+    """組み込みバックエンド（SQLite）で実行するか"""
+    return settings.db_backend == "embedded"
+
+
+def _add_hint(query: str, hint: str) -> str:
+    """
+    先頭のSELECTにオプティマイザヒントを追加する
+
+    既にヒントのコメントがあればその中に追加する（2つ目以降のヒントは無視されるため）。
+    SELECTで始まらない文（WITH など）はそのまま返す。
+    """
+    tokens = [token for token in tokenize(query) if token.kind != WS]
+    if not tokens or not tokens[0].is_keyword("SELECT"):
+        return query
+    if len(tokens) > 1 and tokens[1].kind == COMMENT and tokens[1].value.startswith("/*+"):
+        end = tokens[1].start + 3
+        return f"{query[:end]} {hint}{query[end:]}"
+    end = tokens[0].start + len(tokens[0].value)
+    return f"{query[:end]} /*+ {hint} */{query[end:]}"
+
+
+def _prepare_query(query: str, agent: bool = True) -> str:
+    """
+    バックエンドに合わせてSQLを整える
+
+    Args:
+        query: SQL
+        agent: エージェントのSQLか（Falseの場合は内部の読み込み用として、サーバーの既定値に
+            かかわらず行数を制限しない）
+    """
+    if _is_embedded():
+        return to_sqlite(query)
+    if not agent:
+        return _add_hint(query, f"SET_VAR(sql_select_limit={UNLIMITED_SELECT_LIMIT})")
+    # エージェントのSQLは check_query が必ずLIMITを付けるため sql_select_limit は効かない
+    return query
+
+
+def _session_statement() -> str | None:
+    """
+    プールの接続ごとに1回だけ実行するセッション変数の設定
+
+    実行時間の上限はクエリごとのヒントではなく max_execution_time で設定する。
+    SELECTの行数はエージェントのSQLのLIMIT（check_query）で制限する。
+    """
+    assignments = []
+    if settings.db_read_only:
+        assignments.append("transaction_read_only = ON")
+    if settings.query_timeout > 0:
+        assignments.append(f"max_execution_time = {int(settings.query_timeout * 1000)}")
+    return f"SET SESSION {', '.join(assignments)}" if assignments else None
+
 
-def get_db_engine():
+def _install_session_profile(engine: Engine) -> None:
+    """
+    エージェント用の接続を読み取り専用・低い分離レベルのセッションとして構成する
+
+    分離レベルは create_engine の isolation_level で、その他のセッション変数は
+    connect イベントで、いずれも接続の確立時に1回だけ設定する。
+    """
+    statement = _session_statement()
+    if statement is None:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(statement)
+        finally:
+            cursor.close()
+
+
+def _pool_options() -> dict:
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping_interval <= 0,
+    }
+
+
+def _connect_args(driver: str) -> dict:
+    """DECIMAL/DATEの型変換設定をドライバの接続引数に変換"""
+    return converter_connect_args(driver, settings.db_decimal_mode, settings.db_date_mode)
+
+
+def _engine_options() -> dict:
+    """MySQLエンジン共通の設定（プール設定と分離レベル）"""
+    options = _pool_options()
+    if settings.db_isolation_level:
+        options["isolation_level"] = settings.db_isolation_level
+    return options
+
+
+def _create_engine(url: str) -> Engine:
+    """共通のプール設定でエンジンを生成"""
+    engine = create_engine(url, connect_args=_connect_args("pymysql"), **_engine_options())
+    _install_session_profile(engine)
+    if settings.db_pool_pre_ping_interval > 0:
+        _install_pre_ping(engine, settings.db_pool_pre_ping_interval)
+    return engine
+
+
+def _create_async_engine(url: str) -> AsyncEngine:
+    """共通のプール設定で非同期エンジンを生成"""
+    engine = create_async_engine(
+        url, connect_args=_connect_args(settings.db_async_driver), **_engine_options()
+    )
+    _install_session_profile(engine.sync_engine)
+    if settings.db_pool_pre_ping_interval > 0:
+        _install_pre_ping(engine.sync_engine, settings.db_pool_pre_ping_interval)
+    return engine
+
+
+def get_db_engine() -> Engine:
     """
     データベースエンジンを取得
 
+    エンジン（とコネクションプール）はプロセス内で1つだけ遅延生成され、
+    以降の呼び出しでは同じインスタンスを返す。
+
     Returns:
         Engine: SQLAlchemyエンジン
     """
-    connection_string = (
-        f"mysql+pymysql://{settings.db_user}:{settings.db_password}"
-        f"@{settings.db_host}:{settings.db_port}/{settings.db_name}"
+    global _engine
+    if _engine is not None:
+        return _engine
+
+    with _engine_lock:
+        if _engine is None:
+            if _is_embedded():
+                _engine = create_embedded_engine(
+                    settings.embedded_db_path, settings.embedded_sql_dir, **_pool_options()
+                )
+            else:
+                _engine = _create_engine(_build_connection_string())
+    return _engine
+
+
+def get_async_db_engine() -> AsyncEngine:
+    """
+    非同期データベースエンジンを取得
+
+    同期版と同じプール設定で、プロセス内に1つだけ遅延生成される。
+    ドライバは settings.db_async_driver（asyncmy / aiomysql）で選択する。
+
+    Returns:
+        AsyncEngine: SQLAlchemy非同期エンジン
+    """
+    global _async_engine
+    if _async_engine is not None:
+        return _async_engine
+
+    with _engine_lock:
+        if _async_engine is None:
+            _async_engine = _create_async_engine(_build_connection_string(settings.db_async_driver))
+    return _async_engine
+
+
+def _create_router() -> ReplicaRouter | None:
+    """settings.db_replicas からレプリカの振り分けを構成"""
+    if not settings.db_replicas or _is_embedded():
+        return None
+    replicas = [
+        Replica(
+            host,
+            port,
+            weight,
+            engine_factory=lambda h, p: _create_engine(_build_connection_string(host=h, port=p)),
+            async_engine_factory=lambda h, p: _create_async_engine(
+                _build_connection_string(settings.db_async_driver, h, p)
+            ),
+        )
+        for host, port, weight in map(parse_replica, settings.db_replicas)
+    ]
+    return ReplicaRouter(
+        replicas,
+        settings.db_replica_strategy,
+        settings.db_replica_health_interval,
+        settings.db_replica_retry_after,
     )
-    return create_engine(connection_string, pool_pre_ping=True)
 
 
-def execute_sql(query: str, max_rows: int = settings.default_limit) -> dict:
-    max_rows = min(max_rows, settings.max_limit)
+def get_replica_router() -> ReplicaRouter | None:
+    """
+    リードレプリカの振り分けを取得
+
+    Returns:
+        ReplicaRouter | None: レプリカが設定されていなければNone
+    """
+    global _router, _router_initialized
+    if _router_initialized:
+        return _router
+
+    with _engine_lock:
+        if not _router_initialized:
+            _router = _create_router()
+            _router_initialized = True
+    return _router
+
+
+def get_replica_stats() -> list[dict]:
+    """
+    レプリカごとの統計を取得
+
+    Returns:
+        list[dict]: name, healthy, weight, in_flight, queries, errors,
+            avg_latency_ms, ewma_latency_ms, max_latency_ms
+    """
+    router = get_replica_router()
+    return router.stats() if router else []
+
+
+def _read_engine() -> Engine:
+    """読み取り用のエンジン（利用可能なレプリカがあればレプリカ）"""
+    router = get_replica_router()
+    replica = router.choose() if router else None
+    return replica.engine if replica else get_db_engine()
+
+
+def _read_async_engine() -> AsyncEngine:
+    """読み取り用の非同期エンジン（利用可能なレプリカがあればレプリカ）"""
+    router = get_replica_router()
+    replica = router.choose() if router else None
+    return replica.async_engine if replica else get_async_db_engine()
+
+
+def _track(replica: Replica | None):
+    """レプリカで実行する場合、実行中のクエリ数と遅延を記録する"""
+    router = get_replica_router()
+    if router is None:
+        return contextlib.nullcontext()
+    return router.track(replica)
+
+
+def dispose_engine() -> None:
+    """
+    共有エンジンを破棄
+
+    fork後の子プロセスや設定変更後に呼び出すと、次回利用時に再生成される。
+    """
+    global _engine, _router, _router_initialized
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+        if _router is not None:
+            _router.close()
+        _router = None
+        _router_initialized = False
+        _pool_stats.reset()
 
+
+async def dispose_async_engine() -> None:
+    """共有の非同期エンジン（レプリカを含む）を破棄"""
+    global _async_engine
+    engine = _async_engine
+    _async_engine = None
+    if engine is not None:
+        await engine.dispose()
+    if _router is not None:
+        await _router.dispose_async_engines()
+
+
+def get_pool_stats() -> dict:
+    """
+    コネクションプールの統計を取得
+
+    Returns:
+        dict: プール統計
+            - pool_size: プールサイズ
+            - checked_out: 使用中のコネクション数
+            - checked_in: 待機中のコネクション数
+            - overflow: プールサイズを超えて生成されたコネクション数
+            - checkouts: チェックアウト回数
+            - avg_wait_ms: チェックアウト待ち時間の平均（ミリ秒）
+            - max_wait_ms: チェックアウト待ち時間の最大（ミリ秒）
+    """
+    engine = _engine
+    stats = {
+        "pool_size": settings.db_pool_size,
+        "checked_out": 0,
+        "checked_in": 0,
+        "overflow": 0,
+    }
+    if engine is not None:
+        pool = engine.pool
+        stats.update(
+            pool_size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+        )
+
+    checkouts = _pool_stats.checkouts
+    stats.update(
+        checkouts=checkouts,
+        avg_wait_ms=(_pool_stats.total_wait / checkouts * 1000) if checkouts else 0.0,
+        max_wait_ms=_pool_stats.max_wait * 1000,
+    )
+    return stats
+
+
+def warm_up_pool(connections: int) -> int:
+    """
+    コネクションプールを事前に温める
+
+    読み取りに使うエンジン（レプリカ設定時は各レプリカ）で connections 本の接続を同時に開いて
+    SELECT 1 を実行し、プールに返す。結果キャッシュが有効ならウォーターマークも取得しておく。
+
+    Args:
+        connections: エンジンごとに開く接続数（プールサイズが上限）
+
+    Returns:
+        int: 確立できた接続数
+    """
+    router = get_replica_router()
+    engines = [replica.engine for replica in router.replicas] if router else [get_db_engine()]
+    connections = min(connections, settings.db_pool_size)
+
+    opened = 0
+    for engine in engines:
+        with contextlib.ExitStack() as stack:
+            try:
+                for _ in range(connections):
+                    conn = stack.enter_context(engine.connect())
+                    conn.execute(text("SELECT 1"))
+                    opened += 1
+            except SQLAlchemyError:
+                continue
+
+    if settings.result_cache_enabled:
+        _refresh_watermark()
+    return opened
+
+
+def _connect(engine: Engine) -> Connection:
+    """プールからコネクションを取得し、待ち時間を記録する"""
+    started = time.perf_counter()
+    conn = engine.connect()
+    _pool_stats.record_wait(time.perf_counter() - started)
+    return conn
+
+
+def _collect(result, max_rows: int, columnar: bool) -> dict:
+    """実行結果から最大max_rows行を取り出して結果の辞書にする"""
+    if columnar:
+        data = ColumnarResult.from_rows(list(result.keys()), result.fetchmany(max_rows))
+    else:
+        data = [dict(row) for row in result.mappings().fetchmany(max_rows)]
+
+    return {
+        "success": True,
+        "data": data,
+        "row_count": len(data),
+    }
+
+
+def _watermark_queries() -> dict[str, str]:
+    return {
+        table: f"SELECT MAX(date) FROM {table}" for table in settings.result_cache_watermark_tables
+    }
+
+
+def _refresh_watermark() -> None:
+    """ウォーターマークを確認し、データが更新されていれば結果キャッシュを破棄"""
+    if not _watermark.due():
+        return
     try:
-        engine = get_db_engine()
-        with engine.connect() as conn:
-            results = conn.execute(text(query)).mappings().fetchmany(max_rows)
-            data = [dict(result) for result in results]
+        with _connect(_read_engine()) as conn:
+            marks = {
+                table: conn.execute(text(sql)).scalar()
+                for table, sql in _watermark_queries().items()
+            }
+    except SQLAlchemyError:
+        return
+    if _watermark.update(marks):
+        _result_cache.clear()
 
-            return {
-                "success": True,
-                "data": data,
-                "row_count": len(data),
+
+async def _refresh_watermark_async() -> None:
+    """ウォーターマークを確認し、データが更新されていれば結果キャッシュを破棄（非同期版）"""
+    if _is_embedded():
+        await asyncio.to_thread(_refresh_watermark)
+        return
+    if not _watermark.due():
+        return
+    try:
+        async with _read_async_engine().connect() as conn:
+            marks = {
+                table: (await conn.execute(text(sql))).scalar()
+                for table, sql in _watermark_queries().items()
             }
+    except SQLAlchemyError:
+        return
+    if _watermark.update(marks):
+        _result_cache.clear()
+
+
+def get_result_cache_stats() -> dict:
+    """
+    結果キャッシュの統計を取得
+
+    Returns:
+        dict: ResultCache.stats() に現在のウォーターマーク（watermarks）を加えたもの
+    """
+    return {**_result_cache.stats(), "watermarks": _watermark.marks}
+
+
+def clear_result_cache() -> None:
+    """結果キャッシュを破棄"""
+    _result_cache.clear()
+
+
+def _result_key(query: str, max_rows: int, columnar: bool, params: dict | None) -> tuple:
+    """結果キャッシュと実行中の重複排除で使うキー"""
+    params_key = tuple(sorted(params.items())) if params else None
+    return (normalize_query(query), max_rows, columnar, params_key)
+
+
+def _cache_result(key: tuple, result: dict) -> dict:
+    """成功した実行結果を結果キャッシュに格納"""
+    if settings.result_cache_enabled and result["success"]:
+        _result_cache.put(key, result, estimate_size(result["data"]))
+    return result
+
+
+def get_single_flight_stats() -> dict:
+    """
+    実行中の同一クエリの重複排除の統計を取得
+
+    Returns:
+        dict: executions, shared, in_flight
+    """
+    return _single_flight.stats()
+
+
+def get_admission_stats() -> dict:
+    """
+    アドミッション制御の統計を取得
+
+    Returns:
+        dict: max_concurrent, in_flight, queued, max_queue_depth, admitted,
+            rejected_queue_full, rejected_timeout, avg_wait_ms, max_wait_ms
+    """
+    return _admission.stats()
+
+
+def _busy_result(error: AdmissionRejected) -> dict:
+    """アドミッション制御で断られた場合の実行結果"""
+    return {"success": False, "error": str(error), "error_type": "busy"}
+
+
+def _timeout_result(error: BaseException) -> dict:
+    message = f"クエリが実行時間の上限（{settings.query_timeout:g}秒）を超えたため中断しました"
+    if str(error):
+        message = f"{message}: {error}"
+    return {"success": False, "error": message, "error_type": "timeout"}
+
+
+def _deadline(engine: Engine, conn: Connection) -> QueryDeadline | None:
+    """
+    実行中のクエリを期限後に中断する監視を作成
+
+    MySQLでは別コネクションから KILL QUERY を発行し、
+    組み込みバックエンドではSQLiteのinterrupt()で中断する。
+    """
+    if settings.query_timeout <= 0:
+        return None
+
+    dbapi_connection = conn.connection.dbapi_connection
+    if hasattr(dbapi_connection, "thread_id"):
+        connection_id = dbapi_connection.thread_id()
+        return QueryDeadline(
+            _watchdog,
+            settings.query_timeout + settings.query_timeout_grace,
+            lambda: kill_query(engine, connection_id),
+        )
+    if hasattr(dbapi_connection, "interrupt"):
+        return QueryDeadline(_watchdog, settings.query_timeout, dbapi_connection.interrupt)
+    return None
+
+
+def _use_prepared() -> bool:
+    return settings.db_prepared_statements and not _is_embedded()
+
+
+def _run(conn: Connection, query: str, params: dict | None = None):
+    """
+    SQLを実行（有効な場合はリテラルをパラメータ化してプリペアドステートメントで実行）
+
+    params を指定した場合は、SQL中の名前付きパラメータ（:name）にバインドして実行する。
+    """
+    if params:
+        return conn.execute(text(query), params)
+    if _use_prepared():
+        statement = parameterize(query)
+        return execute_prepared(
+            conn, statement.template, statement.params, settings.db_prepared_statement_cache_size
+        )
+    return conn.execute(text(query))
+
+
+async def _run_async(conn: AsyncConnection, query: str, params: dict | None = None):
+    """SQLを非同期で実行（パラメータとプリペアドステートメントの扱いは同期版と同じ）"""
+    if params:
+        return await conn.execute(text(query), params)
+    if _use_prepared():
+        statement = parameterize(query)
+        return await execute_prepared_async(
+            conn, statement.template, statement.params, settings.db_prepared_statement_cache_size
+        )
+    return await conn.execute(text(query))
+
+
+def get_prepared_statement_stats() -> dict:
+    """
+    プリペアドステートメントの再利用状況を取得
+
+    Returns:
+        dict: hits, misses, hit_rate, evictions（全コネクション合計）
+    """
+    return prepared.stats.snapshot()
+
+
+def _execute_on(
+    engine: Engine, query: str, max_rows: int, columnar: bool, params: dict | None = None
+) -> dict:
+    """
+    指定したエンジンでSQLを実行
+
+    Raises:
+        SQLAlchemyError: 接続断の場合（別の接続先で再試行するため）
+    """
+    deadline = None
+    try:
+        with _connect(engine) as conn:
+            deadline = _deadline(engine, conn)
+            if deadline is None:
+                return _collect(_run(conn, query, params), max_rows, columnar)
+            with deadline:
+                return _collect(_run(conn, query, params), max_rows, columnar)
     except SQLAlchemyError as e:
+        if is_timeout_error(e) or (deadline is not None and deadline.expired):
+            return _timeout_result(e)
+        if is_connection_error(e):
+            raise
         return {"success": False, "error": str(e)}
+
+
+def _execute(query: str, max_rows: int, columnar: bool, params: dict | None = None) -> dict:
+    """SQLを実行（同時実行数の上限に達している場合は順番を待つ）"""
+    query = _prepare_query(query)
+    try:
+        with _admission.admit():
+            return _execute_with_failover(query, max_rows, columnar, params)
+    except AdmissionRejected as e:
+        return _busy_result(e)
+
+
+def _execute_with_failover(
+    query: str, max_rows: int, columnar: bool, params: dict | None = None
+) -> dict:
+    """
+    SQLを実行（レプリカがあればレプリカへ振り分け、接続断なら別の接続先へフェイルオーバー）
+
+    利用可能なレプリカが無くなった場合はプライマリで実行する。
+    """
+    router = get_replica_router()
+    tried: list[Replica] = []
+    while True:
+        replica = router.choose(exclude=tried) if router else None
+        try:
+            with _track(replica):
+                engine = replica.engine if replica else get_db_engine()
+                return _execute_on(engine, query, max_rows, columnar, params)
+        except SQLAlchemyError as e:
+            if replica is None:
+                return {"success": False, "error": str(e)}
+            router.mark_down(replica)
+            tried.append(replica)
+
+
+def execute_sql(
+    query: str,
+    max_rows: int = settings.default_limit,
+    columnar: bool = False,
+    params: dict | None = None,
+) -> dict:
+    """
+    SQLを実行
+
+    settings.result_cache_enabled の場合、同じSQLの結果はキャッシュから返す。
+    settings.db_single_flight の場合、同じSQLが実行中であれば新たに実行せず、
+    その結果（同じオブジェクト）を受け取る（返される data は共有されるため変更しないこと）。
+
+    Args:
+        query: 実行するSQL
+        max_rows: 取得する最大行数
+        columnar: Trueの場合、dataを行の辞書のリストではなくColumnarResultで返す
+        params: SQL中の名前付きパラメータ（:name）にバインドする値
+
+    Returns:
+        dict: 実行結果
+            - success: 成功したか
+            - data: 取得した行（list[dict] または ColumnarResult）
+            - row_count: 行数
+            - cached: キャッシュから返した場合True
+            - error: エラーメッセージ（失敗時のみ）
+            - error_type: "timeout"（実行時間超過）または "busy"（同時実行数の上限で断られた）
+    """
+    max_rows = min(max_rows, settings.max_limit)
+    key = _result_key(query, max_rows, columnar, params)
+    if settings.result_cache_enabled:
+        _refresh_watermark()
+        cached = _result_cache.get(key)
+        if cached is not None:
+            return {**cached, "cached": True}
+
+    def run() -> dict:
+        return _cache_result(key, _execute(query, max_rows, columnar, params))
+
+    if not settings.db_single_flight:
+        return run()
+    return _single_flight.run(key, run)
+
+
+def explain_query(query: str) -> dict:
+    """
+    EXPLAIN FORMAT=JSON で実行計画を取得
+
+    Args:
+        query: 対象のSQL
+
+    Returns:
+        dict: 取得結果
+            - success: 成功したか
+            - plan: 実行計画（JSONをパースした辞書）
+            - error: エラーメッセージ（失敗時のみ）
+    """
+    try:
+        with _admission.admit(), _connect(_read_engine()) as conn:
+            plan = conn.execute(text(f"EXPLAIN FORMAT=JSON {query}")).scalar()
+            return {"success": True, "plan": json.loads(plan)}
+    except (SQLAlchemyError, AdmissionRejected, TypeError, ValueError) as e:
+        return {"success": False, "error": str(e)}
+
+
+def stream_sql(
+    query: str,
+    batch_size: int = settings.db_stream_batch_size,
+    max_rows: int = settings.default_limit,
+) -> Iterator[list[dict]]:
+    """
+    サーバーサイドカーソルでSQLを実行し、行をバッチ単位で返すジェネレータ
+
+    結果をクライアント側でまとめてバッファしないため、大きな結果でも
+    メモリ使用量はバッチサイズ分に収まる。コネクションはジェネレータを
+    使い切るか close() するまで保持される。
+
+    Args:
+        query: 実行するSQL
+        batch_size: 1バッチあたりの行数
+        max_rows: 取得する最大行数
+
+    Yields:
+        list[dict]: 行（辞書）のバッチ
+
+    Raises:
+        SQLAlchemyError: SQLの実行に失敗した場合（実行時間の上限を過ぎた場合は DeadlineExceeded）
+        AdmissionRejected: 同時実行数の上限で断られた場合
+    """
+    remaining = min(max_rows, settings.max_limit)
+    if remaining <= 0:
+        return
+
+    query = _prepare_query(query)
+
+    engine = _read_engine()
+    with _admission.admit(), _connect(engine) as conn:
+        # 行を読み終えるまで（呼び出し側がバッチを処理する時間も含む）を期限の対象にする
+        deadline = _deadline(engine, conn)
+        try:
+            with deadline or contextlib.nullcontext():
+                yield from _stream_batches(conn, query, batch_size, remaining)
+        except SQLAlchemyError as e:
+            if deadline is not None and deadline.expired:
+                raise DeadlineExceeded(str(e)) from e
+            raise
+
+
+def _stream_batches(
+    conn: Connection, query: str, batch_size: int, remaining: int
+) -> Iterator[list[dict]]:
+    """サーバーサイドカーソルで実行し、remaining 行までをバッチ単位で返す"""
+    result = conn.execution_options(stream_results=True, max_row_buffer=batch_size).execute(
+        text(query)
+    )
+    try:
+        for partition in result.mappings().partitions(min(batch_size, remaining)):
+            batch = [dict(row) for row in partition[:remaining]]
+            remaining -= len(batch)
+            yield batch
+            if remaining <= 0:
+                break
+    finally:
+        result.close()
+
+
+async def _until(deadline: float | None, awaitable: Awaitable):
+    """期限（イベントループの時刻）までに awaitable を待つ（過ぎたら DeadlineExceeded）"""
+    if deadline is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, deadline - asyncio.get_running_loop().time())
+    except asyncio.TimeoutError as e:
+        raise DeadlineExceeded(
+            f"クエリが実行時間の上限（{settings.query_timeout:g}秒）を超えたため中断しました"
+        ) from e
+
+
+async def stream_sql_async(
+    query: str,
+    batch_size: int = settings.db_stream_batch_size,
+    max_rows: int = settings.default_limit,
+) -> AsyncIterator[list[dict]]:
+    """
+    サーバーサイドカーソルでSQLを非同期実行し、行をバッチ単位で返す
+
+    Args:
+        query: 実行するSQL
+        batch_size: 1バッチあたりの行数
+        max_rows: 取得する最大行数
+
+    Yields:
+        list[dict]: 行（辞書）のバッチ
+
+    Raises:
+        SQLAlchemyError: SQLの実行に失敗した場合（実行時間の上限を過ぎた場合は DeadlineExceeded）
+        AdmissionRejected: 同時実行数の上限で断られた場合
+    """
+    remaining = min(max_rows, settings.max_limit)
+    if remaining <= 0:
+        return
+
+    if _is_embedded():
+        # SQLiteは非同期ドライバを使わず、同期版のジェネレータを1バッチずつスレッドで進める
+        batches = stream_sql(query, batch_size, max_rows)
+        try:
+            while (batch := await asyncio.to_thread(next, batches, None)) is not None:
+                yield batch
+        finally:
+            await asyncio.to_thread(batches.close)
+        return
+
+    query = _prepare_query(query)
+
+    engine = _read_async_engine()
+    loop = asyncio.get_running_loop()
+    timeout = settings.query_timeout
+    deadline = loop.time() + timeout + settings.query_timeout_grace if timeout > 0 else None
+    async with _admission.admit_async(), engine.connect() as conn:
+        result = await _until(deadline, conn.stream(text(query)))
+        try:
+            partitions = result.mappings().partitions(min(batch_size, remaining)).__aiter__()
+            while (partition := await _until(deadline, anext(partitions, None))) is not None:
+                batch = [dict(row) for row in partition[:remaining]]
+                remaining -= len(batch)
+                yield batch
+                if remaining <= 0:
+                    break
+        finally:
+            await result.close()
+
+
+def fetch_columnar(
+    query: str,
+    params: dict | None = None,
+    batch_size: int = settings.db_stream_batch_size,
+) -> ColumnarResult:
+    """
+    SQLの全行をサーバーサイドカーソルで読み込み、列指向で返す
+
+    エージェントの回答用ではなく、スナップショットの構築など内部の読み込み用。
+    max_limit・サーバーの sql_select_limit や結果キャッシュは適用しない
+    （同時実行数の制限は適用する）。
+
+    Args:
+        query: 実行するSQL
+        params: SQL中の名前付きパラメータ（:name）にバインドする値
+        batch_size: 1回に読み込む行数
+
+    Returns:
+        ColumnarResult: 全行
+
+    Raises:
+        SQLAlchemyError: SQLの実行に失敗した場合
+        AdmissionRejected: 同時実行数の上限で断られた場合
+    """
+    query = _prepare_query(query, agent=False)
+
+    with _admission.admit(), _connect(_read_engine()) as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=batch_size).execute(
+            text(query), params or {}
+        )
+        try:
+            return ColumnarResult.from_batches(list(result.keys()), result.partitions(batch_size))
+        finally:
+            result.close()
+
+
+async def _execute_async_on(
+    engine: AsyncEngine, query: str, max_rows: int, columnar: bool, params: dict | None = None
+) -> dict:
+    """
+    指定した非同期エンジンでSQLを実行
+
+    Raises:
+        SQLAlchemyError: 接続断の場合（別の接続先で再試行するため）
+    """
+    timeout = settings.query_timeout
+
+    async def run() -> dict:
+        started = time.perf_counter()
+        async with engine.connect() as conn:
+            _pool_stats.record_wait(time.perf_counter() - started)
+            return _collect(await _run_async(conn, query, params), max_rows, columnar)
+
+    try:
+        if timeout <= 0:
+            return await run()
+        return await asyncio.wait_for(run(), timeout + settings.query_timeout_grace)
+    except asyncio.TimeoutError as e:
+        return _timeout_result(e)
+    except SQLAlchemyError as e:
+        if is_timeout_error(e):
+            return _timeout_result(e)
+        if is_connection_error(e):
+            raise
+        return {"success": False, "error": str(e)}
+
+
+async def _execute_async(
+    query: str, max_rows: int, columnar: bool, params: dict | None = None
+) -> dict:
+    """SQLを非同期で実行（レプリカへの振り分けとフェイルオーバーは同期版と同じ）"""
+    if _is_embedded():
+        # SQLiteは非同期ドライバを使わず、同期版をスレッドで実行する
+        return await asyncio.to_thread(_execute, query, max_rows, columnar, params)
+
+    query = _prepare_query(query)
+    try:
+        async with _admission.admit_async():
+            return await _execute_async_with_failover(query, max_rows, columnar, params)
+    except AdmissionRejected as e:
+        return _busy_result(e)
+
+
+async def _execute_async_with_failover(
+    query: str, max_rows: int, columnar: bool, params: dict | None = None
+) -> dict:
+    """SQLを非同期で実行（接続断なら別の接続先へフェイルオーバー）"""
+    router = get_replica_router()
+    tried: list[Replica] = []
+    while True:
+        replica = router.choose(exclude=tried) if router else None
+        try:
+            with _track(replica):
+                engine = replica.async_engine if replica else get_async_db_engine()
+                return await _execute_async_on(engine, query, max_rows, columnar, params)
+        except SQLAlchemyError as e:
+            if replica is None:
+                return {"success": False, "error": str(e)}
+            router.mark_down(replica)
+            tried.append(replica)
+
+
+async def execute_sql_async(
+    query: str,
+    max_rows: int = settings.default_limit,
+    columnar: bool = False,
+    params: dict | None = None,
+) -> dict:
+    """
+    SQLを非同期で実行
+
+    Args:
+        query: 実行するSQL
+        max_rows: 取得する最大行数
+        columnar: Trueの場合、dataをColumnarResultで返す
+        params: SQL中の名前付きパラメータ（:name）にバインドする値
+
+    Returns:
+        dict: execute_sqlと同じ形式の実行結果（結果キャッシュと実行中の重複排除も共有する）
+    """
+    max_rows = min(max_rows, settings.max_limit)
+    key = _result_key(query, max_rows, columnar, params)
+    if settings.result_cache_enabled:
+        await _refresh_watermark_async()
+        cached = _result_cache.get(key)
+        if cached is not None:
+            return {**cached, "cached": True}
+
+    async def run() -> dict:
+        return _cache_result(key, await _execute_async(query, max_rows, columnar, params))
+
+    if not settings.db_single_flight:
+        return await run()
+    return await _single_flight.run_async(key, run)
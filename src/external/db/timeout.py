@@ -0,0 +1,149 @@
+"""
+クエリの実行時間制限
+サーバー側（接続ごとに設定する max_execution_time セッション変数、MySQLのみ）と
+クライアント側（MySQLでは KILL QUERY、SQLiteでは interrupt）の両方で期限を強制する
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections.abc import Callable
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+# 実行時間超過を表すMySQLのエラーコード
+# 3024: max_execution_time超過 / 1317: KILL QUERYによる中断
+TIMEOUT_ERROR_CODES = {3024, 1317}
+
+
+class DeadlineExceeded(SQLAlchemyError):
+    """クライアント側の期限を過ぎたためにクエリを中断した（ストリーミング実行中など）"""
+
+
+def is_timeout_error(error: BaseException) -> bool:
+    """DBドライバの例外が実行時間超過によるものかを判定"""
+    if isinstance(error, DeadlineExceeded):
+        return True
+    orig = getattr(error, "orig", None) or error
+    args = getattr(orig, "args", ())
+    return bool(args) and args[0] in TIMEOUT_ERROR_CODES
+
+
+def kill_query(engine: Engine, connection_id: int) -> None:
+    """
+    別コネクションから KILL QUERY を発行して実行中のクエリを中断
+
+    プールが枯渇していても発行できるよう、プールを経由せずに接続する。
+    """
+    cargs, cparams = engine.dialect.create_connect_args(engine.url)
+    dbapi_connection = engine.dialect.connect(*cargs, **cparams)
+    try:
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"KILL QUERY {int(connection_id)}")
+        cursor.close()
+    finally:
+        dbapi_connection.close()
+
+
+class Watchdog:
+    """
+    期限付きのコールバックを1本のバックグラウンドスレッドで管理する
+
+    クエリごとにタイマースレッドを作らずに済むよう、期限をヒープで保持する。
+    """
+
+    def __init__(self):
+        self._heap: list[tuple[float, int]] = []  # (deadline, handle)
+        self._callbacks: dict[int, Callable[[], None]] = {}
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    def watch(self, timeout: float, callback: Callable[[], None]) -> int:
+        """
+        timeout秒後にcallbackを呼び出すよう登録
+
+        Returns:
+            int: cancel() に渡すハンドル
+        """
+        handle = next(self._counter)
+        with self._cond:
+            self._callbacks[handle] = callback
+            heapq.heappush(self._heap, (time.monotonic() + timeout, handle))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sql-watchdog", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return handle
+
+    def cancel(self, handle: int) -> None:
+        """登録を取り消す（期限前にクエリが終わった場合）"""
+        with self._cond:
+            self._callbacks.pop(handle, None)
+
+    def _next_due(self) -> Callable[[], None]:
+        """期限が来たコールバックを待って取り出す"""
+        with self._cond:
+            while True:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                deadline, handle = self._heap[0]
+                if handle not in self._callbacks:
+                    heapq.heappop(self._heap)
+                    continue
+                wait = deadline - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+                return self._callbacks.pop(handle)
+
+    def _run(self) -> None:
+        while True:
+            callback = self._next_due()
+            try:
+                callback()
+            except Exception:
+                # 中断に失敗してもMySQLではサーバー側のmax_execution_timeで打ち切られるため無視する
+                pass
+
+
+class QueryDeadline:
+    """
+    1クエリ分の期限監視（with文で使う）
+
+    期限を過ぎると on_expire を呼び出す。with文を抜けるまでの間は
+    on_expire の実行と排他になるため、コネクションがプールへ返却された後に
+    別のクエリが中断されることはない。
+
+    Attributes:
+        expired: 期限を過ぎて on_expire を呼び出した場合True
+    """
+
+    def __init__(self, watchdog: Watchdog, timeout: float, on_expire: Callable[[], None]):
+        self.expired = False
+        self._watchdog = watchdog
+        self._timeout = timeout
+        self._on_expire = on_expire
+        self._done = False
+        self._lock = threading.Lock()
+        self._handle: int | None = None
+
+    def __enter__(self) -> "QueryDeadline":
+        self._handle = self._watchdog.watch(self._timeout, self._expire)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._watchdog.cancel(self._handle)
+        with self._lock:
+            self._done = True
+
+    def _expire(self) -> None:
+        with self._lock:
+            if self._done:
+                return
+            self.expired = True
+            self._on_expire()
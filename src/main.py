@@ -4,8 +4,16 @@ Google広告 SQLエージェント - エントリーポイント
 """
 
 import sys
+import time
 
-from src.agents.sql_agent import ask, ask_with_details
+from src.agents.sql_agent import ask_with_details, fetch_more
+from src.services.warmup import Warmup
+from src.settings import settings
+
+
+def _print_more_hint(continuation_token: str | None) -> None:
+    if continuation_token is not None:
+        print("\n（結果の続きがあります。'--more' で次のページを表示します）")
 
 
 def main():
@@ -15,9 +23,15 @@ def main():
     print("=" * 60)
     print("Google広告 SQLエージェント")
     print("自然言語でデータベースを検索できます")
+    print("前回の結果の続きを表示するには '--more' を入力")
     print("終了するには 'exit' または 'quit' を入力")
     print("=" * 60)
 
+    # 入力待ちの間にDB接続とLLMクライアントを準備しておく
+    warmup = Warmup().start() if settings.warmup_enabled else None
+    first_answer = True
+    continuation_token = None
+
     while True:
         try:
             question = input("\n質問: ").strip()
@@ -29,6 +43,20 @@ def main():
                 print("終了します。")
                 break
 
+            # 前回の結果の続き（--moreオプション、LLMは呼び出さない）
+            if question == "--more":
+                if continuation_token is None:
+                    print("\n続きはありません。")
+                    continue
+                page = fetch_more(continuation_token)
+                if page["error"]:
+                    print(f"\n【エラー】\n{page['error']}")
+                else:
+                    print(f"\n【実行結果（続き）】\n{page['sql_result']}")
+                continuation_token = page["continuation_token"]
+                _print_more_hint(continuation_token)
+                continue
+
             # 詳細モード（--detailオプション）
             show_detail = False
             if question.startswith("--detail "):
@@ -36,17 +64,28 @@ def main():
                 question = question[9:].strip()
 
             print("\n処理中...")
-
+            started = time.perf_counter()
+            if warmup is not None:
+                report = warmup.wait()
+                warmup = None
+                for error in report.errors:
+                    print(f"（ウォームアップに失敗しました: {error}）")
+
+            result = ask_with_details(question)
             if show_detail:
-                result = ask_with_details(question)
                 print(f"\n【チェック済みSQL】\n{result['checked_query']}")
                 print(f"\n【実行結果】\n{result['sql_result']}")
                 print(f"\n【回答】\n{result['answer']}")
                 if result.get("error"):
                     print(f"\n【エラー】\n{result['error']}")
             else:
-                answer = ask(question)
-                print(f"\n{answer}")
+                print(f"\n{result['answer']}")
+            continuation_token = result["continuation_token"]
+            _print_more_hint(continuation_token)
+
+            if first_answer:
+                first_answer = False
+                print(f"\n（初回回答までの時間: {time.perf_counter() - started:.2f}秒）")
 
         except KeyboardInterrupt:
             print("\n\n終了します。")
@@ -0,0 +1,121 @@
+"""
+広告指標の計算
+実行結果の impressions / clicks / cost / conversions / conversion_value 列から、
+CTR・CPC・CVR・CPA・ROAS をNumPyでまとめて計算します
+
+SQLでは元の列の合計だけを取得させ、比率はここで計算する（LLMが書くSQLの
+0除算や丸めの誤りを避けるため）。分母が0またはNULLの指標はNULLにする。
+"""
+
+import re
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+from src.external.db.columnar import ColumnarResult
+from src.settings import settings
+
+# 計算元の列
+RAW_COLUMNS = ("impressions", "clicks", "cost", "conversions", "conversion_value")
+
+# 指標の計算式（分子, 分母, 倍率）。SCHEMA_INFO の「主要指標の計算式」と同じ
+METRICS: dict[str, tuple[str, str, int]] = {
+    "ctr": ("clicks", "impressions", 100),
+    "cpc": ("cost", "clicks", 1),
+    "cvr": ("conversions", "clicks", 100),
+    "cpa": ("cost", "conversions", 1),
+    "roas": ("conversion_value", "cost", 100),
+}
+
+# 別名を付けずに合計した列（例: SUM(clicks)）
+_SUM_RE = re.compile(r"sum\(\s*(?:`?\w+`?\.)?`?(\w+)`?\s*\)", re.I)
+
+
+# 以下ヘルパー関数たち。
+def _raw_columns(columns: Sequence[str]) -> dict[str, str]:
+    """結果の列のうち計算元になる列（計算元の列名 → 結果の列名）"""
+    found: dict[str, str] = {}
+    for column in columns:
+        match = _SUM_RE.fullmatch(column.strip())
+        name = (match.group(1) if match else column).lower()
+        if name in RAW_COLUMNS and name not in found:
+            found[name] = column
+    return found
+
+
+def _to_list(values: np.ndarray) -> list:
+    """NaNをNoneにしたリスト"""
+    return [None if value != value else value for value in values.tolist()]
+
+
+def compute_metrics(
+    columns: Mapping[str, Sequence], decimals: int = settings.derived_metrics_decimals
+) -> dict[str, np.ndarray]:
+    """
+    計算元の列から指標を計算
+
+    Args:
+        columns: 計算元の列名（RAW_COLUMNS）→ 値（NULLはNone）
+        decimals: 丸める小数部の桁数
+
+    Returns:
+        dict[str, np.ndarray]: 指標名 → 値（float64、計算できない行はNaN）。
+            分子・分母の列が揃っている指標のみ
+    """
+    arrays = {name: np.asarray(values, dtype=np.float64) for name, values in columns.items()}
+    metrics = {}
+    for name, (numerator, denominator, scale) in METRICS.items():
+        if numerator not in arrays or denominator not in arrays:
+            continue
+        top, bottom = arrays[numerator], arrays[denominator]
+        values = np.full(len(top), np.nan)
+        np.divide(top, bottom, out=values, where=bottom != 0)
+        values *= scale
+        metrics[name] = np.round(values, decimals, out=values)
+    return metrics
+
+
+def add_metrics(
+    batch: list[dict] | ColumnarResult, decimals: int = settings.derived_metrics_decimals
+) -> list[dict] | ColumnarResult:
+    """
+    実行結果に指標の列を追加
+
+    結果に無い指標のうち、計算元の列が揃っているものを末尾に追加する。
+    元の行・ColumnarResult は変更しない（実行結果は共有されることがあるため）。
+
+    Args:
+        batch: 行の辞書のリスト、または ColumnarResult
+        decimals: 丸める小数部の桁数
+
+    Returns:
+        list[dict] | ColumnarResult: 指標を追加した結果（追加するものが無ければ batch そのもの）
+    """
+    if isinstance(batch, ColumnarResult):
+        names = batch.columns
+    elif batch:
+        names = list(batch[0])
+    else:
+        return batch
+
+    present = {name.lower() for name in names}
+    sources = _raw_columns(names)
+    wanted = [
+        name
+        for name, (numerator, denominator, _) in METRICS.items()
+        if name not in present and numerator in sources and denominator in sources
+    ]
+    if not wanted:
+        return batch
+
+    needed = {column for name in wanted for column in METRICS[name][:2]}
+    if isinstance(batch, ColumnarResult):
+        columns = {name: batch.column(sources[name]) for name in needed}
+    else:
+        columns = {name: [row[sources[name]] for row in batch] for name in needed}
+    metrics = compute_metrics(columns, decimals)
+    values = [_to_list(metrics[name]) for name in wanted]
+
+    if isinstance(batch, ColumnarResult):
+        return ColumnarResult([*batch.columns, *wanted], [*batch.arrays, *values], batch.row_count)
+    return [{**row, **dict(zip(wanted, extra))} for row, extra in zip(batch, zip(*values))]
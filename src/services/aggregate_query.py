@@ -0,0 +1,665 @@
+"""
+分解可能な集計クエリの解析
+日付範囲で絞り込んだ SUM / COUNT / MIN / MAX（AVGは SUM / COUNT に分解）の
+GROUP BY 集計を、期間ごとの部分集計と Python 側でのマージに分解します
+
+CTRやCPAのような比率は、部分集計を合算した後の値から計算し直す。
+"""
+
+import datetime
+from collections.abc import Callable
+from decimal import ROUND_HALF_UP, Decimal
+
+from src.services.sql_tokenizer import (
+    NUMBER,
+    OP,
+    PUNCT,
+    QUOTED,
+    STRING,
+    WORD,
+    Token,
+    column_name,
+    significant,
+    source_text,
+    split_alias,
+    split_tokens,
+    tokenize,
+    top_level,
+    unquote_identifier,
+    unquote_string,
+)
+
+# 期間で分割しても部分集計をマージできる集計関数
+AGGREGATE_FUNCTIONS = {"SUM", "COUNT", "MIN", "MAX", "AVG"}
+
+# 分解の対象外とする構文
+UNSUPPORTED_KEYWORDS = {"DISTINCT", "UNION", "HAVING", "WITH", "ROLLUP", "OVER", "WINDOW", "INTO"}
+
+# 最上位の句（この順序で現れる）
+CLAUSE_ORDER = ["SELECT", "FROM", "WHERE", "GROUP", "ORDER", "LIMIT"]
+
+# 分割に使う日付列の名前
+DATE_COLUMN = "date"
+
+# 日付の範囲を表す比較演算子（下限・上限と、境界を含むかどうか）
+_BOUND_OPERATORS = {
+    ">=": ("lower", 0),
+    ">": ("lower", 1),
+    "<=": ("upper", 0),
+    "<": ("upper", -1),
+}
+
+Evaluator = Callable[[list], object]
+
+
+class AggregatePlan:
+    """
+    期間で分割して実行する集計の計画
+
+    Attributes:
+        columns: 結果の列名（SELECT句の順）
+        group_exprs: GROUP BY のキーの式（SQL上の表記）
+        aggregates: 部分集計する (集計関数, 引数の式) のリスト（AVGは SUM と COUNT に分解済み）
+        from_clause: FROM句
+        conditions: WHERE句の日付範囲以外の条件（ANDで結合する）
+        date_column: 分割に使う日付列（SQL上の表記）
+        start: 期間の開始日（この日を含む）
+        end: 期間の終了日（この日を含む）
+    """
+
+    __slots__ = (
+        "columns",
+        "group_exprs",
+        "aggregates",
+        "from_clause",
+        "conditions",
+        "date_column",
+        "start",
+        "end",
+        "_outputs",
+        "_order",
+        "_limit",
+        "_offset",
+    )
+
+    def __init__(
+        self,
+        columns: list[str],
+        outputs: list[Evaluator],
+        group_exprs: list[str],
+        aggregates: list[tuple[str, str]],
+        from_clause: str,
+        conditions: list[str],
+        date_column: str,
+        start: datetime.date,
+        end: datetime.date,
+        order: list[tuple[Evaluator, bool]],
+        limit: int | None,
+        offset: int,
+    ):
+        self.columns = columns
+        self.group_exprs = group_exprs
+        self.aggregates = aggregates
+        self.from_clause = from_clause
+        self.conditions = conditions
+        self.date_column = date_column
+        self.start = start
+        self.end = end
+        self._outputs = outputs
+        self._order = order
+        self._limit = limit
+        self._offset = offset
+
+    def __repr__(self):
+        return (
+            f"AggregatePlan(columns={self.columns}, aggregates={self.aggregates}, "
+            f"range={self.start}..{self.end})"
+        )
+
+    def shard_query(self, limit: int) -> str:
+        """
+        1つの期間の部分集計を取得するSQL
+
+        期間は :shard_start / :shard_end（どちらも含む）のパラメータで指定する。
+
+        Args:
+            limit: 部分集計の最大行数
+        """
+        items = [f"{expr} AS _g{i}" for i, expr in enumerate(self.group_exprs)]
+        items += [f"{func}({arg}) AS _a{i}" for i, (func, arg) in enumerate(self.aggregates)]
+        where = [*self.conditions, f"{self.date_column} BETWEEN :shard_start AND :shard_end"]
+        query = f"SELECT {', '.join(items)} FROM {self.from_clause} WHERE {' AND '.join(where)}"
+        if self.group_exprs:
+            query += f" GROUP BY {', '.join(self.group_exprs)}"
+        return f"{query} LIMIT {limit}"
+
+    def shard_ranges(self, shards: int) -> list[tuple[datetime.date, datetime.date]]:
+        """
+        期間を shards 個（日数が少なければ日数分）に等分
+
+        Returns:
+            list[tuple[date, date]]: (開始日, 終了日) のリスト（どちらも含む）
+        """
+        days = (self.end - self.start).days + 1
+        shards = max(1, min(shards, days))
+        bounds = [self.start + datetime.timedelta(days=days * i // shards) for i in range(shards)]
+        ends = [bound - datetime.timedelta(days=1) for bound in bounds[1:]] + [self.end]
+        return list(zip(bounds, ends))
+
+    def merge(self, shard_rows: list[list[dict]]) -> list[dict]:
+        """
+        部分集計をマージし、SELECT句の式・ORDER BY・LIMITを適用した結果の行
+
+        Args:
+            shard_rows: 期間ごとの shard_query の結果
+
+        Returns:
+            list[dict]: 元のSQLと同じ列名の行
+        """
+        # 照合順序が _ci の文字列キーは、大文字小文字・末尾の空白だけが違えば同じグループにする
+        # （値は最初に現れた表記を使う）
+        groups: dict[tuple, tuple[tuple, list]] = {}
+        group_count = len(self.group_exprs)
+        functions = [func for func, _ in self.aggregates]
+        for rows in shard_rows:
+            for row in rows:
+                values = list(row.values())
+                key = tuple(values[:group_count])
+                collated = tuple(_collation_key(value) for value in key)
+                partial = values[group_count:]
+                entry = groups.get(collated)
+                if entry is None:
+                    groups[collated] = (key, partial)
+                else:
+                    groups[collated] = (
+                        entry[0],
+                        [
+                            _merge_value(func, a, b)
+                            for func, a, b in zip(functions, entry[1], partial)
+                        ],
+                    )
+
+        if not groups and not self.group_exprs:
+            # GROUP BYの無い集計は対象行が無くても1行返す
+            groups[()] = ((), [0 if func == "COUNT" else None for func in functions])
+
+        envs = [[*key, *merged] for key, merged in groups.values()]
+        for evaluator, descending in reversed(self._order):
+            envs.sort(key=lambda env: _sort_key(evaluator(env)), reverse=descending)
+
+        if self._limit is not None:
+            envs = envs[self._offset : self._offset + self._limit]
+        return [
+            {column: output(env) for column, output in zip(self.columns, self._outputs)}
+            for env in envs
+        ]
+
+
+# 以下ヘルパー関数たち。
+def _collation_key(value):
+    """グループのキーを比較用に正規化（文字列は大文字小文字と末尾の空白を区別しない）"""
+    if isinstance(value, str):
+        return value.rstrip(" ").casefold()
+    return value
+
+
+def _merge_value(func: str, a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if func in ("SUM", "COUNT"):
+        return _arith("+", a, b)
+    if func == "MIN":
+        return min(a, b)
+    return max(a, b)
+
+
+def _sort_key(value) -> tuple:
+    # MySQLの昇順ではNULLが先頭
+    return (value is not None, value if value is not None else 0)
+
+
+def _arith(op: str, a, b):
+    """MySQLと同様にNULLを伝播し、0除算はNULLにする四則演算"""
+    if a is None or b is None:
+        return None
+    if isinstance(a, float) or isinstance(b, float):
+        a, b = float(a), float(b)
+    if op == "+":
+        return a + b
+    if op == "-":
+        return a - b
+    if op == "*":
+        return a * b
+    if b == 0:
+        return None
+    if isinstance(a, int) and isinstance(b, int):
+        return Decimal(a) / Decimal(b)
+    return a / b
+
+
+def _round(value, digits=0):
+    if value is None or digits is None:
+        return None
+    digits = int(digits)
+    if isinstance(value, float):
+        return round(value, digits)
+    return Decimal(value).quantize(Decimal(1).scaleb(-digits), rounding=ROUND_HALF_UP)
+
+
+def _binary(op: str, left: Evaluator, right: Evaluator) -> Evaluator:
+    return lambda env: _arith(op, left(env), right(env))
+
+
+def _nullif(a, b):
+    return None if a is not None and a == b else a
+
+
+def _coalesce(*values):
+    return next((value for value in values if value is not None), None)
+
+
+# SELECT句の式で使える（集計結果に対して評価できる）関数
+SCALAR_FUNCTIONS: dict[str, Callable] = {
+    "ROUND": _round,
+    "NULLIF": _nullif,
+    "IFNULL": _coalesce,
+    "COALESCE": _coalesce,
+}
+
+
+def _normalize(tokens: list[Token]) -> str:
+    return " ".join(token.upper if token.kind == WORD else token.value for token in tokens)
+
+
+def _parse_date(tokens: list[Token]) -> datetime.date | None:
+    """'YYYY-MM-DD' または DATE 'YYYY-MM-DD' のリテラル"""
+    if len(tokens) == 2 and tokens[0].is_keyword("DATE"):
+        tokens = tokens[1:]
+    if len(tokens) != 1 or tokens[0].kind != STRING:
+        return None
+    try:
+        return datetime.date.fromisoformat(unquote_string(tokens[0].value))
+    except ValueError:
+        return None
+
+
+def _is_date_column(tokens: list[Token]) -> bool:
+    name = column_name(tokens)
+    return name is not None and name.lower() == DATE_COLUMN
+
+
+class _Compiler:
+    """SELECT句・ORDER BY句の式を、マージ後の集計値に対する評価関数へ変換する"""
+
+    def __init__(self, query: str, group_exprs: list[str]):
+        self.query = query
+        self.group_exprs = group_exprs
+        self.aggregates: list[tuple[str, str]] = []
+
+    def aggregate_index(self, func: str, arg: str) -> int:
+        key = (func, arg)
+        if key not in self.aggregates:
+            self.aggregates.append(key)
+        return len(self.group_exprs) + self.aggregates.index(key)
+
+    def compile(self, tokens: list[Token]) -> Evaluator | None:
+        self.tokens = tokens
+        self.pos = 0
+        try:
+            evaluator = self.expr()
+        except (IndexError, ValueError):
+            return None
+        return evaluator if self.pos == len(tokens) else None
+
+    def peek(self) -> Token | None:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self) -> Token:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def expect(self, value: str) -> None:
+        if self.take().value != value:
+            raise ValueError(value)
+
+    def binary(self, operand: Callable[[], Evaluator], ops: tuple[str, ...]) -> Evaluator:
+        left = operand()
+        while (token := self.peek()) is not None and token.kind == OP and token.value in ops:
+            self.take()
+            left = _binary(token.value, left, operand())
+        return left
+
+    def expr(self) -> Evaluator:
+        return self.binary(self.term, ("+", "-"))
+
+    def term(self) -> Evaluator:
+        return self.binary(self.factor, ("*", "/"))
+
+    def factor(self) -> Evaluator:
+        token = self.take()
+        if token.kind == OP and token.value == "-":
+            operand = self.factor()
+            return lambda env: _arith("-", 0, operand(env))
+        if token.kind == NUMBER:
+            value = Decimal(token.value) if "." in token.value else int(token.value)
+            return lambda env: value
+        if token.kind == PUNCT and token.value == "(":
+            inner = self.expr()
+            self.expect(")")
+            return inner
+        if token.kind == WORD and (next_token := self.peek()) and next_token.value == "(":
+            name = token.upper
+            if name in AGGREGATE_FUNCTIONS:
+                return self.aggregate(name)
+            if name in SCALAR_FUNCTIONS:
+                return self.function(SCALAR_FUNCTIONS[name])
+        raise ValueError(token.value)
+
+    def aggregate(self, func: str) -> Evaluator:
+        self.expect("(")
+        start = self.pos
+        depth = 1
+        while depth:
+            token = self.take()
+            if token.value == "(":
+                depth += 1
+            elif token.value == ")":
+                depth -= 1
+        args = self.tokens[start : self.pos - 1]
+        if not args or args[0].is_keyword("DISTINCT", "ALL") or len(split_tokens(args, ",")) != 1:
+            raise ValueError(func)
+        arg = "*" if len(args) == 1 and args[0].value == "*" else source_text(self.query, args)
+        if arg == "*" and func != "COUNT":
+            raise ValueError(func)
+
+        if func == "AVG":
+            total = self.aggregate_index("SUM", arg)
+            count = self.aggregate_index("COUNT", arg)
+            return lambda env: _arith("/", env[total], env[count])
+        index = self.aggregate_index(func, arg)
+        return lambda env: env[index]
+
+    def function(self, func: Callable) -> Evaluator:
+        self.expect("(")
+        args = [self.expr()]
+        while self.peek() is not None and self.peek().value == ",":
+            self.take()
+            args.append(self.expr())
+        self.expect(")")
+        return lambda env: func(*(arg(env) for arg in args))
+
+
+def _clauses(tokens: list[Token]) -> dict[str, list[Token]] | None:
+    """
+    最上位の SELECT / FROM / WHERE / GROUP BY / ORDER BY / LIMIT 句に分割
+
+    Returns:
+        dict[str, list[Token]] | None: 句の名前（GROUP / ORDER はBYを除く）ごとのトークン列。
+            対象外の構文を含む、または句の順序が不正な場合はNone
+    """
+    starts: list[tuple[str, int, int]] = []
+    top = top_level(tokens)
+    for pos, (i, token) in enumerate(top):
+        if token.is_keyword(*UNSUPPORTED_KEYWORDS):
+            return None
+        if token.is_keyword(*CLAUSE_ORDER) and token.upper not in ("GROUP", "ORDER"):
+            starts.append((token.upper, i, i + 1))
+        elif token.is_keyword("GROUP", "ORDER"):
+            if pos + 1 >= len(top) or not top[pos + 1][1].is_keyword("BY"):
+                return None
+            starts.append((token.upper, i, top[pos + 1][0] + 1))
+
+    names = [name for name, _, _ in starts]
+    if not starts or starts[0][1] != 0 or names != sorted(names, key=CLAUSE_ORDER.index):
+        return None
+    if len(set(names)) != len(names):
+        return None
+
+    clauses = {}
+    for index, (name, _, body) in enumerate(starts):
+        end = starts[index + 1][1] if index + 1 < len(starts) else len(tokens)
+        clauses[name] = tokens[body:end]
+    return clauses
+
+
+def split_conjuncts(where: list[Token]) -> list[list[Token]] | None:
+    """
+    WHERE句を最上位のANDで条件に分割（BETWEEN ... AND ... のANDでは分割しない）
+
+    Returns:
+        list[list[Token]] | None: 条件のトークン列のリスト。
+            最上位に OR / XOR がある、または空の条件がある場合はNone
+    """
+    conjuncts: list[list[Token]] = [[]]
+    depth = 0
+    in_between = False
+    for token in where:
+        if token.kind == PUNCT and token.value == "(":
+            depth += 1
+        elif token.kind == PUNCT and token.value == ")":
+            depth -= 1
+        if depth == 0 and token.is_keyword("OR", "XOR"):
+            return None
+        if depth == 0 and token.is_keyword("BETWEEN"):
+            in_between = True
+        elif depth == 0 and token.is_keyword("AND"):
+            if in_between:
+                in_between = False
+            else:
+                conjuncts.append([])
+                continue
+        conjuncts[-1].append(token)
+    if any(not conjunct for conjunct in conjuncts):
+        return None
+    return conjuncts
+
+
+def _date_conditions(
+    query: str, where: list[Token]
+) -> tuple[list[str], str, datetime.date, datetime.date] | None:
+    """
+    WHERE句から日付範囲の条件を取り出す
+
+    Returns:
+        tuple | None: (日付以外の条件, 日付列, 開始日, 終了日)。
+            最上位がANDで結合されていない、または日付の上限・下限が揃わない場合はNone
+    """
+    conjuncts = split_conjuncts(where)
+    if conjuncts is None:
+        return None
+
+    others: list[str] = []
+    column: str | None = None
+    lower: datetime.date | None = None
+    upper: datetime.date | None = None
+    for conjunct in conjuncts:
+        bound = date_bound(query, conjunct)
+        if bound is None:
+            others.append(source_text(query, conjunct))
+            continue
+        name, low, high = bound
+        if column is not None and name.lower() != column.lower():
+            return None
+        column = name
+        if low is not None:
+            lower = low if lower is None else max(lower, low)
+        if high is not None:
+            upper = high if upper is None else min(upper, high)
+
+    if column is None or lower is None or upper is None or lower > upper:
+        return None
+    return others, column, lower, upper
+
+
+def date_bound(
+    query: str, tokens: list[Token]
+) -> tuple[str, datetime.date | None, datetime.date | None] | None:
+    """日付列の範囲条件なら (列の表記, 下限, 上限)（上限・下限は境界を含む日付）"""
+    for i, token in enumerate(tokens):
+        if token.is_keyword("BETWEEN"):
+            column, rest = tokens[:i], tokens[i + 1 :]
+            and_pos = next((j for j, t in enumerate(rest) if t.is_keyword("AND")), None)
+            if not _is_date_column(column) or and_pos is None:
+                return None
+            low = _parse_date(rest[:and_pos])
+            high = _parse_date(rest[and_pos + 1 :])
+            if low is None or high is None:
+                return None
+            return source_text(query, column), low, high
+        if token.kind == OP and token.value in _BOUND_OPERATORS:
+            column = tokens[:i]
+            value = _parse_date(tokens[i + 1 :])
+            if not _is_date_column(column) or value is None:
+                return None
+            side, shift = _BOUND_OPERATORS[token.value]
+            value += datetime.timedelta(days=shift)
+            if side == "lower":
+                return source_text(query, column), value, None
+            return source_text(query, column), None, value
+    return None
+
+
+def plan_aggregate(query: str) -> AggregatePlan | None:
+    """
+    SQLを期間で分割できる集計として解析
+
+    対象: 単一のSELECT文で、SELECT句が GROUP BY のキーと SUM / COUNT / MIN / MAX / AVG、
+    およびその四則演算（ROUND / NULLIF / IFNULL / COALESCE も可）のみからなり、
+    WHERE句に date 列の上限・下限がANDで指定されているもの。
+
+    Args:
+        query: チェック済みのSQL
+
+    Returns:
+        AggregatePlan | None: 分割できない場合はNone
+    """
+    tokens = significant(tokenize(query.rstrip().rstrip(";")))
+    if not tokens or not tokens[0].is_keyword("SELECT"):
+        return None
+    clauses = _clauses(tokens)
+    if clauses is None or not {"SELECT", "FROM", "WHERE"} <= clauses.keys():
+        return None
+    if any(not clauses[name] for name in clauses):
+        return None
+
+    dates = _date_conditions(query, clauses["WHERE"])
+    if dates is None:
+        return None
+    conditions, date_column, start, end = dates
+
+    items = [split_alias(item) for item in split_tokens(clauses["SELECT"], ",")]
+    if any(not expr for expr, _ in items) or any(t.value == "*" for t in clauses["SELECT"][:1]):
+        return None
+
+    # GROUP BY のキー（別名・列番号は式に置き換える）
+    group_tokens: list[list[Token]] = []
+    for key in split_tokens(clauses.get("GROUP", []), ",") if "GROUP" in clauses else []:
+        if len(key) == 1 and key[0].kind == NUMBER and key[0].value.isdigit():
+            index = int(key[0].value) - 1
+            if not 0 <= index < len(items):
+                return None
+            key = items[index][0]
+        elif (name := column_name(key)) is not None and len(key) == 1:
+            aliased = [expr for expr, alias in items if alias and alias.lower() == name.lower()]
+            if aliased:
+                key = aliased[0]
+        group_tokens.append(key)
+    group_exprs = [source_text(query, key) for key in group_tokens]
+    group_norms = [_normalize(key) for key in group_tokens]
+
+    compiler = _Compiler(query, group_exprs)
+    columns: list[str] = []
+    outputs: list[Evaluator] = []
+    for expr, alias in items:
+        evaluator = _group_reference(expr, group_tokens, group_norms)
+        if evaluator is None:
+            evaluator = compiler.compile(expr)
+        if evaluator is None:
+            return None
+        outputs.append(evaluator)
+        columns.append(alias or column_name(expr) or source_text(query, expr))
+
+    order: list[tuple[Evaluator, bool]] = []
+    for key in split_tokens(clauses["ORDER"], ",") if "ORDER" in clauses else []:
+        descending = bool(key) and key[-1].is_keyword("DESC")
+        if key and key[-1].is_keyword("ASC", "DESC"):
+            key = key[:-1]
+        evaluator = _order_reference(key, items, outputs)
+        if evaluator is None:
+            evaluator = _group_reference(key, group_tokens, group_norms) or compiler.compile(key)
+        if evaluator is None:
+            return None
+        order.append((evaluator, descending))
+
+    limit, offset = None, 0
+    if "LIMIT" in clauses:
+        numbers = [int(t.value) for t in clauses["LIMIT"] if t.kind == NUMBER and t.value.isdigit()]
+        shape = ["n" if t.kind == NUMBER else t.upper for t in clauses["LIMIT"]]
+        if shape == ["n"] and len(numbers) == 1:
+            limit = numbers[0]
+        elif shape == ["n", ",", "n"] and len(numbers) == 2:
+            offset, limit = numbers
+        elif shape == ["n", "OFFSET", "n"] and len(numbers) == 2:
+            limit, offset = numbers
+        else:
+            return None
+
+    if not compiler.aggregates:
+        return None
+    return AggregatePlan(
+        columns,
+        outputs,
+        group_exprs,
+        compiler.aggregates,
+        source_text(query, clauses["FROM"]),
+        conditions,
+        date_column,
+        start,
+        end,
+        order,
+        limit,
+        offset,
+    )
+
+
+def _group_reference(
+    expr: list[Token], group_tokens: list[list[Token]], group_norms: list[str]
+) -> Evaluator | None:
+    """式が GROUP BY のキーであれば、そのキーの値を返す評価関数"""
+    norm = _normalize(expr)
+    for index, key_norm in enumerate(group_norms):
+        if norm == key_norm:
+            return lambda env: env[index]
+    name = column_name(expr)
+    if name is None:
+        return None
+    for index, key in enumerate(group_tokens):
+        key_name = column_name(key)
+        # 一方が修飾なしの列名なら、列名が一致するキーとみなす
+        if key_name and key_name.lower() == name.lower() and (len(expr) == 1 or len(key) == 1):
+            return lambda env: env[index]
+    return None
+
+
+def _order_reference(
+    key: list[Token],
+    items: list[tuple[list[Token], str | None]],
+    outputs: list[Evaluator],
+) -> Evaluator | None:
+    """ORDER BY のキーがSELECT句の列（列番号・別名・同じ式）であれば、その評価関数"""
+    if len(key) == 1 and key[0].kind == NUMBER and key[0].value.isdigit():
+        index = int(key[0].value) - 1
+        return outputs[index] if 0 <= index < len(outputs) else None
+    if len(key) == 1 and key[0].kind in (WORD, QUOTED):
+        name = unquote_identifier(key[0].value).lower()
+        for (_, alias), output in zip(items, outputs):
+            if alias and alias.lower() == name:
+                return output
+    norm = _normalize(key)
+    for (expr, _), output in zip(items, outputs):
+        if _normalize(expr) == norm:
+            return output
+    return None
@@ -0,0 +1,207 @@
+"""
+実行前のコストチェック
+EXPLAIN FORMAT=JSON の見積もりから、重すぎるクエリを実行前に差し戻します
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from src.external.db.result_cache import normalize_query
+from src.external.db.session import explain_query
+from src.services.query_checker import QueryMetadata, check_query
+from src.settings import settings
+
+# テーブルを全件走査するアクセスタイプ
+FULL_SCAN_ACCESS_TYPES = {"ALL", "index"}
+
+
+class PlanTable:
+    """実行計画中の1テーブル分の見積もり"""
+
+    __slots__ = ("name", "access_type", "rows_examined", "resolved")
+
+    def __init__(self, name: str, access_type: str, rows_examined: int, resolved: bool = True):
+        self.name = name
+        self.access_type = access_type
+        self.rows_examined = rows_examined  # 結合順を考慮した走査行数
+        self.resolved = resolved  # 実テーブル名を特定できたか
+
+    def __repr__(self):
+        return f"{self.name}: access_type={self.access_type}, rows={self.rows_examined:,}"
+
+
+# 以下ヘルパー関数たち。
+def _iter_plan_tables(node):
+    """実行計画のJSONから "table" 要素を出現順（結合順）に列挙"""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "table" and isinstance(value, dict):
+                yield value
+            yield from _iter_plan_tables(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _iter_plan_tables(item)
+
+
+def summarize_plan(plan: dict, aliases: dict[str, str | None] | None = None) -> list[PlanTable]:
+    """
+    実行計画からテーブルごとの走査行数を見積もる
+
+    ネステッドループ結合を前提に、各テーブルの rows_examined_per_scan に
+    直前までの結合で生成される行数（rows_produced_per_join）を掛ける。
+
+    Args:
+        plan: EXPLAIN FORMAT=JSON の結果
+        aliases: 参照名（別名・テーブル名）から実テーブル名への対応（QueryMetadata.aliases）。
+            指定した場合、対応が無い・曖昧なテーブルは resolved=False になる
+
+    Returns:
+        list[PlanTable]: テーブルごとの見積もり
+    """
+    tables = []
+    prefix_rows = 1
+    for table in _iter_plan_tables(plan):
+        name = table.get("table_name")
+        if not name or name.startswith("<"):
+            # 派生テーブルや一時テーブル
+            continue
+        resolved = True
+        if aliases is not None:
+            target = aliases.get(name.lower())
+            if target == "":
+                # 派生テーブル（別名で出力される場合）
+                continue
+            resolved = target is not None
+            name = target or name
+        per_scan = int(table.get("rows_examined_per_scan", 0))
+        tables.append(
+            PlanTable(name, table.get("access_type", ""), prefix_rows * per_scan, resolved)
+        )
+        prefix_rows = max(int(table.get("rows_produced_per_join", per_scan)), 1)
+    return tables
+
+
+# 実際にコストチェックの判定をオブジェクトとして持つクラス。
+class CostCheckResult:
+    """コストチェックの結果"""
+
+    def __init__(
+        self,
+        is_allowed: bool,
+        tables: list[PlanTable] | None = None,
+        error: str = "",
+    ):
+        self.is_allowed = is_allowed
+        self.tables = tables or []  # テーブルごとの見積もり
+        self.error = error  # 差し戻し理由（実行計画の要約を含む）
+
+    @property
+    def rows_examined(self) -> int:
+        """見積もり走査行数の合計"""
+        return sum(table.rows_examined for table in self.tables)
+
+    def plan_summary(self) -> str:
+        """リトライ用プロンプトに渡す実行計画の要約"""
+        lines = [f"- {table!r}" for table in self.tables]
+        lines.append(f"- 合計走査行数（見積もり）: {self.rows_examined:,}")
+        return "\n".join(lines)
+
+    def __repr__(self):
+        if self.is_allowed:
+            return f"CostCheckResult(allowed=True, rows_examined={self.rows_examined})"
+        return f"CostCheckResult(allowed=False, error='{self.error}')"
+
+
+class _PlanCache:
+    """クエリのフィンガープリントごとのコストチェック結果（LRU）"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, CostCheckResult] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CostCheckResult | None:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+            return result
+
+    def put(self, key: str, result: CostCheckResult) -> None:
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_plan_cache = _PlanCache(settings.cost_gate_cache_size)
+
+
+def _fingerprint(query: str) -> str:
+    return hashlib.sha1(normalize_query(query).encode()).hexdigest()
+
+
+def _judge(tables: list[PlanTable]) -> CostCheckResult:
+    result = CostCheckResult(True, tables)
+
+    denied = set(settings.cost_gate_full_scan_denied_tables)
+    scanned = [t for t in tables if t.access_type in FULL_SCAN_ACCESS_TYPES]
+    full_scans = sorted({t.name for t in scanned if t.name in denied})
+    # 実テーブルを特定できない全件走査は、許可されていないテーブルの可能性があるため差し戻す
+    unresolved = sorted({t.name for t in scanned if not t.resolved}) if denied else []
+    if full_scans:
+        result.is_allowed = False
+        result.error = (
+            f"全件走査が許可されていないテーブルを全件走査します: {', '.join(full_scans)}\n"
+            f"{result.plan_summary()}"
+        )
+    elif unresolved:
+        result.is_allowed = False
+        result.error = (
+            f"全件走査するテーブルの実テーブル名を特定できません: {', '.join(unresolved)}\n"
+            f"{result.plan_summary()}"
+        )
+    elif result.rows_examined > settings.cost_gate_max_rows_examined:
+        result.is_allowed = False
+        result.error = (
+            f"見積もり走査行数が上限（{settings.cost_gate_max_rows_examined:,}行）を超えています\n"
+            f"{result.plan_summary()}"
+        )
+    return result
+
+
+# 実際にコストチェックを処理する関数
+def check_cost(query: str, metadata: QueryMetadata | None = None) -> CostCheckResult:
+    """
+    EXPLAINの見積もりからクエリの実行コストをチェック
+
+    結果はクエリのフィンガープリントごとにキャッシュする。
+    EXPLAIN自体が失敗した場合は判定せずに通す（実行時のエラーとして扱う）。
+
+    Args:
+        query: チェック済みのSQL
+        metadata: チェック時の解析結果（別名の解決に使う。省略時はチェックし直す）
+    Returns:
+        CostCheckResult: チェック結果
+    """
+    key = _fingerprint(query)
+    cached = _plan_cache.get(key)
+    if cached is not None:
+        return cached
+
+    explained = explain_query(query)
+    if not explained["success"]:
+        return CostCheckResult(True)
+
+    if metadata is None:
+        metadata = check_query(query).metadata
+    aliases = metadata.aliases if metadata is not None else {}
+    result = _judge(summarize_plan(explained["plan"], aliases))
+    _plan_cache.put(key, result)
+    return result
@@ -0,0 +1,123 @@
+"""
+SQLのフィンガープリント
+リテラルの値・大文字小文字・空白・識別子の引用符だけが異なるSQLを同じ文として扱うための
+正規化とハッシュを提供します
+
+チェッカーと同じトークナイザの結果を1回走査するだけで作る。
+結果そのものはリテラルの値で変わるため、結果キャッシュのキーには使わないこと
+（統計・プランの傾向の集計、few-shot の事例の重複排除などに使う）。
+"""
+
+import hashlib
+from collections.abc import Iterable
+
+from src.services.sql_tokenizer import (
+    COMMENT,
+    NUMBER,
+    PARAM,
+    PUNCT,
+    QUOTED,
+    STRING,
+    WORD,
+    WS,
+    Token,
+    tokenize,
+)
+
+# リテラル・プレースホルダを置き換える記号
+PLACEHOLDER = "?"
+
+# IN (...) のリテラルの並びを置き換える記号（要素数の違いも区別しない）
+PLACEHOLDER_LIST = "?+"
+
+# プレースホルダに置き換えるトークンの種類
+_LITERAL_KINDS = {STRING, NUMBER, PARAM}
+
+
+def normalize_tokens(tokens: Iterable[Token]) -> str:
+    """
+    トークン列を正規化した文字列
+
+    - 空白・コメントを除き、トークンを1つの空白で区切る
+    - キーワード・識別子は小文字にし、識別子のバッククォートを外す
+    - 文字列・数値リテラルとプレースホルダは ? に置き換える
+    - IN (1, 2, 3) のようなリテラルだけの並びは IN ( ?+ ) にまとめる
+    - 末尾のセミコロンは除く
+
+    Args:
+        tokens: トークン列（tokenize() の結果、空白・コメントを含んでもよい）
+
+    Returns:
+        str: 正規化したSQL
+    """
+    parts: list[str] = []
+    # IN の直後の "(" の parts 内の位置（リテラルの並びが続いている間のみ）
+    in_list = -1
+    for kind, value, _ in tokens:
+        if kind == WS or kind == COMMENT:
+            continue
+        if kind in _LITERAL_KINDS:
+            part = PLACEHOLDER
+        elif kind == WORD:
+            part = value.lower()
+        elif kind == QUOTED:
+            part = value[1:-1].replace("``", "`").lower()
+        else:
+            part = value
+
+        if in_list >= 0:
+            if kind == PUNCT and value == ")" and len(parts) > in_list + 1:
+                del parts[in_list + 1 :]
+                parts.append(PLACEHOLDER_LIST)
+                in_list = -1
+            elif part != PLACEHOLDER and part != ",":
+                in_list = -1
+        elif kind == PUNCT and value == "(" and parts and parts[-1] == "in":
+            in_list = len(parts)
+        parts.append(part)
+
+    if parts and parts[-1] == ";":
+        parts.pop()
+    return " ".join(parts)
+
+
+def normalize(query: str) -> str:
+    """
+    SQLを正規化した文字列（normalize_tokens を参照）
+
+    Args:
+        query: SQL
+
+    Returns:
+        str: 正規化したSQL
+    """
+    return normalize_tokens(tokenize(query))
+
+
+def fingerprint_tokens(tokens: Iterable[Token]) -> str:
+    """
+    トークン列のフィンガープリント
+
+    Args:
+        tokens: トークン列
+
+    Returns:
+        str: 正規化したSQLのハッシュ（16桁の16進数）
+    """
+    return hashlib.blake2b(normalize_tokens(tokens).encode(), digest_size=8).hexdigest()
+
+
+def fingerprint(query: str) -> str:
+    """
+    SQLのフィンガープリント
+
+    リテラルの値、キーワード・識別子の大文字小文字、空白・コメント、識別子の引用符、
+    IN のリテラルの個数だけが異なるSQLは同じ値になる。
+
+    Args:
+        query: SQL
+
+    Returns:
+        str: 正規化したSQLのハッシュ（16桁の16進数）
+    """
+    return fingerprint_tokens(tokenize(query))
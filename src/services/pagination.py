@@ -0,0 +1,412 @@
+"""
+キーセットページネーション
+実行結果の最後の行の並び順キーを継続トークンに記録し、
+OFFSETを使わずにキーの条件（WHERE (キー) > (最後の値)）で次のページを取得します
+
+次のページの取得ではLLMを呼び出さない。トークンはクライアントから戻ってくるため、
+記録したSQLはデコード時に check_query で再検証する。
+
+並び順が行ごとに一意でないと次のページの境界が定まらないため、継続トークンは
+1つのテーブルだけを参照する集計でないSQLのうち、ORDER BY がそのテーブルの一意キー
+（UNIQUE_KEYS）を全て含むものに限って作る。次のページは元のSQLを派生テーブルとして
+包んで実行する。集計でないSQLはMySQLが派生テーブルを展開するため、キーの条件は
+元のテーブルの絞り込みとして使われる。
+"""
+
+import base64
+import binascii
+import datetime
+import json
+from decimal import Decimal
+
+from src.external.db.columnar import ColumnarResult
+from src.external.db.session import execute_sql, execute_sql_async
+from src.services.query_checker import QueryMetadata, check_query
+from src.services.sql_tokenizer import (
+    NUMBER,
+    column_name,
+    significant,
+    split_alias,
+    split_tokens,
+    tokenize,
+    top_level,
+)
+from src.settings import settings
+
+# テーブルごとの一意キー（NOT NULL の列のみからなるもの）
+PRIMARY_KEY = ("id",)
+UNIQUE_KEYS = {
+    "ad_accounts": [("google_account_id",)],
+    "campaigns": [("google_campaign_id", "account_id")],
+    "ad_groups": [("google_adgroup_id", "campaign_id")],
+    "search_queries": [("query_text",)],
+    "search_query_keyword_ad_daily_stats": [("search_query_id", "keyword_id", "ad_id", "date")],
+    "display_ad_daily_stats": [("ad_id", "date")],
+    "campaign_daily_stats": [("campaign_id", "date")],
+}
+
+
+class InvalidContinuationToken(ValueError):
+    """継続トークンが不正"""
+
+
+class PageCursor:
+    """
+    継続トークンの内容
+
+    Attributes:
+        query: LIMITを除いたチェック済みSQL
+        keys: 並び順のキー（結果の列名, "ASC" または "DESC"）
+        values: 直前のページの最後の行のキーの値
+        page_size: 1ページの行数
+    """
+
+    __slots__ = ("query", "keys", "values", "page_size")
+
+    def __init__(self, query: str, keys: list[tuple[str, str]], values: list, page_size: int):
+        self.query = query
+        self.keys = keys
+        self.values = values
+        self.page_size = page_size
+
+    def __repr__(self):
+        return f"PageCursor(keys={self.keys}, values={self.values}, page_size={self.page_size})"
+
+
+# 以下ヘルパー関数たち。
+def _split_limit(query: str) -> tuple[str, int | None]:
+    """
+    最上位のLIMIT句を切り離す
+
+    Returns:
+        tuple[str, int | None]: (LIMITを除いたSQL, 行数)。
+            LIMITが無い、またはOFFSET付きの場合は (query, None)
+    """
+    tokens = significant(tokenize(query))
+    for i, token in top_level(tokens):
+        if token.is_keyword("LIMIT"):
+            rest = tokens[i + 1 :]
+            if len(rest) == 1 and rest[0].kind == NUMBER and rest[0].value.isdigit():
+                return query[: token.start].rstrip(), int(rest[0].value)
+            return query, None
+    return query, None
+
+
+def _order_keys(order_by: tuple[tuple[str, bool], ...]) -> list[tuple[str | int, str]] | None:
+    """
+    ORDER BY句のキー（QueryMetadata.order_by）を列名・列番号にする
+
+    Returns:
+        list[tuple[str | int, str]] | None: (列名または列番号, "ASC" / "DESC") のリスト。
+            ORDER BYが無い、または列・列番号以外の式で並べている場合はNone
+    """
+    if not order_by:
+        return None
+    keys = []
+    for text, descending in order_by:
+        direction = "DESC" if descending else "ASC"
+        if text.isdigit():
+            keys.append((int(text), direction))
+            continue
+        # 列名（テーブル名.列名 も可）のみ対象とする
+        name = column_name(significant(tokenize(text)))
+        if name is None:
+            return None
+        keys.append((name, direction))
+    return keys
+
+
+def _has_unique_columns(metadata: QueryMetadata) -> bool:
+    """
+    結果の列名が重複しないか（派生テーブルとして SELECT * で包めるか）
+
+    * は1つのテーブルだけを参照する場合のみ重複しないとみなす。
+    """
+    columns = [column.lower() for column in metadata.columns]
+    if any(column == "*" or column.endswith(".*") for column in columns):
+        return len(columns) == 1 and len(metadata.tables) == 1
+    return len(set(columns)) == len(columns)
+
+
+def _result_sources(query: str) -> dict[str, str | None]:
+    """
+    SELECT句の結果の列名から、参照している元の列名への対応（どちらも小文字）
+
+    列の参照でない式はNoneに対応づける。* で選んだ列は含まない（列名がそのまま元の列名）。
+    """
+    tokens = significant(tokenize(query))
+    end = next((i for i, token in top_level(tokens) if token.is_keyword("FROM")), len(tokens))
+    select = tokens[1:end]
+    if select and select[0].is_keyword("DISTINCT", "ALL", "DISTINCTROW"):
+        select = select[1:]
+    sources: dict[str, str | None] = {}
+    for item in split_tokens(select, ","):
+        expr, alias = split_alias(item)
+        source = column_name(expr)
+        name = alias or source
+        if name is not None:
+            sources[name.lower()] = source.lower() if source is not None else None
+    return sources
+
+
+def _is_unique_order(query: str, table: str, keys: list[tuple[str, str]]) -> bool:
+    """並び順のキー（結果の列名）がテーブルの一意キーのいずれかを全て含むか"""
+    sources = _result_sources(query)
+    ordered = {sources.get(column.lower(), column.lower()) for column, _ in keys}
+    return any(set(unique) <= ordered for unique in [PRIMARY_KEY, *UNIQUE_KEYS.get(table, [])])
+
+
+def _resolve_keys(
+    keys: list[tuple[str | int, str]], columns: list[str]
+) -> list[tuple[str, str]] | None:
+    """ORDER BYのキーを結果の列名に対応づける（対応できない場合はNone）"""
+    lowered = {column.lower(): column for column in columns}
+    resolved = []
+    for key, direction in keys:
+        if isinstance(key, int):
+            if not 1 <= key <= len(columns):
+                return None
+            resolved.append((columns[key - 1], direction))
+        elif key.lower() in lowered:
+            resolved.append((lowered[key.lower()], direction))
+        else:
+            return None
+    return resolved
+
+
+def _encode_value(value):
+    if value is None:
+        return None
+    if isinstance(value, Decimal):
+        return {"decimal": str(value)}
+    if isinstance(value, datetime.datetime):
+        return {"datetime": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"date": value.isoformat()}
+    if isinstance(value, (str, int, float)):
+        return value
+    raise TypeError(f"継続トークンに記録できない値です: {type(value).__name__}")
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if "decimal" in value:
+            return Decimal(value["decimal"])
+        if "datetime" in value:
+            return datetime.datetime.fromisoformat(value["datetime"])
+        if "date" in value:
+            return datetime.date.fromisoformat(value["date"])
+        raise ValueError(f"不明な値です: {value}")
+    return value
+
+
+def _quote(column: str) -> str:
+    return f"`{column.replace('`', '``')}`"
+
+
+def _equal(column: str, value, i: int) -> str:
+    return f"{_quote(column)} IS NULL" if value is None else f"{_quote(column)} = :k{i}"
+
+
+def _after(column: str, direction: str, value, i: int) -> str | None:
+    """並び順で直前の値より後になる条件（NULLはASCでは先頭、DESCでは末尾に並ぶ）"""
+    if direction == "ASC":
+        return f"{_quote(column)} IS NOT NULL" if value is None else f"{_quote(column)} > :k{i}"
+    if value is None:
+        return None
+    return f"({_quote(column)} < :k{i} OR {_quote(column)} IS NULL)"
+
+
+def _keyset_predicate(keys: list[tuple[str, str]], values: list) -> str:
+    """(キー) > (直前の値) を並び順の向きとNULLの位置に合わせて展開した条件"""
+    terms = []
+    for i, (column, direction) in enumerate(keys):
+        after = _after(column, direction, values[i], i)
+        if after is not None:
+            conditions = [_equal(keys[j][0], values[j], j) for j in range(i)]
+            terms.append(f"({' AND '.join([*conditions, after])})")
+    return " OR ".join(terms) if terms else "1 = 0"
+
+
+def _page_query(cursor: PageCursor) -> tuple[str, dict]:
+    """次のページを取得するSQLとパラメータ"""
+    order_by = ", ".join(f"{_quote(column)} {direction}" for column, direction in cursor.keys)
+    query = (
+        f"SELECT * FROM ({cursor.query}) AS _page"
+        f" WHERE {_keyset_predicate(cursor.keys, cursor.values)}"
+        f" ORDER BY {order_by}"
+        f" LIMIT {cursor.page_size}"
+    )
+    params = {f"k{i}": value for i, value in enumerate(cursor.values) if value is not None}
+    return query, params
+
+
+def _iter_rows(batch: list[dict] | ColumnarResult):
+    return batch.iter_rows() if isinstance(batch, ColumnarResult) else batch
+
+
+class KeysetTracker:
+    """
+    実行結果を受け取りながら、次のページの継続トークンを作る
+
+    ストリーミング実行でも使えるよう、行のバッチを逐次受け取り、最後の行のキーだけを保持する。
+    並び順のキーと行数はチェック時の解析結果（QueryMetadata）から取る。
+    結果の列名が重複するSQLは次のページのSQLで包めないため、継続トークンを作らない。
+    """
+
+    def __init__(
+        self,
+        query: str,
+        metadata: QueryMetadata | None = None,
+        previous: PageCursor | None = None,
+    ):
+        if metadata is None:
+            metadata = check_query(query).metadata
+        self.row_count = 0
+        self._query = query
+        self._table = None
+        self._page_size = None
+        self._order = None
+        if (
+            metadata is not None
+            and metadata.offset == 0
+            and len(metadata.tables) == 1
+            and not metadata.aggregates
+            and not metadata.group_by
+            and _has_unique_columns(metadata)
+        ):
+            self._table = metadata.tables[0]
+            self._page_size = metadata.limit
+            self._order = _order_keys(metadata.order_by)
+        self._keys: list[tuple[str, str]] | None = previous.keys if previous else None
+        self._last: tuple | None = None
+
+    def observe(self, batch: list[dict] | ColumnarResult) -> None:
+        """行のバッチを追加"""
+        if self._order is None:
+            return
+        for row in _iter_rows(batch):
+            if self._keys is None:
+                self._keys = _resolve_keys(self._order, list(row))
+                if self._keys is None:
+                    self._order = None
+                    return
+            self._last = tuple(row[column] for column, _ in self._keys)
+            self.row_count += 1
+
+    def token(self) -> str | None:
+        """
+        次のページの継続トークン
+
+        Returns:
+            str | None: 続きが無い（ページの行数に満たない）場合や、
+                並び順のキーが一意キーを含まない場合はNone
+        """
+        if self._order is None or self._last is None or self.row_count < self._page_size:
+            return None
+        query, page_size = _split_limit(self._query)
+        if page_size != self._page_size or not _is_unique_order(query, self._table, self._keys):
+            return None
+
+        try:
+            values = [_encode_value(value) for value in self._last]
+        except TypeError:
+            return None
+        payload = {
+            "q": query,
+            "k": self._keys,
+            "v": values,
+            "n": self._page_size,
+        }
+        data = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(data).decode()
+
+
+def decode_token(token: str) -> PageCursor:
+    """
+    継続トークンをデコードして検証
+
+    記録されたSQLは check_query で再検証する。
+
+    Args:
+        token: 継続トークン
+
+    Returns:
+        PageCursor: トークンの内容
+
+    Raises:
+        InvalidContinuationToken: トークンが不正、またはSQLがチェックを通らない場合
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+        query = payload["q"]
+        keys = [(str(column), str(direction).upper()) for column, direction in payload["k"]]
+        values = [_decode_value(value) for value in payload["v"]]
+        page_size = int(payload["n"])
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, KeyError) as e:
+        raise InvalidContinuationToken(f"継続トークンが不正です: {e}") from e
+
+    if (
+        not keys
+        or len(keys) != len(values)
+        or any(direction not in ("ASC", "DESC") for _, direction in keys)
+        or not 1 <= page_size <= settings.max_limit
+    ):
+        raise InvalidContinuationToken("継続トークンが不正です")
+
+    result = check_query(query)
+    if not result.is_valid:
+        raise InvalidContinuationToken(f"継続トークンのSQLが不正です: {result.error}")
+    checked, _ = _split_limit(result.query)
+    return PageCursor(checked, keys, values, page_size)
+
+
+def _next_page(cursor: PageCursor, result: dict) -> dict:
+    """次のページの実行結果に新しい継続トークンを付ける"""
+    if not result["success"]:
+        return result
+    data = result["data"]
+    rows = data.to_rows() if isinstance(data, ColumnarResult) else data
+    tracker = KeysetTracker(f"{cursor.query} LIMIT {cursor.page_size}", previous=cursor)
+    tracker.observe(rows)
+    return {
+        "success": True,
+        "data": rows,
+        "row_count": len(rows),
+        "continuation_token": tracker.token(),
+    }
+
+
+def fetch_next_page(token: str) -> dict:
+    """
+    継続トークンから次のページを取得
+
+    Args:
+        token: 継続トークン
+
+    Returns:
+        dict: execute_sql と同じ形式の実行結果
+            - continuation_token: さらに続きがある場合の継続トークン（無ければNone）
+
+    Raises:
+        InvalidContinuationToken: トークンが不正な場合
+    """
+    cursor = decode_token(token)
+    query, params = _page_query(cursor)
+    return _next_page(cursor, execute_sql(query, cursor.page_size, params=params))
+
+
+async def fetch_next_page_async(token: str) -> dict:
+    """
+    継続トークンから次のページを取得（非同期版）
+
+    Returns:
+        dict: fetch_next_page と同じ形式の実行結果
+
+    Raises:
+        InvalidContinuationToken: トークンが不正な場合
+    """
+    cursor = decode_token(token)
+    query, params = _page_query(cursor)
+    result = await execute_sql_async(query, cursor.page_size, params=params)
+    return _next_page(cursor, result)
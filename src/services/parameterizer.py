@@ -0,0 +1,149 @@
+"""
+リテラルのパラメータ化
+チェック済みSQLのリテラルをバインドパラメータに置き換え、
+日付やキャンペーン名だけが異なるSQLを同じ文として扱えるようにします
+"""
+
+from decimal import Decimal
+
+from src.services.sql_tokenizer import (
+    NUMBER,
+    PUNCT,
+    STRING,
+    WORD,
+    Token,
+    significant,
+    tokenize,
+    unquote_string,
+)
+
+# パラメータ化の対象とする句（SELECT句やGROUP BY句の式はGROUP BYとの一致判定が
+# 崩れるため対象外）
+PARAMETERIZED_CLAUSES = {"WHERE", "HAVING", "LIMIT"}
+
+# 句を切り替えるキーワード（サブクエリの中では、そのサブクエリの句を切り替える）
+CLAUSE_KEYWORDS = {"SELECT", "FROM", "WHERE", "GROUP", "HAVING", "ORDER", "LIMIT"}
+
+# 直後の文字列が型付きリテラル（DATE '2024-01-01' など）になるキーワード
+TYPED_LITERAL_KEYWORDS = {"DATE", "TIME", "TIMESTAMP"}
+
+# 直後の文字列と続けて1つのリテラルになる接頭辞（N'...' / X'...' / B'...'）
+STRING_PREFIXES = {"N", "X", "B"}
+
+# 直後の括弧が関数呼び出しではないキーワード
+NON_FUNCTION_KEYWORDS = {
+    "FROM",
+    "JOIN",
+    "IN",
+    "AND",
+    "OR",
+    "NOT",
+    "WHERE",
+    "HAVING",
+    "ON",
+    "WHEN",
+    "THEN",
+    "ELSE",
+    "BETWEEN",
+    "LIKE",
+    "IS",
+    "EXISTS",
+}
+
+
+class ParameterizedQuery:
+    """
+    パラメータ化したSQL
+
+    Attributes:
+        template: リテラルを "?" に置き換えたSQL
+        params: 置き換えたリテラルの値（出現順）
+    """
+
+    __slots__ = ("template", "params")
+
+    def __init__(self, template: str, params: tuple):
+        self.template = template
+        self.params = params
+
+    def __repr__(self):
+        return f"ParameterizedQuery(template='{self.template[:50]}...', params={self.params})"
+
+
+def _literal_value(kind: str, text: str):
+    if kind == STRING:
+        return unquote_string(text)
+    if text[:2].lower() == "0x":
+        return int(text, 16)
+    if any(ch in text for ch in ".eE"):
+        return Decimal(text)
+    return int(text)
+
+
+def _is_literal_prefix(previous: Token | None, token: Token) -> bool:
+    """previous がリテラル token の型・文字セットの指定（DATE '...' / _utf8mb4'...' など）か"""
+    if previous is None or previous.kind != WORD:
+        return False
+    if previous.upper in TYPED_LITERAL_KEYWORDS or previous.value.startswith("_"):
+        return True
+    return (
+        token.kind == STRING
+        and previous.upper in STRING_PREFIXES
+        and previous.start + len(previous.value) == token.start
+    )
+
+
+def parameterize(query: str) -> ParameterizedQuery:
+    """
+    WHERE / HAVING / LIMIT 句のリテラルを "?" に置き換える
+
+    関数の引数（DATE_FORMATの書式など）、型付きリテラル・文字セット指定付きの文字列、
+    ORDER BY / GROUP BY の列番号は結果が変わりうるため置き換えない。
+    句はサブクエリごとに判定する。
+
+    Args:
+        query: チェック済みのSQL
+
+    Returns:
+        ParameterizedQuery: パラメータ化したSQL
+    """
+    tokens = significant(tokenize(query))
+    parts = []
+    params = []
+    position = 0
+    clause = None
+    # 括弧ごとに関数呼び出しかどうかを保持
+    function_parens: list[bool] = []
+    # 括弧ごとに、括弧の外側の句を保持（閉じたときに戻す）
+    outer_clauses: list[str | None] = []
+    previous = None
+
+    for token in tokens:
+        if token.kind == PUNCT and token.value == "(":
+            is_function = (
+                previous is not None
+                and previous.kind == WORD
+                and previous.upper not in NON_FUNCTION_KEYWORDS
+            )
+            function_parens.append(is_function)
+            outer_clauses.append(clause)
+        elif token.kind == PUNCT and token.value == ")":
+            if function_parens:
+                function_parens.pop()
+                clause = outer_clauses.pop()
+        elif token.kind == WORD and not any(function_parens) and token.upper in CLAUSE_KEYWORDS:
+            clause = token.upper
+        elif (
+            token.kind in (STRING, NUMBER)
+            and clause in PARAMETERIZED_CLAUSES
+            and not any(function_parens)
+            and not _is_literal_prefix(previous, token)
+        ):
+            parts.append(query[position : token.start])
+            parts.append("?")
+            params.append(_literal_value(token.kind, token.value))
+            position = token.start + len(token.value)
+        previous = token
+
+    parts.append(query[position:])
+    return ParameterizedQuery("".join(parts), tuple(params))
@@ -1,91 +1,500 @@
 """
 Google広告データベース用 SQLクエリチェッカー
 生成されたSQLの安全性とポリシー準拠をチェックします
-"""
 
-import re
+SQLはトークナイザで1回だけ走査し、文の種類・テーブル・LIMIT句をトークン列から判定する。
+文字列リテラルや引用符付きの識別子の中身は、キーワードやコメントとして扱わない。
+同じトークン列から、後段の処理（キャッシュ・集計の振り分けなど）が使うメタデータも作る。
+
+リトライや同じ質問で同じSQLを繰り返しチェックするため、結果はSQLのハッシュごとに
+LRUでメモ化する。ALLOWED_TABLES や LIMIT の設定が変わるとメモは破棄される。
+生成SQLのコーパスをまとめて評価する場合は check_queries を使う。
+"""
 
+import datetime
+import hashlib
+import threading
+from collections import Counter, OrderedDict, deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import chain, islice
+from typing import NamedTuple
+
+from src.services.aggregate_query import date_bound, split_conjuncts
+from src.services.fingerprint import fingerprint_tokens
+from src.services.sql_tokenizer import (
+    COMMENT,
+    NUMBER,
+    OTHER,
+    PUNCT,
+    QUOTED,
+    WORD,
+    WS,
+    Token,
+    column_name,
+    source_text,
+    split_alias,
+    split_tokens,
+    tokenize,
+    top_level,
+    unquote_identifier,
+)
 from src.settings import settings
 
-# アクセス許可テーブル
-ALLOWED_TABLES = {
-    # マスターデータ
-    "services",
-    "ad_accounts",
-    "campaigns",
-    "ad_groups",
-    "keywords",
-    "ads",
-    "targeting_settings",
-    "search_queries",
-    # 実績データ
-    "search_query_keyword_ad_daily_stats",
-    "display_ad_daily_stats",
-    "campaign_daily_stats",
-}
+# アクセス許可テーブル（変更する場合は frozenset ごと置き換える。メモの判定に使う）
+ALLOWED_TABLES = frozenset(
+    {
+        # マスターデータ
+        "services",
+        "ad_accounts",
+        "campaigns",
+        "ad_groups",
+        "keywords",
+        "ads",
+        "targeting_settings",
+        "search_queries",
+        # 実績データ
+        "search_query_keyword_ad_daily_stats",
+        "display_ad_daily_stats",
+        "campaign_daily_stats",
+    }
+)
 
 # 禁止キーワード（DML/DDL）
-DENY_RE = re.compile(
-    r"\b(INSERT|UPDATE|DELETE|ALTER|DROP|CREATE|REPLACE|TRUNCATE|GRANT|REVOKE)\b",
-    re.I,
-)
+DENY_KEYWORDS = {
+    "INSERT",
+    "UPDATE",
+    "DELETE",
+    "ALTER",
+    "DROP",
+    "CREATE",
+    "REPLACE",
+    "TRUNCATE",
+    "GRANT",
+    "REVOKE",
+}
 
-# 危険な構文（コメント、セミコロン複数）
-DANGEROUS_RE = re.compile(
-    r"(--|#|/\*|\*/|;\s*\w)",  # コメントや複数文
-    re.I,
-)
+# 同じ名前の文字列関数がある禁止キーワード（直後が "(" なら関数呼び出し）
+FUNCTION_KEYWORDS = {"INSERT", "REPLACE"}
+
+# 括弧内の FROM がテーブルではなく引数の区切りになる関数（EXTRACT(YEAR FROM date) など）
+FROM_ARGUMENT_FUNCTIONS = {"EXTRACT", "TRIM", "SUBSTRING", "SUBSTR"}
+
+# FROM句の終わりを表すキーワード
+FROM_CLAUSE_END = {
+    "WHERE",
+    "GROUP",
+    "HAVING",
+    "ORDER",
+    "LIMIT",
+    "UNION",
+    "WINDOW",
+    "FOR",
+    "LOCK",
+    "INTO",
+}
 
-# LIMIT句の検出（末尾）
-HAS_LIMIT_RE = re.compile(
-    r"\bLIMIT\s+(\d+)(?:\s*,\s*\d+)?\s*;?\s*$",
-    re.I,
-)
+# テーブル名の後に続いても別名ではないキーワード
+NOT_ALIAS_KEYWORDS = FROM_CLAUSE_END | {
+    "JOIN",
+    "INNER",
+    "LEFT",
+    "RIGHT",
+    "OUTER",
+    "CROSS",
+    "NATURAL",
+    "STRAIGHT_JOIN",
+    "ON",
+    "USING",
+    "USE",
+    "FORCE",
+    "IGNORE",
+    "PARTITION",
+}
 
-# FROM/JOIN句からテーブル名を抽出
-FROM_RE = re.compile(
-    r"\bFROM\s+([`\"\[]?\w+[`\"\]]?)",
-    re.I,
-)
-JOIN_RE = re.compile(
-    r"\bJOIN\s+([`\"\[]?\w+[`\"\]]?)",
-    re.I,
-)
+# 集計関数（メタデータの aggregates に含める関数）
+METADATA_AGGREGATE_FUNCTIONS = {
+    "SUM",
+    "COUNT",
+    "AVG",
+    "MIN",
+    "MAX",
+    "GROUP_CONCAT",
+    "STD",
+    "STDDEV",
+    "VARIANCE",
+}
+
+# メタデータ用に分割する最上位の句（GROUP / ORDER はBYを除いた名前）
+METADATA_CLAUSES = {"SELECT", "FROM", "WHERE", "GROUP", "HAVING", "ORDER", "LIMIT"}
+
+# QueryCheckResult.error_code の値と意味
+ERROR_CODES = {
+    "empty": "クエリが空",
+    "comment": "SQLコメントを含む",
+    "parse": "解析できない文字を含む",
+    "multiple_statements": "複数のSQL文",
+    "not_select": "SELECT文以外",
+    "dml": "DML/DDLのキーワードを含む",
+    "no_table": "テーブル名を特定できない",
+    "disallowed_table": "許可されていないテーブルを参照",
+    "limit_format": "LIMIT句の形式が不正",
+}
 
+# デフォルトのLIMITを追加した場合にフィンガープリントへ加えるトークン
+_ADDED_LIMIT = tokenize(" LIMIT 0")
 
-# 以下ヘルパー関数たち。
-def _normalize_identifier(name: str) -> str:
-    """テーブル名を正規化（引用符除去、小文字化）"""
-    return re.sub(r'^[`"\[]|[`"\]]$', "", name).lower()
+_LIMIT_FORMAT = "LIMIT句は LIMIT 行数 / LIMIT 開始位置, 行数 / LIMIT 行数 OFFSET 開始位置 の形式で指定してください"
 
 
-def _extract_tables(query: str) -> set[str]:
-    tables = set()
+class DateRange(NamedTuple):
+    """日付列の範囲（start / end は境界を含む日付、指定が無ければNone）"""
 
-    for pattern in [FROM_RE, JOIN_RE]:
-        for match in pattern.finditer(query):
-            table = _normalize_identifier(match.group(1))
-            tables.add(table)
+    column: str
+    start: datetime.date | None
+    end: datetime.date | None
 
+
+class QueryMetadata:
+    """
+    チェック済みSQLの解析結果
+
+    最上位のSELECT文（UNIONの場合は最初のSELECT）について、SQLを解析し直さずに
+    後段の処理で使える情報をまとめたもの。式は元のSQLでの表記のまま保持する。
+
+    Attributes:
+        tables: 参照するテーブル名（サブクエリを含む、小文字・ソート済み）
+        aliases: 参照名（別名・テーブル名、小文字）→ テーブル名。派生テーブルの別名は空文字、
+            同じ別名が異なるテーブルを指す場合はNone
+        columns: 結果の列名（別名、列名、または式の表記）
+        aggregates: 集計関数の呼び出し (関数名, 引数の表記)（SELECT / HAVING / ORDER BY句）
+        group_by: GROUP BY のキーの表記
+        order_by: ORDER BY の (キーの表記, 降順か)
+        date_ranges: WHERE句で指定された日付列の範囲
+        limit: 最大行数（チェックで追加・制限した後の値）
+        offset: 開始位置
+        fingerprint: チェック後のSQLのフィンガープリント（fingerprint.fingerprint() を参照）
+    """
+
+    __slots__ = (
+        "tables",
+        "aliases",
+        "columns",
+        "aggregates",
+        "group_by",
+        "order_by",
+        "date_ranges",
+        "limit",
+        "offset",
+        "fingerprint",
+    )
+
+    def __init__(
+        self,
+        tables: tuple[str, ...],
+        aliases: dict[str, str | None],
+        columns: tuple[str, ...],
+        aggregates: tuple[tuple[str, str], ...],
+        group_by: tuple[str, ...],
+        order_by: tuple[tuple[str, bool], ...],
+        date_ranges: tuple[DateRange, ...],
+        limit: int,
+        offset: int,
+        fingerprint: str,
+    ):
+        self.tables = tables
+        self.aliases = aliases
+        self.columns = columns
+        self.aggregates = aggregates
+        self.group_by = group_by
+        self.order_by = order_by
+        self.date_ranges = date_ranges
+        self.limit = limit
+        self.offset = offset
+        self.fingerprint = fingerprint
+
+    def __repr__(self):
+        return (
+            f"QueryMetadata(tables={self.tables}, aggregates={self.aggregates}, "
+            f"group_by={self.group_by}, date_ranges={self.date_ranges}, limit={self.limit})"
+        )
+
+
+# 以下ヘルパー関数たち。
+def _is_punct(token: Token, value: str) -> bool:
+    return token.kind == PUNCT and token.value == value
+
+
+def _skip_parens(tokens: list[Token], i: int) -> int:
+    """tokens[i] の "(" に対応する ")" の次の位置"""
+    depth = 0
+    for j in range(i, len(tokens)):
+        if _is_punct(tokens[j], "("):
+            depth += 1
+        elif _is_punct(tokens[j], ")"):
+            depth -= 1
+            if depth == 0:
+                return j + 1
+    return len(tokens)
+
+
+def _table_name(tokens: list[Token], i: int) -> tuple[str, int]:
+    """tokens[i] から始まるテーブル名（db.table も可）と、その次の位置"""
+    parts = [unquote_identifier(tokens[i].value).lower()]
+    i += 1
+    while (
+        i + 1 < len(tokens) and _is_punct(tokens[i], ".") and tokens[i + 1].kind in (WORD, QUOTED)
+    ):
+        parts.append(unquote_identifier(tokens[i + 1].value).lower())
+        i += 2
+    return ".".join(parts), i
+
+
+def _alias(tokens: list[Token], i: int) -> tuple[str | None, int]:
+    """テーブル参照の別名（AS 別名 / 別名）と、読み飛ばした位置（別名が無ければ (None, i)）"""
+    if i + 1 < len(tokens) and tokens[i].is_keyword("AS"):
+        return unquote_identifier(tokens[i + 1].value).lower(), i + 2
+    if i < len(tokens) and (
+        tokens[i].kind == QUOTED
+        or (tokens[i].kind == WORD and tokens[i].upper not in NOT_ALIAS_KEYWORDS)
+    ):
+        return unquote_identifier(tokens[i].value).lower(), i + 1
+    return None, i
+
+
+def _from_tables(tokens: list[Token], start: int) -> list[tuple[str | None, str | None]]:
+    """
+    FROM の直後（start）から FROM句の終わりまでにあるテーブル参照
+
+    カンマ区切り・JOIN・括弧で囲んだJOINのテーブルを含む。
+    派生テーブル（FROM (SELECT ...)）の中は読み飛ばす（中のFROMは別に走査される）。
+
+    Returns:
+        list[tuple[str | None, str | None]]: (テーブル名, 別名) のリスト
+            （派生テーブルのテーブル名はNone）
+    """
+    tables: list[tuple[str | None, str | None]] = []
+    # 開いている括弧ごとに、テーブル参照の並びを囲む括弧かどうか
+    parens: list[bool] = []
+    expect = True  # 次のトークンがテーブル参照の位置か
+    i = start
+    while i < len(tokens):
+        token = tokens[i]
+        if _is_punct(token, "("):
+            if expect and i + 1 < len(tokens) and tokens[i + 1].is_keyword("SELECT"):
+                alias, i = _alias(tokens, _skip_parens(tokens, i))
+                tables.append((None, alias))
+                expect = False
+                continue
+            parens.append(expect)
+        elif _is_punct(token, ")"):
+            if not parens:
+                break
+            parens.pop()
+        elif not parens and token.is_keyword(*FROM_CLAUSE_END):
+            break
+        elif _is_punct(token, ",") and (not parens or parens[-1]):
+            expect = True
+        elif token.is_keyword("JOIN", "STRAIGHT_JOIN"):
+            expect = True
+        elif expect and token.kind in (WORD, QUOTED):
+            name, i = _table_name(tokens, i)
+            alias, i = _alias(tokens, i)
+            tables.append((name, alias))
+            expect = False
+            continue
+        else:
+            expect = False
+        i += 1
     return tables
 
 
-def _extract_limit(query: str) -> int | None:
-    """LIMIT値を抽出"""
-    match = HAS_LIMIT_RE.search(query)
-    if match:
-        return int(match.group(1))
-    return None
+def _extract_tables(tokens: list[Token]) -> tuple[set[str], dict[str, str | None]]:
+    """
+    SQL中（サブクエリを含む）のFROM句・JOINにあるテーブル名と、参照名からテーブル名への対応
+
+    Returns:
+        tuple[set[str], dict[str, str | None]]: (テーブル名, 参照名 → テーブル名)。
+            参照名は別名とテーブル名。派生テーブルの別名は空文字に、
+            同じ別名が異なるテーブルを指す場合はNoneに対応させる
+    """
+    tables = set()
+    aliases: dict[str, str | None] = {}
+    functions: list[str] = []  # 開いている括弧の直前の関数名
+    for i, token in enumerate(tokens):
+        kind, value = token.kind, token.value
+        if kind == PUNCT and value == "(":
+            previous = tokens[i - 1] if i else None
+            functions.append(previous.upper if previous and previous.kind == WORD else "")
+        elif kind == PUNCT and value == ")":
+            if functions:
+                functions.pop()
+        elif kind == WORD and value.upper() == "FROM":
+            if not functions or functions[-1] not in FROM_ARGUMENT_FUNCTIONS:
+                for name, alias in _from_tables(tokens, i + 1):
+                    if name is not None:
+                        tables.add(name)
+                    for reference in (name, alias):
+                        if reference is not None:
+                            target = name or ""
+                            known = aliases.setdefault(reference, target)
+                            if known != target:
+                                aliases[reference] = None
+    return tables, aliases
+
+
+def _find_limit(tokens: list[Token]) -> tuple[Token | None, int, str]:
+    """
+    最上位のLIMIT句の行数と開始位置
+
+    Returns:
+        tuple[Token | None, int, str]: (行数のトークン, 開始位置, エラーメッセージ)。
+            LIMITが無い場合は (None, 0, "")
+    """
+    top = [token for _, token in top_level(tokens)]
+    positions = [i for i, token in enumerate(top) if token.is_keyword("LIMIT")]
+    if not positions:
+        return None, 0, ""
+    rest = top[positions[-1] + 1 :]
+    shape = ["n" if t.kind == NUMBER and t.value.isdigit() else t.upper for t in rest]
+    if shape == ["n"]:
+        return rest[0], 0, ""
+    if shape == ["n", ",", "n"]:
+        return rest[2], int(rest[0].value), ""
+    if shape == ["n", "OFFSET", "n"]:
+        return rest[0], int(rest[2].value), ""
+    return None, 0, _LIMIT_FORMAT
+
+
+def _clauses(tokens: list[Token]) -> dict[str, list[Token]]:
+    """最上位の句ごとのトークン列（UNION以降は含めない、同じ句は最初のもののみ）"""
+    clauses: dict[str, list[Token]] = {}
+    starts: list[tuple[str, int, int]] = []
+    top = top_level(tokens)
+    for pos, (i, token) in enumerate(top):
+        if token.is_keyword("UNION"):
+            starts.append(("UNION", i, i))
+            break
+        if token.is_keyword("GROUP", "ORDER"):
+            if pos + 1 < len(top) and top[pos + 1][1].is_keyword("BY"):
+                starts.append((token.upper, i, top[pos + 1][0] + 1))
+        elif token.is_keyword(*METADATA_CLAUSES):
+            starts.append((token.upper, i, i + 1))
+    for index, (name, _, body) in enumerate(starts):
+        end = starts[index + 1][1] if index + 1 < len(starts) else len(tokens)
+        clauses.setdefault(name, tokens[body:end])
+    clauses.pop("UNION", None)
+    return clauses
+
+
+def _aggregates(query: str, tokens: list[Token]) -> list[tuple[str, str]]:
+    """トークン列中の集計関数の呼び出し (関数名, 引数の表記)"""
+    found = []
+    for i, token in enumerate(tokens[:-1]):
+        if token.kind == WORD and token.upper in METADATA_AGGREGATE_FUNCTIONS:
+            if _is_punct(tokens[i + 1], "("):
+                end = _skip_parens(tokens, i + 1)
+                args = tokens[i + 2 : end - 1]
+                call = (token.upper, source_text(query, args) if args else "")
+                if call not in found:
+                    found.append(call)
+    return found
+
+
+def _date_ranges(query: str, where: list[Token]) -> list[DateRange]:
+    """WHERE句の最上位のANDで結合された日付列の範囲（列ごとに上限・下限をまとめる）"""
+    conjuncts = split_conjuncts(where)
+    if conjuncts is None:
+        return []
+    ranges: dict[str, DateRange] = {}
+    for conjunct in conjuncts:
+        bound = date_bound(query, conjunct)
+        if bound is None:
+            continue
+        column, low, high = bound
+        current = ranges.get(column.lower(), DateRange(column, None, None))
+        if low is not None and (current.start is None or low > current.start):
+            current = current._replace(start=low)
+        if high is not None and (current.end is None or high < current.end):
+            current = current._replace(end=high)
+        ranges[column.lower()] = current
+    return list(ranges.values())
+
+
+def _metadata(
+    query: str,
+    tokens: list[Token],
+    tables: set[str],
+    aliases: dict[str, str | None],
+    limit: int,
+    offset: int,
+    limit_added: bool,
+) -> QueryMetadata:
+    """チェック済みのトークン列からメタデータを作る"""
+    clauses = _clauses(tokens)
+
+    columns = []
+    select = clauses.get("SELECT", [])
+    if select and select[0].is_keyword("DISTINCT", "ALL", "DISTINCTROW"):
+        select = select[1:]
+    for item in split_tokens(select, ","):
+        if item:
+            expr, alias = split_alias(item)
+            columns.append(alias or column_name(expr) or source_text(query, expr))
+
+    aggregates = []
+    for name in ("SELECT", "HAVING", "ORDER"):
+        for call in _aggregates(query, clauses.get(name, [])):
+            if call not in aggregates:
+                aggregates.append(call)
+
+    group = clauses.get("GROUP", [])
+    if len(group) >= 2 and group[-2].is_keyword("WITH") and group[-1].is_keyword("ROLLUP"):
+        group = group[:-2]
+    group_by = [source_text(query, key) for key in split_tokens(group, ",") if key]
+
+    order_by = []
+    for key in split_tokens(clauses.get("ORDER", []), ","):
+        descending = bool(key) and key[-1].is_keyword("DESC")
+        if key and key[-1].is_keyword("ASC", "DESC"):
+            key = key[:-1]
+        if key:
+            order_by.append((source_text(query, key), descending))
+
+    where = clauses.get("WHERE", [])
+    return QueryMetadata(
+        tables=tuple(sorted(tables)),
+        aliases=aliases,
+        columns=tuple(columns),
+        aggregates=tuple(aggregates),
+        group_by=tuple(group_by),
+        order_by=tuple(order_by),
+        date_ranges=tuple(_date_ranges(query, where)) if where else (),
+        limit=limit,
+        offset=offset,
+        # LIMITを追加した場合も、チェック後のSQLの fingerprint() と同じ値にする
+        fingerprint=fingerprint_tokens(chain(tokens, _ADDED_LIMIT) if limit_added else tokens),
+    )
 
 
 # 実際にクエリチェックの判定をオブジェクトとして持つクラス。
 class QueryCheckResult:
     """クエリチェックの結果"""
 
-    def __init__(self, is_valid: bool, query: str = "", error: str = ""):
+    def __init__(
+        self,
+        is_valid: bool,
+        query: str = "",
+        error: str = "",
+        metadata: QueryMetadata | None = None,
+        error_code: str = "",
+    ):
         self.is_valid = is_valid
         self.query = query  # 修正後のクエリ（LIMITの追加など）
         self.error = error  # エラーメッセージ
+        self.metadata = metadata  # 解析結果（チェックに通った場合のみ）
+        # エラーの種類（ERROR_CODES のいずれか、チェックに通った場合は空文字）
+        self.error_code = error_code
 
     def __repr__(self):
         if self.is_valid:
@@ -93,56 +502,169 @@ class QueryCheckResult:
         return f"QueryCheckResult(valid=False, error='{self.error}')"
 
 
+class _CheckMemo:
+    """
+    SQLのハッシュごとのチェック結果（LRU）
+
+    チェック結果は ALLOWED_TABLES と default_limit / max_limit で決まるため、
+    これらの組（signature）が前回と異なれば全エントリを破棄する。
+    """
+
+    def __init__(self):
+        self._entries: OrderedDict[bytes, QueryCheckResult] = OrderedDict()
+        self._signature: tuple | None = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: bytes, signature: tuple) -> QueryCheckResult | None:
+        with self._lock:
+            if signature != self._signature:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._signature = signature
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: bytes, signature: tuple, result: QueryCheckResult, max_entries: int) -> None:
+        with self._lock:
+            if signature != self._signature:
+                return
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "max_entries": settings.query_check_cache_size,
+            }
+
+
+_memo = _CheckMemo()
+
+
+def get_query_check_stats() -> dict:
+    """
+    チェック結果のメモの統計を取得
+
+    Returns:
+        dict: hits, misses, hit_rate, evictions, invalidations, entries, max_entries
+    """
+    return _memo.stats()
+
+
+def clear_query_check_cache() -> None:
+    """チェック結果のメモを破棄"""
+    _memo.clear()
+
+
 # 実際にクエリチェックを処理する関数
 def check_query(query: str) -> QueryCheckResult:
     """
     SQLクエリの安全性とポリシー準拠をチェック
 
+    同じSQL（ALLOWED_TABLES・LIMITの設定も同じ）の結果はメモから返す。
+    返す QueryCheckResult は共有されるため、呼び出し側で変更しないこと。
+
     Args:
         query: チェックするSQLクエリ
     Returns:
-        QueryCheckResult: チェック結果
+        QueryCheckResult: チェック結果（チェックに通った場合は metadata に解析結果）
     """
+    max_entries = settings.query_check_cache_size
+    if max_entries <= 0:
+        return _check_query(query)
+
+    key = hashlib.blake2b(query.encode(), digest_size=16).digest()
+    signature = (ALLOWED_TABLES, settings.default_limit, settings.max_limit)
+    result = _memo.get(key, signature)
+    if result is None:
+        result = _check_query(query)
+        _memo.put(key, signature, result, max_entries)
+    return result
+
+
+def _check_query(query: str) -> QueryCheckResult:
+    """check_query の本体（メモを使わない）"""
     # 1. 基本的な正規化
     query = query.strip()
 
     # 2. 空クエリチェック
     if not query:
-        return QueryCheckResult(False, error="クエリが空です")
-
-    # 3. 複数文チェック（セミコロンが途中にある）
-    semicolon_count = query.count(";")
-    if semicolon_count > 1:
-        return QueryCheckResult(False, error="複数のSQL文は許可されていません")
-    if semicolon_count == 1 and not query.rstrip().endswith(";"):
-        return QueryCheckResult(False, error="複数のSQL文は許可されていません")
-
-    # 末尾のセミコロンを除去
-    query = query.rstrip(";").strip()
-
-    # 4. SELECTのみ許可
-    if not query.upper().startswith("SELECT"):
-        return QueryCheckResult(False, error="SELECT文のみ実行可能です")
-
-    # 5. DML/DDLの検出
-    if DENY_RE.search(query):
-        return QueryCheckResult(
-            False,
-            error="INSERT/UPDATE/DELETE/ALTER/DROP等のDML/DDL文は許可されていません",
-        )
-
-    # 6. 危険な構文の検出
-    if DANGEROUS_RE.search(query):
+        return QueryCheckResult(False, error="クエリが空です", error_code="empty")
+
+    # 3. トークン列への分解（コメント・解析できない文字の検出）
+    tokens: list[Token] = []
+    for token in tokenize(query):
+        if token.kind == COMMENT:
+            return QueryCheckResult(
+                False, error="SQLコメントや複数文の実行は許可されていません", error_code="comment"
+            )
+        if token.kind == OTHER:
+            return QueryCheckResult(
+                False,
+                error=f"SQLを解析できませんでした（{token.start}文字目: {token.value}）",
+                error_code="parse",
+            )
+        if token.kind != WS:
+            tokens.append(token)
+
+    # 4. 複数文チェック（末尾以外のセミコロン）、末尾のセミコロンを除去
+    semicolons = [i for i, token in enumerate(tokens) if token.value == ";" and token.kind == PUNCT]
+    if semicolons and semicolons[0] != len(tokens) - 1:
         return QueryCheckResult(
-            False,
-            error="SQLコメントや複数文の実行は許可されていません",
+            False, error="複数のSQL文は許可されていません", error_code="multiple_statements"
         )
+    if semicolons:
+        query = query[: tokens.pop().start].rstrip()
+
+    # 5. SELECTのみ許可
+    if not tokens or not tokens[0].is_keyword("SELECT"):
+        return QueryCheckResult(False, error="SELECT文のみ実行可能です", error_code="not_select")
+
+    # 6. DML/DDLの検出（INSERT() / REPLACE() の文字列関数は除く）
+    for i, token in enumerate(tokens):
+        if token.kind == WORD and token.upper in DENY_KEYWORDS:
+            if token.upper in FUNCTION_KEYWORDS and i + 1 < len(tokens):
+                if _is_punct(tokens[i + 1], "("):
+                    continue
+            return QueryCheckResult(
+                False,
+                error="INSERT/UPDATE/DELETE/ALTER/DROP等のDML/DDL文は許可されていません",
+                error_code="dml",
+            )
 
     # 7. テーブル名の抽出と検証
-    tables = _extract_tables(query)
+    tables, aliases = _extract_tables(tokens)
 
     if not tables:
-        return QueryCheckResult(False, error="テーブル名を特定できませんでした")
+        return QueryCheckResult(
+            False, error="テーブル名を特定できませんでした", error_code="no_table"
+        )
 
     # 許可されていないテーブルへのアクセスチェック
     disallowed = tables - ALLOWED_TABLES
@@ -150,16 +672,167 @@ def check_query(query: str) -> QueryCheckResult:
         return QueryCheckResult(
             False,
             error=f"アクセスが許可されていないテーブル: {', '.join(sorted(disallowed))}",
+            error_code="disallowed_table",
         )
 
     # 8. LIMIT句の処理
-    current_limit = _extract_limit(query)
-
-    if current_limit is None:
+    count, offset, error = _find_limit(tokens)
+    if error:
+        return QueryCheckResult(False, error=error, error_code="limit_format")
+
+    # 9. メタデータの作成（LIMITの書き換え前のSQLの表記を使う）
+    if count is None:
+        limit = settings.default_limit
+    else:
+        limit = min(int(count.value), settings.max_limit)
+    metadata = _metadata(query, tokens, tables, aliases, limit, offset, count is None)
+
+    if count is None:
         # LIMITがない場合はデフォルトを追加
         query = f"{query} LIMIT {settings.default_limit}"
-    elif current_limit > settings.max_limit:
-        # 最大値を超えている場合は制限
-        query = HAS_LIMIT_RE.sub(f"LIMIT {settings.max_limit}", query)
+    elif int(count.value) > settings.max_limit:
+        # 最大値を超えている場合は行数だけを制限（開始位置は残す）
+        end = count.start + len(count.value)
+        query = f"{query[: count.start]}{settings.max_limit}{query[end:]}"
+
+    return QueryCheckResult(True, query=query, metadata=metadata)
+
 
-    return QueryCheckResult(True, query=query)
+# 以下、生成SQLのコーパスの一括チェック
+class CheckRecord(NamedTuple):
+    """
+    一括チェックの1件分の結果
+
+    Attributes:
+        index: 入力での位置（0始まり）
+        is_valid: チェックに通ったか
+        query: 修正後のクエリ（チェックに通らなかった場合は空文字）
+        tables: 参照するテーブル名（チェックに通った場合のみ）
+        error_code: エラーの種類（ERROR_CODES のいずれか）
+        error: エラーメッセージ
+    """
+
+    index: int
+    is_valid: bool
+    query: str
+    tables: tuple[str, ...]
+    error_code: str
+    error: str
+
+
+class CheckStats:
+    """
+    一括チェックの集計
+
+    Attributes:
+        total: チェックした件数
+        valid: チェックに通った件数
+        errors: エラーの種類ごとの件数
+        tables: テーブルごとの参照件数（チェックに通ったSQLのみ）
+    """
+
+    __slots__ = ("total", "valid", "errors", "tables")
+
+    def __init__(self):
+        self.total = 0
+        self.valid = 0
+        self.errors: Counter[str] = Counter()
+        self.tables: Counter[str] = Counter()
+
+    def add(self, record: CheckRecord) -> None:
+        self.total += 1
+        if record.is_valid:
+            self.valid += 1
+            self.tables.update(record.tables)
+        else:
+            self.errors[record.error_code] += 1
+
+    @property
+    def valid_rate(self) -> float:
+        return self.valid / self.total if self.total else 0.0
+
+    def as_dict(self) -> dict:
+        """
+        集計を辞書で取得
+
+        Returns:
+            dict: total, valid, invalid, valid_rate, errors, tables
+        """
+        return {
+            "total": self.total,
+            "valid": self.valid,
+            "invalid": self.total - self.valid,
+            "valid_rate": self.valid_rate,
+            "errors": dict(self.errors.most_common()),
+            "tables": dict(self.tables.most_common()),
+        }
+
+    def __repr__(self):
+        return f"CheckStats(total={self.total}, valid={self.valid}, errors={dict(self.errors)})"
+
+
+def _to_record(index: int, result: QueryCheckResult) -> CheckRecord:
+    tables = result.metadata.tables if result.metadata is not None else ()
+    return CheckRecord(
+        index, result.is_valid, result.query, tables, result.error_code, result.error
+    )
+
+
+def _check_chunk(start: int, queries: list[str]) -> list[CheckRecord]:
+    """プロセスプールのワーカーで実行する1チャンク分のチェック"""
+    return [_to_record(start + i, _check_query(query)) for i, query in enumerate(queries)]
+
+
+def _chunks(queries: Iterable[str], chunksize: int) -> Iterator[tuple[int, list[str]]]:
+    iterator = iter(queries)
+    start = 0
+    while chunk := list(islice(iterator, chunksize)):
+        yield start, chunk
+        start += len(chunk)
+
+
+def check_queries(
+    queries: Iterable[str],
+    workers: int | None = None,
+    chunksize: int = 256,
+    stats: CheckStats | None = None,
+) -> Iterator[CheckRecord]:
+    """
+    SQLをまとめてチェック
+
+    入力の順に結果を返すジェネレータ。入力は必要な分だけ読み進めるため、
+    ログファイルの行などを逐次渡せる。
+    エージェントが使うメモを押し流さないよう、check_query のメモは使わない。
+
+    Args:
+        queries: チェックするSQL
+        workers: プロセスプールのワーカー数（None / 1以下ならこのプロセスで順にチェック）。
+            ワーカーは起動時の ALLOWED_TABLES・設定でチェックする
+        chunksize: ワーカーに1回で渡す件数
+        stats: 指定した場合、返した結果をこの集計に加える
+
+    Yields:
+        CheckRecord: 1件分の結果
+    """
+    if workers is None or workers <= 1:
+        records = (_to_record(i, _check_query(query)) for i, query in enumerate(queries))
+        for record in records:
+            if stats is not None:
+                stats.add(record)
+            yield record
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # 投入するチャンクをワーカー数の2倍までに抑え、入力を読み進めすぎない
+        pending: deque[Future] = deque()
+        chunks = _chunks(queries, chunksize)
+        for start, chunk in islice(chunks, workers * 2):
+            pending.append(executor.submit(_check_chunk, start, chunk))
+        while pending:
+            records = pending.popleft().result()
+            for start, chunk in islice(chunks, 1):
+                pending.append(executor.submit(_check_chunk, start, chunk))
+            for record in records:
+                if stats is not None:
+                    stats.add(record)
+                yield record
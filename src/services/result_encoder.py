@@ -0,0 +1,233 @@
+"""
+SQL実行結果のエンコーダ
+回答プロンプトに渡す実行結果を、形式を選んで文字列に変換します
+
+- json: 行ごとのオブジェクトの配列（従来の形式）
+- json_columnar: 列名を1回だけ持つ {"columns": [...], "rows": [[...], ...]}
+- csv / tsv: ヘッダ1行 + データ行
+- markdown: Markdownの表
+"""
+
+import csv
+import datetime
+import io
+import json
+from collections.abc import Callable, Iterable
+from decimal import Decimal
+
+from src.external.db.columnar import ColumnarResult
+
+try:
+    import orjson
+except ImportError:  # orjsonが無い環境では標準のjsonを使う
+    orjson = None
+
+
+# 以下ヘルパー関数たち。
+def _to_columns(batch) -> tuple[list[str], list[list]]:
+    """行の辞書のリストまたはColumnarResultを (列名, 列ごとの値) に変換"""
+    if isinstance(batch, ColumnarResult):
+        return batch.columns, batch.arrays
+    if not batch:
+        return [], []
+    columns = list(batch[0])
+    return columns, [list(values) for values in zip(*(row.values() for row in batch))]
+
+
+# JSONにそのまま出力できる型（orjsonは日付・時刻も出力できる）
+_JSON_NATIVE_TYPES = {str, int, float, bool}
+_ORJSON_NATIVE_TYPES = _JSON_NATIVE_TYPES | {datetime.date, datetime.datetime, datetime.time}
+
+
+def _json_default(value):
+    """JSONで表現できない値の変換（Decimalは数値、バイト列はUTF-8の文字列、その他は文字列）"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode("utf-8", errors="replace")
+    return str(value)
+
+
+def _json_column(values):
+    """
+    JSONで表現できない型の列を列単位で変換
+
+    値ごとに default= のフォールバックを呼ばないよう、列の全ての値の型から変換が必要か判定し、
+    必要な列だけ _json_default でまとめて変換する（int と Decimal が混在する列なども扱える）。
+    """
+    native = _ORJSON_NATIVE_TYPES if orjson is not None else _JSON_NATIVE_TYPES
+    types = {type(value) for value in values}
+    types.discard(type(None))
+    if types <= native:
+        return values
+    return [
+        value if value is None or type(value) in native else _json_default(value)
+        for value in values
+    ]
+
+
+def _dumps(value) -> str:
+    if orjson is not None:
+        return orjson.dumps(value, default=_json_default).decode()
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_json_default)
+
+
+def _encode_json_rows(columns: list[str], values: list[list]) -> str:
+    converted = [_json_column(column) for column in values]
+    return _dumps([dict(zip(columns, row)) for row in zip(*converted)])[1:-1]
+
+
+def _encode_json_columnar_rows(columns: list[str], values: list[list]) -> str:
+    converted = [_json_column(column) for column in values]
+    return _dumps(list(zip(*converted)))[1:-1]
+
+
+def _encode_delimited_rows(delimiter: str) -> Callable[[list[str], list[list]], str]:
+    def encode(columns: list[str], values: list[list]) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer, delimiter=delimiter, lineterminator="\n").writerows(zip(*values))
+        return buffer.getvalue().rstrip("\n")
+
+    return encode
+
+
+def _delimited_header(delimiter: str) -> Callable[[list[str]], str]:
+    def header(columns: list[str]) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer, delimiter=delimiter, lineterminator="").writerow(columns)
+        return buffer.getvalue()
+
+    return header
+
+
+def _markdown_cell(value) -> str:
+    if value is None:
+        return ""
+    return str(value).replace("|", "\\|").replace("\n", " ")
+
+
+def _encode_markdown_rows(columns: list[str], values: list[list]) -> str:
+    return "\n".join(f"| {' | '.join(map(_markdown_cell, row))} |" for row in zip(*values))
+
+
+def _markdown_header(columns: list[str]) -> str:
+    return f"| {' | '.join(map(_markdown_cell, columns))} |\n|{'---|' * len(columns)}"
+
+
+class ResultEncoder:
+    """
+    実行結果のエンコーダ
+
+    バッチごとに encode_rows で断片を作り、join で1つの文字列にまとめるため、
+    ストリーミング実行の結果も全行を保持せずに変換できる。
+
+    Attributes:
+        name: 形式名
+    """
+
+    def __init__(
+        self,
+        name: str,
+        encode_rows: Callable[[list[str], list[list]], str],
+        header: Callable[[list[str]], str] | None = None,
+        join: Callable[[str | None, list[str], list[str]], str] | None = None,
+    ):
+        self.name = name
+        self.encode_rows = encode_rows
+        self.header = header
+        self._join = join
+
+    def join(self, columns: list[str], chunks: list[str]) -> str:
+        """断片を1つの文字列にまとめる"""
+        header = self.header(columns) if self.header and columns else None
+        if self._join is not None:
+            return self._join(header, columns, chunks)
+        return "\n".join(part for part in [header, *chunks] if part)
+
+
+ENCODERS: dict[str, ResultEncoder] = {}
+
+
+def register_encoder(encoder: ResultEncoder) -> None:
+    """エンコーダを登録（同名のものは置き換える）"""
+    ENCODERS[encoder.name] = encoder
+
+
+register_encoder(
+    ResultEncoder(
+        "json",
+        _encode_json_rows,
+        join=lambda header, columns, chunks: f"[{','.join(c for c in chunks if c)}]",
+    )
+)
+register_encoder(
+    ResultEncoder(
+        "json_columnar",
+        _encode_json_columnar_rows,
+        join=lambda header, columns, chunks: (
+            f'{{"columns":{_dumps(columns)},"rows":[{",".join(c for c in chunks if c)}]}}'
+        ),
+    )
+)
+register_encoder(ResultEncoder("csv", _encode_delimited_rows(","), _delimited_header(",")))
+register_encoder(ResultEncoder("tsv", _encode_delimited_rows("\t"), _delimited_header("\t")))
+register_encoder(ResultEncoder("markdown", _encode_markdown_rows, _markdown_header))
+
+
+def get_encoder(name: str) -> ResultEncoder:
+    """
+    形式名からエンコーダを取得
+
+    Raises:
+        ValueError: 未登録の形式の場合
+    """
+    try:
+        return ENCODERS[name]
+    except KeyError:
+        raise ValueError(f"未対応の結果形式です: {name}") from None
+
+
+class ResultFormatter:
+    """
+    実行結果をバッチ単位で受け取り、指定した形式の文字列にする
+
+    Attributes:
+        row_count: 受け取った行数
+    """
+
+    def __init__(self, fmt: str):
+        self.encoder = get_encoder(fmt)
+        self.row_count = 0
+        self._columns: list[str] = []
+        self._chunks: list[str] = []
+
+    def add(self, batch: list[dict] | ColumnarResult) -> None:
+        """行のバッチ（行の辞書のリストまたはColumnarResult）を追加"""
+        columns, values = _to_columns(batch)
+        if not columns:
+            return
+        if not self._columns:
+            self._columns = columns
+        self.row_count += len(batch)
+        self._chunks.append(self.encoder.encode_rows(columns, values))
+
+    def render(self) -> str:
+        """追加された全行を1つの文字列にする"""
+        return self.encoder.join(self._columns, self._chunks)
+
+
+def encode_result(batches: Iterable[list[dict] | ColumnarResult], fmt: str = "json") -> str:
+    """
+    実行結果を指定した形式の文字列に変換
+
+    Args:
+        batches: 行のバッチ（行の辞書のリストまたはColumnarResult）
+        fmt: 形式名（json / json_columnar / csv / tsv / markdown）
+
+    Returns:
+        str: 変換した文字列
+    """
+    formatter = ResultFormatter(fmt)
+    for batch in batches:
+        formatter.add(batch)
+    return formatter.render()
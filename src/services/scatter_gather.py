@@ -0,0 +1,93 @@
+"""
+日付範囲の集計クエリのscatter-gather実行
+期間をシャードに分割して別々のプール接続で並列に部分集計を実行し、Python側でマージします
+
+MySQLは1つのクエリを1スレッドで処理するため、長い期間の集計では期間ごとに
+分けて並列に実行したほうが速い。部分集計の行数が上限に達した（マージすると
+結果が欠ける可能性がある）場合は、分割せずに通常どおり実行する。
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from src.external.db.session import execute_sql, execute_sql_async
+from src.services.aggregate_query import AggregatePlan, plan_aggregate
+from src.settings import settings
+
+
+# 以下ヘルパー関数たち。
+def _plan(query: str) -> AggregatePlan | None:
+    """分割して実行する価値のある集計であれば計画を返す"""
+    if not settings.scatter_gather_enabled or settings.scatter_gather_shards < 2:
+        return None
+    plan = plan_aggregate(query)
+    if plan is None or (plan.end - plan.start).days + 1 < settings.scatter_gather_min_days:
+        return None
+    return plan
+
+
+def _shard_requests(plan: AggregatePlan) -> list[tuple[str, dict]]:
+    query = plan.shard_query(settings.max_limit)
+    return [
+        (query, {"shard_start": start, "shard_end": end})
+        for start, end in plan.shard_ranges(settings.scatter_gather_shards)
+    ]
+
+
+def _gather(plan: AggregatePlan, results: list[dict]) -> dict | None:
+    """部分集計の結果をマージ（部分集計が上限に達していればNone）"""
+    for result in results:
+        if not result["success"]:
+            return result
+        if result["row_count"] >= settings.max_limit:
+            return None
+
+    rows = plan.merge([result["data"] for result in results])
+    return {"success": True, "data": rows, "row_count": len(rows), "shards": len(results)}
+
+
+def execute_scatter_gather(query: str) -> dict | None:
+    """
+    集計クエリを期間で分割して並列に実行
+
+    Args:
+        query: チェック済みのSQL
+
+    Returns:
+        dict | None: execute_sql と同じ形式の実行結果（shards: 分割数）。
+            分割できない、または分割すると結果が欠ける可能性がある場合はNone
+            （呼び出し側で通常どおり実行すること）
+    """
+    plan = _plan(query)
+    if plan is None:
+        return None
+
+    requests = _shard_requests(plan)
+    with ThreadPoolExecutor(max_workers=len(requests), thread_name_prefix="shard") as executor:
+        results = list(
+            executor.map(
+                lambda request: execute_sql(request[0], settings.max_limit, params=request[1]),
+                requests,
+            )
+        )
+    return _gather(plan, results)
+
+
+async def execute_scatter_gather_async(query: str) -> dict | None:
+    """
+    集計クエリを期間で分割して並列に実行（非同期版）
+
+    Returns:
+        dict | None: execute_scatter_gather と同じ形式の実行結果
+    """
+    plan = _plan(query)
+    if plan is None:
+        return None
+
+    results = await asyncio.gather(
+        *(
+            execute_sql_async(shard_query, settings.max_limit, params=params)
+            for shard_query, params in _shard_requests(plan)
+        )
+    )
+    return _gather(plan, list(results))
@@ -0,0 +1,177 @@
+"""
+SQLトークナイザ
+1回の走査でSQLをトークン列に分解します（MySQLの字句規則に準拠）
+"""
+
+import re
+from typing import NamedTuple
+
+# トークンの種類
+WS = "ws"  # 空白
+COMMENT = "comment"  # コメント（-- / # / /* */）
+STRING = "string"  # 文字列リテラル（'...' / "..."）
+QUOTED = "quoted"  # バッククォートで囲まれた識別子
+NUMBER = "number"  # 数値リテラル
+WORD = "word"  # キーワード・識別子・関数名
+PARAM = "param"  # プレースホルダ・ユーザー変数
+OP = "op"  # 演算子
+PUNCT = "punct"  # ( ) , . ;
+OTHER = "other"  # 上記以外（閉じられていない引用符など）
+
+TOKEN_RE = re.compile(
+    rf"""
+    (?P<{WS}>\s+)
+    |(?P<{COMMENT}>--[^\n]*|\#[^\n]*|/\*.*?(?:\*/|\Z))
+    |(?P<{STRING}>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+    |(?P<{QUOTED}>`(?:[^`]|``)*`)
+    |(?P<{NUMBER}>0[xX][0-9a-fA-F]+|(?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?(?![\w]))
+    |(?P<{WORD}>[^\W\d]\w*|\d+[^\W\d]\w*)
+    |(?P<{PARAM}>\?|:\w+|%s|@@?\w+)
+    |(?P<{OP}><=>|<=|>=|<>|!=|\|\||&&|:=|[-+*/%=<>!~^&|])
+    |(?P<{PUNCT}>[(),.;])
+    |(?P<{OTHER}>.)
+    """,
+    re.S | re.X,
+)
+
+# MySQLの文字列リテラル中のエスケープ
+_ESCAPES = {
+    "0": "\0",
+    "b": "\b",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+    "Z": "\x1a",
+    "%": "\\%",
+    "_": "\\_",
+}
+_ESCAPE_RE = re.compile(r"\\(.)|''|\"\"", re.S)
+
+
+class Token(NamedTuple):
+    """SQLのトークン"""
+
+    kind: str
+    value: str
+    start: int
+
+    @property
+    def upper(self) -> str:
+        """キーワード比較用の大文字表記（WORD以外は値そのまま）"""
+        return self.value.upper() if self.kind == WORD else self.value
+
+    def is_keyword(self, *keywords: str) -> bool:
+        """指定したキーワードのいずれかか"""
+        return self.kind == WORD and self.value.upper() in keywords
+
+
+_new_token = tuple.__new__
+
+
+def tokenize(query: str) -> list[Token]:
+    """
+    SQLをトークン列に分解（空白・コメントも含む）
+
+    Args:
+        query: SQL
+
+    Returns:
+        list[Token]: トークン列
+    """
+    # NamedTupleの__new__を経由せずに生成する（トークン数が多いため）
+    return [
+        _new_token(Token, (match.lastgroup, match.group(), match.start()))
+        for match in TOKEN_RE.finditer(query)
+    ]
+
+
+def significant(tokens: list[Token]) -> list[Token]:
+    """空白とコメントを除いたトークン列"""
+    return [token for token in tokens if token.kind not in (WS, COMMENT)]
+
+
+def top_level(tokens: list[Token]) -> list[tuple[int, Token]]:
+    """
+    括弧の外（最上位）にあるトークン
+
+    Args:
+        tokens: トークン列（significant() を通したもの）
+
+    Returns:
+        list[tuple[int, Token]]: (tokens 内の位置, トークン) のリスト（括弧自体は含まない）
+    """
+    depth = 0
+    result = []
+    for i, token in enumerate(tokens):
+        if token.value == "(" and token.kind == PUNCT:
+            depth += 1
+        elif token.value == ")" and token.kind == PUNCT:
+            depth -= 1
+        elif depth == 0:
+            result.append((i, token))
+    return result
+
+
+def source_text(query: str, tokens: list[Token]) -> str:
+    """トークン列に対応する元のSQLの部分文字列"""
+    return query[tokens[0].start : tokens[-1].start + len(tokens[-1].value)]
+
+
+def split_tokens(tokens: list[Token], separator: str) -> list[list[Token]]:
+    """最上位の区切り（カンマなど）でトークン列を分割"""
+    parts: list[list[Token]] = [[]]
+    depth = 0
+    for token in tokens:
+        if token.kind == PUNCT and token.value == "(":
+            depth += 1
+        elif token.kind == PUNCT and token.value == ")":
+            depth -= 1
+        if depth == 0 and token.kind == PUNCT and token.value == separator:
+            parts.append([])
+        else:
+            parts[-1].append(token)
+    return parts
+
+
+def column_name(tokens: list[Token]) -> str | None:
+    """列の参照（テーブル名.列名 も可）なら列名、そうでなければNone"""
+    names = tokens[::2]
+    dots = tokens[1::2]
+    if (
+        not names
+        or len(names) != len(dots) + 1
+        or any(name.kind not in (WORD, QUOTED) for name in names)
+        or any(dot.value != "." for dot in dots)
+    ):
+        return None
+    return unquote_identifier(names[-1].value)
+
+
+def _alias_name(token: Token) -> str:
+    return unquote_string(token.value) if token.kind == STRING else unquote_identifier(token.value)
+
+
+def split_alias(tokens: list[Token]) -> tuple[list[Token], str | None]:
+    """SELECT句の項目を (式, 別名) に分ける"""
+    if len(tokens) >= 3 and tokens[-2].is_keyword("AS"):
+        return tokens[:-2], _alias_name(tokens[-1])
+    if len(tokens) >= 2 and tokens[-1].kind in (WORD, QUOTED) and tokens[-2].value != ".":
+        if tokens[-2].value == ")" or tokens[-2].kind in (WORD, QUOTED, NUMBER, STRING):
+            return tokens[:-1], _alias_name(tokens[-1])
+    return tokens, None
+
+
+def unquote_string(literal: str) -> str:
+    """文字列リテラルの引用符とエスケープを外した値"""
+    body = literal[1:-1]
+    return _ESCAPE_RE.sub(
+        lambda m: literal[0] if m.group(1) is None else _ESCAPES.get(m.group(1), m.group(1)),
+        body,
+    )
+
+
+def unquote_identifier(name: str) -> str:
+    """バッククォートを外した識別子"""
+    if name.startswith("`") and name.endswith("`"):
+        return name[1:-1].replace("``", "`")
+    return name
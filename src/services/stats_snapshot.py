@@ -0,0 +1,617 @@
+"""
+日次実績テーブルのインメモリスナップショット
+campaign_daily_stats などの日次実績をプロセス内にNumPyの列（キーの番号・日付・指標）で保持し、
+単純な集計クエリにはDBへ問い合わせず、ベクトル化したGROUP BYで回答します
+
+集計できるクエリの形は aggregate_query.plan_aggregate と同じ（日付範囲の指定が必須）。
+スナップショットは MAX(date) が進んだときに、それまでの最終日以降の行だけを読み込み直す。
+過去の日付の行の修正は反映されない（結果キャッシュのウォーターマークと同じ前提）。
+"""
+
+import asyncio
+import datetime
+import threading
+from array import array
+from decimal import Decimal
+
+import numpy as np
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.external.db.admission import AdmissionRejected
+from src.external.db.columnar import ColumnarResult
+from src.external.db.result_cache import WatermarkTracker
+from src.external.db.session import fetch_columnar
+from src.services.aggregate_query import DATE_COLUMN, AggregatePlan, plan_aggregate
+from src.services.sql_tokenizer import (
+    NUMBER,
+    OP,
+    PUNCT,
+    QUOTED,
+    WORD,
+    Token,
+    significant,
+    tokenize,
+    unquote_identifier,
+)
+from src.settings import settings
+
+# スナップショットにできるテーブルと、行を識別するキー列（キー列と date で一意）
+SNAPSHOT_TABLES = {
+    "campaign_daily_stats": "campaign_id",
+    "display_ad_daily_stats": "ad_id",
+}
+
+# 保持する指標の列と小数部の桁数（DECIMALは10**桁数倍した整数で保持し、合計を正確に保つ）
+METRIC_COLUMNS = {
+    "impressions": 0,
+    "clicks": 0,
+    "cost": 2,
+    "conversions": 2,
+    "conversion_value": 2,
+}
+
+# WHERE句の条件で使える比較演算子
+_COMPARISONS = {
+    "=": np.equal,
+    "!=": np.not_equal,
+    "<>": np.not_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+}
+
+_EPOCH = datetime.date(1970, 1, 1)
+
+
+class IncompleteSnapshot(Exception):
+    """読み込んだ行数がテーブルの行数（COUNT(*)）に満たない"""
+
+
+class _Columns:
+    """スナップショットの内容（更新時は作り直して差し替え、作成後は変更しない）"""
+
+    __slots__ = ("keys", "index", "codes", "days", "values", "valid")
+
+    def __init__(
+        self,
+        keys: np.ndarray,
+        index: dict[int, int],
+        codes: np.ndarray,
+        days: np.ndarray,
+        values: dict[str, np.ndarray],
+        valid: dict[str, np.ndarray | None],
+    ):
+        self.keys = keys  # キーの番号 → キーの値
+        self.index = index  # キーの値 → キーの番号
+        self.codes = codes  # 行ごとのキーの番号
+        self.days = days  # 行ごとの日付（1970-01-01からの日数、昇順）
+        self.values = values  # 指標の列 → 値
+        self.valid = valid  # 指標の列 → NULLでない行（NULLを含まない列はNone）
+
+
+# 以下ヘルパー関数たち。
+def _epoch_day(value: datetime.date) -> int:
+    return (value - _EPOCH).days
+
+
+def _to_date(day: int) -> datetime.date:
+    return _EPOCH + datetime.timedelta(days=day)
+
+
+def _epoch_days(values: array | list) -> np.ndarray:
+    """日付の列（date / ISO文字列）を1970-01-01からの日数に変換"""
+    return np.array(values, dtype="datetime64[D]").astype(np.int64)
+
+
+def _scaled(values: array | list, scale: int) -> tuple[np.ndarray, np.ndarray | None]:
+    """指標の列を 10**scale 倍した整数の配列と、NULLでない行のマスクに変換"""
+    valid = None
+    if not isinstance(values, array):
+        valid = np.fromiter((value is not None for value in values), dtype=bool, count=len(values))
+        values = [0 if value is None else value for value in values]
+        if valid.all():
+            valid = None
+    numbers = np.asarray(values, dtype=np.float64)
+    return np.rint(numbers * 10**scale).astype(np.int64), valid
+
+
+def _unscaled(value: int, scale: int):
+    """整数で保持したDECIMAL列の値を、ドライバの変換（db_decimal_mode）と同じ型に戻す"""
+    if scale == 0:
+        return value
+    if settings.db_decimal_mode == "float":
+        return value / 10**scale
+    return Decimal(value).scaleb(-scale)
+
+
+def _concat(head: np.ndarray | None, tail: np.ndarray | None, sizes: tuple[int, int]):
+    """NULLマスク同士を連結（どちらもNoneならNone）"""
+    if head is None and tail is None:
+        return None
+    head = np.ones(sizes[0], dtype=bool) if head is None else head
+    tail = np.ones(sizes[1], dtype=bool) if tail is None else tail
+    return np.concatenate([head, tail])
+
+
+def _extend(
+    base: _Columns | None, result: ColumnarResult, key_column: str, since: int | None
+) -> _Columns:
+    """base の since 日以降の行を、読み込んだ行で置き換えた内容を作る"""
+    days = _epoch_days(result.column(DATE_COLUMN))
+    order = np.argsort(days, kind="stable")
+    days = days[order]
+    key_values = np.asarray(result.column(key_column), dtype=np.int64)[order]
+
+    # 新しいキーには続きの番号を割り当てる
+    index = dict(base.index) if base is not None else {}
+    unique, inverse = np.unique(key_values, return_inverse=True)
+    added = [key for key in unique.tolist() if key not in index]
+    for key in added:
+        index[key] = len(index)
+    keys = np.concatenate(
+        [base.keys if base is not None else np.empty(0, dtype=np.int64), np.array(added, np.int64)]
+    )
+    codes = np.array([index[key] for key in unique.tolist()], dtype=np.int64)[inverse]
+
+    keep = 0 if base is None or since is None else int(np.searchsorted(base.days, since))
+    values: dict[str, np.ndarray] = {}
+    valid: dict[str, np.ndarray | None] = {}
+    for column, scale in METRIC_COLUMNS.items():
+        scaled, mask = _scaled(result.column(column), scale)
+        scaled = scaled[order]
+        mask = mask[order] if mask is not None else None
+        if base is None:
+            values[column], valid[column] = scaled, mask
+        else:
+            values[column] = np.concatenate([base.values[column][:keep], scaled])
+            old = base.valid[column]
+            valid[column] = _concat(
+                old[:keep] if old is not None else None, mask, (keep, len(scaled))
+            )
+
+    if base is not None:
+        codes = np.concatenate([base.codes[:keep], codes])
+        days = np.concatenate([base.days[:keep], days])
+    return _Columns(keys, index, codes, days, values, valid)
+
+
+def _column_name(tokens: list[Token], qualifiers: set[str]) -> str | None:
+    """列の参照（テーブル名または別名で修飾しても可）なら小文字の列名"""
+    names = [token for token in tokens if token.kind in (WORD, QUOTED)]
+    if len(tokens) == 1 and len(names) == 1:
+        return unquote_identifier(names[0].value).lower()
+    if len(tokens) == 3 and len(names) == 2 and tokens[1].value == ".":
+        if unquote_identifier(names[0].value).lower() in qualifiers:
+            return unquote_identifier(names[1].value).lower()
+    return None
+
+
+def _number(tokens: list[Token]) -> float | None:
+    """数値リテラル（符号付きも可）"""
+    sign = 1
+    if len(tokens) == 2 and tokens[0].kind == OP and tokens[0].value in ("+", "-"):
+        sign = -1 if tokens[0].value == "-" else 1
+        tokens = tokens[1:]
+    if len(tokens) != 1 or tokens[0].kind != NUMBER or tokens[0].value.lower().startswith("0x"):
+        return None
+    return sign * float(tokens[0].value)
+
+
+def _numbers(tokens: list[Token]) -> list[float] | None:
+    """( 数値, 数値, ... ) のリスト"""
+    if len(tokens) < 3 or tokens[0].value != "(" or tokens[-1].value != ")":
+        return None
+    items: list[list[Token]] = [[]]
+    for token in tokens[1:-1]:
+        if token.kind == PUNCT and token.value == ",":
+            items.append([])
+        else:
+            items[-1].append(token)
+    numbers = [_number(item) for item in items]
+    return None if any(number is None for number in numbers) else numbers
+
+
+def _group(components: list[tuple[np.ndarray, int]], rows: int) -> tuple[np.ndarray, list, int]:
+    """
+    行をGROUP BYのキーでグループに分ける
+
+    Args:
+        components: キーごとの (行ごとの値の番号, 番号の種類数)
+        rows: 対象の行数
+
+    Returns:
+        tuple: (行ごとのグループ番号, キーごとのグループの値の番号, グループ数)
+    """
+    if not components:
+        return np.zeros(rows, dtype=np.int64), [], 1 if rows else 0
+
+    # 番号を混合基数で1つの整数にまとめてから一意化する
+    combined = np.zeros(rows, dtype=np.int64)
+    for ids, size in components:
+        combined = combined * size + ids
+    unique, inverse = np.unique(combined, return_inverse=True)
+
+    decoded = []
+    for _, size in reversed(components):
+        decoded.append(unique % size)
+        unique = unique // size
+    return inverse, decoded[::-1], len(decoded[0])
+
+
+def _aggregate(
+    func: str, values: np.ndarray, valid: np.ndarray | None, inverse: np.ndarray, groups: int
+) -> tuple[list, list]:
+    """
+    グループごとの集計
+
+    Returns:
+        tuple[list, list]: (集計値, 集計した行数)。集計した行が無いグループの集計値は0
+    """
+    if valid is not None:
+        inverse, values = inverse[valid], values[valid]
+    counts = np.bincount(inverse, minlength=groups)
+    if func == "COUNT":
+        return counts.tolist(), counts.tolist()
+    if func == "SUM":
+        totals = np.zeros(groups, dtype=np.int64)
+        np.add.at(totals, inverse, values)
+    else:
+        totals = np.full(groups, values.max(initial=0) if func == "MIN" else values.min(initial=0))
+        (np.minimum if func == "MIN" else np.maximum).at(totals, inverse, values)
+        totals[counts == 0] = 0
+    return totals.tolist(), counts.tolist()
+
+
+class StatsSnapshot:
+    """
+    1つの日次実績テーブルのスナップショット
+
+    Attributes:
+        table: テーブル名
+        key_column: 行を識別するキー列（例: campaign_id）
+        loads: テーブル全体を読み込んだ回数
+        refreshes: 差分を読み込んだ回数
+        answered: スナップショットで回答した集計の数
+    """
+
+    def __init__(
+        self,
+        table: str,
+        key_column: str,
+        refresh_interval: float = settings.stats_snapshot_refresh_interval,
+    ):
+        self.table = table
+        self.key_column = key_column
+        self.loads = 0
+        self.refreshes = 0
+        self.answered = 0
+        self._columns = (key_column, DATE_COLUMN, *METRIC_COLUMNS)
+        self._data: _Columns | None = None
+        self._watermark = WatermarkTracker(refresh_interval)
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return f"StatsSnapshot(table={self.table}, rows={self.row_count})"
+
+    @property
+    def row_count(self) -> int:
+        data = self._data
+        return 0 if data is None else len(data.days)
+
+    def _select(self, where: str = "") -> str:
+        return f"SELECT {', '.join(self._columns)} FROM {self.table}{where} ORDER BY {DATE_COLUMN}"
+
+    def load(self) -> None:
+        """
+        テーブル全体を読み込む
+
+        読み込む前に数えた COUNT(*) より読み込んだ行数が少ない場合は、行数の上限などで
+        途中までしか読み込めていないため、内容を差し替えない。
+
+        Raises:
+            SQLAlchemyError: 読み込みに失敗した場合
+            AdmissionRejected: 同時実行数の上限で断られた場合
+            IncompleteSnapshot: 全行を読み込めなかった場合
+        """
+        with self._lock:
+            expected = fetch_columnar(f"SELECT COUNT(*) FROM {self.table}").arrays[0][0]
+            rows = fetch_columnar(self._select())
+            if len(rows) < expected:
+                raise IncompleteSnapshot(
+                    f"{self.table}: {len(rows):,}行しか読み込めませんでした（{expected:,}行）"
+                )
+            self._data = _extend(None, rows, self.key_column, None)
+            self.loads += 1
+            # 読み込んだ直後は MAX(date) を確認しない
+            self._watermark.due()
+
+    def refresh(self) -> bool:
+        """
+        MAX(date) が進んでいれば、それまでの最終日以降の行を読み込み直す
+
+        最終日の行は読み込んだ後に追加されている可能性があるため、最終日から読み込む。
+        MAX(date) が戻っていた（行が削除された）場合はテーブル全体を読み込み直す。
+
+        Returns:
+            bool: 内容を更新した場合True
+
+        Raises:
+            SQLAlchemyError: 読み込みに失敗した場合
+            AdmissionRejected: 同時実行数の上限で断られた場合
+            IncompleteSnapshot: テーブル全体を読み込み直し、全行を読み込めなかった場合
+        """
+        with self._lock:
+            latest = fetch_columnar(f"SELECT MAX({DATE_COLUMN}) FROM {self.table}").arrays[0]
+            data = self._data
+            if latest[0] is None or data is None or len(data.days) == 0:
+                self.load()
+                return True
+            day = int(_epoch_days(latest)[0])
+            last = int(data.days[-1])
+            if day == last:
+                return False
+            if day < last:
+                self.load()
+                return True
+
+            rows = fetch_columnar(
+                self._select(f" WHERE {DATE_COLUMN} >= :since"),
+                {"since": _to_date(last).isoformat()},
+            )
+            self._data = _extend(data, rows, self.key_column, last)
+            self.refreshes += 1
+            return True
+
+    def current(self) -> _Columns | None:
+        """
+        最新の内容（未読み込みなら読み込み、確認の間隔が過ぎていれば差分を読み込む）
+
+        Returns:
+            _Columns | None: 読み込めなかった場合はNone
+        """
+        try:
+            if self._data is None:
+                with self._lock:
+                    if self._data is None:
+                        self.load()
+            elif self._watermark.due():
+                self.refresh()
+        except (SQLAlchemyError, AdmissionRejected, IncompleteSnapshot):
+            # 読み込めない場合は手元の内容を使う（無ければDBで実行させる）
+            pass
+        return self._data
+
+    def _values(self, data: _Columns, name: str, rows: slice):
+        """列の値と、NULLでない行のマスク（NULLが無ければNone）"""
+        if name == self.key_column:
+            return data.keys[data.codes[rows]], None
+        if name == DATE_COLUMN:
+            return data.days[rows], None
+        valid = data.valid[name]
+        return data.values[name][rows], (valid[rows] if valid is not None else None)
+
+    def _condition(
+        self, data: _Columns, condition: str, qualifiers: set[str], rows: slice
+    ) -> np.ndarray | None:
+        """WHERE句の条件（列と数値の比較、または列 IN (数値, ...)）を満たす行のマスク"""
+        tokens = significant(tokenize(condition))
+        for i, token in enumerate(tokens):
+            if token.kind == OP and token.value in _COMPARISONS:
+                literal = _number(tokens[i + 1 :])
+                literals = None if literal is None else [literal]
+                break
+            if token.is_keyword("IN"):
+                literals = _numbers(tokens[i + 1 :])
+                break
+        else:
+            return None
+
+        name = _column_name(tokens[:i], qualifiers)
+        if literals is None or name not in self._columns or name == DATE_COLUMN:
+            return None
+        values, valid = self._values(data, name, rows)
+        factor = 10 ** METRIC_COLUMNS.get(name, 0)
+        if token.kind == OP:
+            mask = _COMPARISONS[token.value](values, literals[0] * factor)
+        else:
+            mask = np.isin(values, [literal * factor for literal in literals])
+        return mask if valid is None else mask & valid
+
+    def answer(self, plan: AggregatePlan, qualifiers: set[str]) -> list[dict] | None:
+        """
+        集計の計画をスナップショットで評価
+
+        Args:
+            plan: plan_aggregate の結果（FROM句がこのテーブルのもの）
+            qualifiers: 列の修飾に使えるテーブル名・別名（小文字）
+
+        Returns:
+            list[dict] | None: 元のSQLと同じ列名の行。
+                対象外の列や条件を含む、またはスナップショットを読み込めない場合はNone
+        """
+
+        def column(text: str) -> str | None:
+            name = _column_name(significant(tokenize(text)), qualifiers)
+            return name if name in self._columns else None
+
+        if column(plan.date_column) != DATE_COLUMN:
+            return None
+        data = self.current()
+        if data is None:
+            return None
+
+        start, end = _epoch_day(plan.start), _epoch_day(plan.end)
+        lo, hi = np.searchsorted(data.days, [start, end + 1]).tolist()
+        rows = slice(lo, hi)
+        mask = np.ones(hi - lo, dtype=bool)
+        for condition in plan.conditions:
+            condition_mask = self._condition(data, condition, qualifiers, rows)
+            if condition_mask is None:
+                return None
+            mask &= condition_mask
+
+        components = []
+        for expr in plan.group_exprs:
+            name = column(expr)
+            if name == self.key_column:
+                components.append((data.codes[rows][mask], len(data.keys)))
+            elif name == DATE_COLUMN:
+                components.append((data.days[rows][mask] - start, end - start + 1))
+            else:
+                return None
+        inverse, group_ids, groups = _group(components, int(mask.sum()))
+
+        outputs = []
+        for expr, ids in zip(plan.group_exprs, group_ids):
+            if column(expr) == self.key_column:
+                outputs.append(data.keys[ids].tolist())
+            else:
+                outputs.append([_to_date(start + day) for day in ids.tolist()])
+
+        for func, arg in plan.aggregates:
+            if arg == "*":
+                outputs.append(np.bincount(inverse, minlength=groups).tolist())
+                continue
+            name = column(arg)
+            if name is None or (name == DATE_COLUMN and func == "SUM"):
+                return None
+            values, valid = self._values(data, name, rows)
+            totals, counts = _aggregate(
+                func, values[mask], valid[mask] if valid is not None else None, inverse, groups
+            )
+            if func == "COUNT":
+                outputs.append(totals)
+            elif name == DATE_COLUMN:
+                outputs.append([_to_date(v) if n else None for v, n in zip(totals, counts)])
+            else:
+                scale = METRIC_COLUMNS.get(name, 0)
+                outputs.append([_unscaled(v, scale) if n else None for v, n in zip(totals, counts)])
+
+        names = [f"_g{i}" for i in range(len(plan.group_exprs))]
+        names += [f"_a{i}" for i in range(len(plan.aggregates))]
+        self.answered += 1
+        return plan.merge([[dict(zip(names, values)) for values in zip(*outputs)]])
+
+    def stats(self) -> dict:
+        """
+        統計を取得
+
+        Returns:
+            dict: table, rows, keys, start, end（保持している期間）, loads, refreshes, answered
+        """
+        data = self._data
+        empty = data is None or len(data.days) == 0
+        return {
+            "table": self.table,
+            "rows": self.row_count,
+            "keys": 0 if data is None else len(data.keys),
+            "start": None if empty else _to_date(int(data.days[0])),
+            "end": None if empty else _to_date(int(data.days[-1])),
+            "loads": self.loads,
+            "refreshes": self.refreshes,
+            "answered": self.answered,
+        }
+
+
+# プロセス内で共有するスナップショット（初回利用時に生成）
+_snapshots: dict[str, StatsSnapshot] = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_snapshot(table: str) -> StatsSnapshot | None:
+    """
+    テーブルのスナップショットを取得
+
+    Args:
+        table: テーブル名
+
+    Returns:
+        StatsSnapshot | None: settings.stats_snapshot_tables に含まれない場合はNone
+    """
+    table = table.lower()
+    enabled = {name.lower() for name in settings.stats_snapshot_tables}
+    if table not in SNAPSHOT_TABLES or table not in enabled:
+        return None
+    with _snapshots_lock:
+        if table not in _snapshots:
+            _snapshots[table] = StatsSnapshot(table, SNAPSHOT_TABLES[table])
+        return _snapshots[table]
+
+
+def _source(from_clause: str) -> tuple[str, set[str]] | None:
+    """FROM句が単一のテーブル（別名も可）なら (テーブル名, 列の修飾に使える名前)"""
+    tokens = significant(tokenize(from_clause))
+    if len(tokens) == 3 and tokens[1].is_keyword("AS"):
+        tokens = [tokens[0], tokens[2]]
+    if not 1 <= len(tokens) <= 2 or any(token.kind not in (WORD, QUOTED) for token in tokens):
+        return None
+    names = [unquote_identifier(token.value).lower() for token in tokens]
+    return names[0], set(names)
+
+
+def answer_from_snapshot(query: str) -> dict | None:
+    """
+    集計クエリをスナップショットで回答
+
+    Args:
+        query: チェック済みのSQL
+
+    Returns:
+        dict | None: execute_sql と同じ形式の実行結果（snapshot: True）。
+            スナップショットで回答できない場合はNone（呼び出し側でDBで実行すること）
+    """
+    if not settings.stats_snapshot_enabled:
+        return None
+    plan = plan_aggregate(query)
+    if plan is None:
+        return None
+    source = _source(plan.from_clause)
+    snapshot = get_snapshot(source[0]) if source else None
+    if snapshot is None:
+        return None
+
+    rows = snapshot.answer(plan, source[1])
+    if rows is None:
+        return None
+    return {"success": True, "data": rows, "row_count": len(rows), "snapshot": True}
+
+
+async def answer_from_snapshot_async(query: str) -> dict | None:
+    """
+    集計クエリをスナップショットで回答（非同期版、読み込みはスレッドで行う）
+
+    Returns:
+        dict | None: answer_from_snapshot と同じ形式の実行結果
+    """
+    if not settings.stats_snapshot_enabled:
+        return None
+    return await asyncio.to_thread(answer_from_snapshot, query)
+
+
+def preload_snapshots() -> int:
+    """
+    設定されたテーブルのスナップショットを読み込む（ウォームアップ用）
+
+    Returns:
+        int: 読み込んだ行数の合計
+    """
+    total = 0
+    for table in settings.stats_snapshot_tables:
+        snapshot = get_snapshot(table)
+        if snapshot is not None:
+            snapshot.load()
+            total += snapshot.row_count
+    return total
+
+
+def get_snapshot_stats() -> list[dict]:
+    """
+    スナップショットの統計を取得
+
+    Returns:
+        list[dict]: テーブルごとの StatsSnapshot.stats()
+    """
+    with _snapshots_lock:
+        snapshots = list(_snapshots.values())
+    return [snapshot.stats() for snapshot in snapshots]
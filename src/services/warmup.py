@@ -0,0 +1,99 @@
+"""
+起動時のウォームアップ
+最初の質問でエンジン生成・DB接続・LLMクライアント生成・TLSハンドシェイクの
+コストをまとめて払わないよう、入力待ちの間にバックグラウンドで済ませておきます
+"""
+
+import threading
+import time
+
+from src.agents.nodes import get_llm
+from src.external.db.session import warm_up_pool
+from src.services.stats_snapshot import preload_snapshots
+from src.settings import settings
+
+
+class WarmupReport:
+    """
+    ウォームアップの結果
+
+    Attributes:
+        db_connections: 確立できたDB接続数
+        db_seconds: DBのウォームアップにかかった秒数
+        llm_seconds: LLMクライアントのウォームアップにかかった秒数
+        errors: 失敗した処理のエラーメッセージ
+    """
+
+    __slots__ = ("db_connections", "db_seconds", "llm_seconds", "errors")
+
+    def __init__(self):
+        self.db_connections = 0
+        self.db_seconds = 0.0
+        self.llm_seconds = 0.0
+        self.errors: list[str] = []
+
+    def __repr__(self):
+        return (
+            f"WarmupReport(db_connections={self.db_connections}, "
+            f"db_seconds={self.db_seconds:.3f}, llm_seconds={self.llm_seconds:.3f}, "
+            f"errors={self.errors})"
+        )
+
+
+class Warmup:
+    """
+    バックグラウンドスレッドでのウォームアップ
+
+    Example:
+        warmup = Warmup().start()
+        ...  # 入力待ち
+        report = warmup.wait()
+    """
+
+    def __init__(
+        self,
+        connections: int = settings.warmup_connections,
+        ping_llm: bool = settings.warmup_llm_ping,
+    ):
+        self.connections = connections
+        self.ping_llm = ping_llm
+        self.report = WarmupReport()
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+
+    def start(self) -> "Warmup":
+        """ウォームアップを開始"""
+        self._thread.start()
+        return self
+
+    def wait(self, timeout: float | None = None) -> WarmupReport | None:
+        """
+        ウォームアップの完了を待つ
+
+        Args:
+            timeout: 待つ最大秒数（Noneの場合は完了まで待つ）
+
+        Returns:
+            WarmupReport | None: 結果（timeout までに完了しなかった場合はNone）
+        """
+        self._thread.join(timeout)
+        return None if self._thread.is_alive() else self.report
+
+    def _run(self) -> None:
+        started = time.perf_counter()
+        try:
+            self.report.db_connections = warm_up_pool(self.connections)
+            if settings.stats_snapshot_enabled:
+                preload_snapshots()
+        except Exception as e:
+            self.report.errors.append(f"DB: {e}")
+        self.report.db_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        try:
+            llm = get_llm()
+            if self.ping_llm:
+                # 共有するHTTPクライアントで接続を確立しておく
+                llm.root_client.models.list()
+        except Exception as e:
+            self.report.errors.append(f"LLM: {e}")
+        self.report.llm_seconds = time.perf_counter() - started
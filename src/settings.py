@@ -15,6 +15,91 @@ class Settings(BaseSettings):
     db_user: str = "root"
     db_password: str = "passwd"
     db_name: str = "llm_ad_agent"
+    db_async_driver: str = "asyncmy"  # 非同期実行時のドライバ（asyncmy / aiomysql）
+
+    # Backend（mysql: MySQLサーバー / embedded: sql/*.sql を読み込んだプロセス内SQLite）
+    db_backend: str = "mysql"
+    embedded_db_path: str = ".cache/llm_ad_agent.sqlite3"  # 組み込みバックエンドのスナップショット
+    embedded_sql_dir: str = "sql"  # ddl.sql・insert.sql のあるディレクトリ
+
+    # Read replicas（エージェントのクエリはSELECTのみなので全てレプリカへ送れる）
+    db_replicas: list[str] = []  # "host"、"host:port"、"host:port:weight"
+    db_replica_strategy: str = "weighted"  # weighted / least_connections
+    db_replica_health_interval: float = 10.0  # ヘルスチェックの間隔（秒、0以下で無効）
+    # ヘルスチェックが無効な場合に、利用不可のレプリカへ再び振り分けるまでの秒数
+    db_replica_retry_after: float = 30.0
+
+    # Database connection pool
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0  # プールからの取得待ちの上限（秒）
+    db_pool_recycle: int = 3600  # コネクションを作り直すまでの秒数
+    db_pool_pre_ping_interval: float = 30.0  # アイドルがこの秒数を超えたらping（0以下で毎回）
+
+    # Session profile（エージェント用の接続に接続ごとに1回だけ設定、MySQLのみ）
+    # READ COMMITTED / READ UNCOMMITTED（空でドライバ既定）
+    db_isolation_level: str = "READ COMMITTED"
+    db_read_only: bool = True  # transaction_read_only を有効にする
+
+    # Admission control（同時に実行するクエリ数の制限、0以下で無効）
+    db_max_concurrent_queries: int = 8
+    db_admission_queue_size: int = 32  # 待ち行列の最大長
+    db_admission_timeout: float = 10.0  # 待ち行列で待つ最大秒数
+
+    # Single-flight（実行中の同一SQLを1回の実行にまとめる）
+    db_single_flight: bool = True
+
+    # Scatter-gather（日付範囲の集計を期間で分割し、別々の接続で並列に実行してマージ）
+    scatter_gather_enabled: bool = False
+    scatter_gather_shards: int = 4  # 分割数（同時に使う接続数）
+    scatter_gather_min_days: int = 60  # 分割する最短の期間（日数）
+
+    # Stats snapshot（日次実績テーブルをプロセス内にNumPyの列で保持し、単純な集計はDBを使わずに回答）
+    stats_snapshot_enabled: bool = False
+    stats_snapshot_tables: list[str] = ["campaign_daily_stats"]  # display_ad_daily_stats も指定可
+    stats_snapshot_refresh_interval: float = 60.0  # MAX(date)を確認して差分を読み込む間隔（秒）
+
+    # Query timeout
+    query_timeout: float = 30.0  # 1クエリの実行時間の上限（秒、0以下で無効）
+    query_timeout_grace: float = 2.0  # サーバー側で打ち切られなかった場合にKILLするまでの猶予（秒）
+
+    # Cost gate（実行前のEXPLAINによるコスト見積もり）
+    cost_gate_enabled: bool = False
+    cost_gate_max_rows_examined: int = 5_000_000  # 見積もり走査行数の上限
+    # 全件走査（access_type=ALL/index）を許可しないテーブル
+    cost_gate_full_scan_denied_tables: list[str] = ["search_query_keyword_ad_daily_stats"]
+    cost_gate_cache_size: int = 512  # 実行計画の見積もり結果をキャッシュする件数
+
+    # Prepared statements（WHERE等のリテラルをパラメータ化し、コネクションごとにPREPAREを再利用）
+    db_prepared_statements: bool = False
+    db_prepared_statement_cache_size: int = 64  # コネクションごとに保持するステートメント数
+
+    # Result streaming
+    db_stream_results: bool = False  # サーバーサイドカーソルで結果を逐次処理する
+    db_stream_batch_size: int = 200
+    db_columnar_results: bool = False  # 実行結果を列指向（ColumnarResult）で受け取る
+
+    # Type conversion (MySQLドライバで行を組み立てる段階の変換)
+    # 値の単位は変えない（指標の計算・回答プロンプトにそのまま使われるため）。asyncmy / pymysql のみ
+    db_decimal_mode: str = "exact"  # exact: Decimal / float: float
+    db_date_mode: str = "date"  # date: datetime.date / iso: ISO文字列
+
+    # Result cache
+    result_cache_enabled: bool = True
+    result_cache_ttl: float = 300.0  # 秒
+    result_cache_max_bytes: int = 64 * 1024 * 1024
+    # MAX(date)が変化したらキャッシュを破棄するテーブル
+    result_cache_watermark_tables: list[str] = [
+        "campaign_daily_stats",
+        "search_query_keyword_ad_daily_stats",
+    ]
+    result_cache_watermark_interval: float = 30.0  # ウォーターマークの確認間隔（秒）
+
+    # 回答プロンプトに渡す実行結果の形式（json / json_columnar / csv / tsv / markdown）
+    result_format: str = "json"
+    # 実行結果の合計値から CTR / CPC / CVR / CPA / ROAS の列を計算して追加する
+    derived_metrics_enabled: bool = True
+    derived_metrics_decimals: int = 2  # 指標を丸める小数部の桁数
 
     # LLM (OpenAI)
     llm_model: str = "gpt-4o-mini"
@@ -24,6 +109,13 @@ class Settings(BaseSettings):
     max_retries: int = 3
     default_limit: int = 100
     max_limit: int = 1000
+    # SQLごとのチェック結果をメモ化する件数（0で無効）
+    query_check_cache_size: int = 1024
+
+    # Warm-up (CLI起動時にバックグラウンドで実行)
+    warmup_enabled: bool = True
+    warmup_connections: int = 2  # 事前に開くプールの接続数
+    warmup_llm_ping: bool = True  # LLM APIに接続してTLSハンドシェイクを済ませておく
 
     class Config:
         env_file = ".env"
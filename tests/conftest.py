@@ -0,0 +1,30 @@
+"""
+テスト共通のフィクスチャ
+"""
+
+from pathlib import Path
+
+import pytest
+
+from src.external.db.session import dispose_engine
+from src.settings import settings
+
+SQL_DIR = Path(__file__).resolve().parent.parent / "sql"
+
+
+@pytest.fixture(scope="session")
+def _embedded_snapshot(tmp_path_factory) -> Path:
+    return tmp_path_factory.mktemp("embedded") / "ad_agent.sqlite3"
+
+
+@pytest.fixture
+def embedded_db(_embedded_snapshot, monkeypatch):
+    """sql/*.sql を読み込んだ組み込みバックエンド（SQLite）で実行する"""
+    monkeypatch.setattr(settings, "db_backend", "embedded")
+    monkeypatch.setattr(settings, "embedded_db_path", str(_embedded_snapshot))
+    monkeypatch.setattr(settings, "embedded_sql_dir", str(SQL_DIR))
+    monkeypatch.setattr(settings, "result_cache_enabled", False)
+    monkeypatch.setattr(settings, "db_replicas", [])
+    dispose_engine()
+    yield
+    dispose_engine()
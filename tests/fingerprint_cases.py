@@ -0,0 +1,47 @@
+"""
+SQLフィンガープリントのテストケース
+テストとベンチマーク（benchmarks/bench_fingerprint.py）で共有する、同じ文とみなすべきSQLの組
+"""
+
+# 同じフィンガープリントになるべきSQLの組（組が異なれば別の値になるべき）
+EQUIVALENT_GROUPS = [
+    # 大文字小文字・空白・改行・末尾のセミコロン
+    [
+        "SELECT id, name FROM campaigns WHERE status = 'ENABLED'",
+        "select id,name from campaigns where status='PAUSED';",
+        "SELECT  id ,\n  name\nFROM   campaigns\nWHERE status = 'ENABLED' ;",
+    ],
+    # 識別子の引用符
+    [
+        "SELECT `name` FROM `campaigns` WHERE `id` = 1",
+        "SELECT name FROM campaigns WHERE id = 2",
+        "SELECT `NAME` FROM Campaigns WHERE ID = 3",
+    ],
+    # 日付・数値リテラルとプレースホルダ
+    [
+        "SELECT SUM(clicks) FROM campaign_daily_stats"
+        " WHERE date BETWEEN '2024-01-01' AND '2024-01-31'",
+        "SELECT SUM(clicks) FROM campaign_daily_stats"
+        " WHERE date BETWEEN \"2023-06-01\" AND '2023-06-30'",
+        "SELECT SUM(clicks) FROM campaign_daily_stats WHERE date BETWEEN :start AND :end",
+    ],
+    # IN のリテラルの個数
+    [
+        "SELECT name FROM campaigns WHERE id IN (1)",
+        "SELECT name FROM campaigns WHERE id IN (1, 2, 3)",
+        "SELECT name FROM campaigns WHERE id IN ('a','b')",
+    ],
+    # コメント
+    [
+        "SELECT id FROM ads WHERE ad_group_id = 10 LIMIT 100",
+        "SELECT id FROM ads /* 広告 */ WHERE ad_group_id = 11 -- 絞り込み\nLIMIT 50",
+    ],
+    # 以下はそれぞれ別の文
+    ["SELECT id FROM campaigns WHERE id IN (SELECT campaign_id FROM ad_groups)"],
+    ["SELECT id FROM campaigns WHERE id IN (1, 2) AND status IN ('ENABLED')"],
+    ["SELECT id FROM campaigns WHERE id = 1 OR id = 2"],
+    ["SELECT id FROM campaigns ORDER BY id DESC LIMIT 10"],
+    ["SELECT id FROM campaigns ORDER BY id LIMIT 10"],
+    ["SELECT name FROM campaigns WHERE name = 'date'"],
+    ["SELECT name FROM campaigns WHERE name = date"],
+]
@@ -0,0 +1,71 @@
+"""
+広告指標の計算のテスト
+分母が0またはNULLの行の指標がNULLになり、警告や例外にならないことを確認します
+"""
+
+import math
+
+import pytest
+
+from src.external.db.columnar import ColumnarResult
+from src.services.ad_metrics import add_metrics, compute_metrics
+
+
+@pytest.mark.filterwarnings("error")
+def test_zero_and_null_divisors_give_nan():
+    metrics = compute_metrics(
+        {
+            "impressions": [1000, 0, None, 500],
+            "clicks": [50, 0, 10, 10],
+            "cost": [2500, 0, None, 0],
+            "conversions": [5, 0, 1, 0],
+            "conversion_value": [10000, 0, 100, 0],
+        },
+        decimals=2,
+    )
+    assert metrics["ctr"].tolist()[0] == 5.0
+    assert metrics["cpc"].tolist()[0] == 50.0
+    assert metrics["cvr"].tolist()[0] == 10.0
+    assert metrics["cpa"].tolist()[0] == 500.0
+    assert metrics["roas"].tolist()[0] == 400.0
+    # 分母が0の行
+    assert all(math.isnan(metrics[name][1]) for name in ("ctr", "cpc", "cvr", "cpa", "roas"))
+    # 分母がNULLの行・分子がNULLの行
+    assert math.isnan(metrics["ctr"][2])
+    assert math.isnan(metrics["cpc"][2])
+    assert math.isnan(metrics["roas"][2])
+    # 分子が0で分母が0でない行は0
+    assert metrics["cpc"][3] == 0.0 and math.isnan(metrics["cpa"][3])
+
+
+def test_only_metrics_with_both_columns_are_computed():
+    metrics = compute_metrics({"clicks": [1, 2], "cost": [10, 0]})
+    assert set(metrics) == {"cpc"}
+    assert metrics["cpc"].tolist() == [10.0, 0.0]
+
+
+def test_add_metrics_to_rows():
+    rows = [
+        {"campaign_id": 1, "SUM(clicks)": 0, "SUM(cost)": 0, "conversions": 0},
+        {"campaign_id": 2, "SUM(clicks)": 4, "SUM(cost)": 10, "conversions": 2},
+    ]
+    result = add_metrics(rows, decimals=1)
+    assert result == [
+        {**rows[0], "cpc": None, "cvr": None, "cpa": None},
+        {**rows[1], "cpc": 2.5, "cvr": 50.0, "cpa": 5.0},
+    ]
+    assert "cpc" not in rows[0]
+
+
+def test_add_metrics_to_columnar_result():
+    batch = ColumnarResult(["clicks", "cost"], [[0, 3], [5, 6]], 2)
+    result = add_metrics(batch)
+    assert result.columns == ["clicks", "cost", "cpc"]
+    assert result.column("cpc") == [None, 2.0]
+    assert batch.columns == ["clicks", "cost"]
+
+
+def test_add_metrics_keeps_existing_metrics():
+    rows = [{"clicks": 0, "cost": 0, "cpc": 1.0}]
+    assert add_metrics(rows) is rows
+    assert add_metrics([]) == []
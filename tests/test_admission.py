@@ -0,0 +1,137 @@
+"""
+アドミッション制御のテスト
+待ち行列の順番（FIFO）と、満杯・待ち時間超過での拒否を確認します
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.external.db.admission import AdmissionController, AdmissionRejected
+
+
+def _wait_until(condition, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "条件を満たしませんでした"
+        time.sleep(0.001)
+
+
+def test_waiters_are_admitted_in_fifo_order():
+    controller = AdmissionController(max_concurrent=1, max_queue=10, queue_timeout=5.0)
+    controller.acquire()
+    order = []
+
+    def worker(index: int) -> None:
+        with controller.admit():
+            order.append(index)
+
+    threads = []
+    for index in range(5):
+        thread = threading.Thread(target=worker, args=(index,))
+        thread.start()
+        threads.append(thread)
+        _wait_until(lambda: controller.stats()["queued"] == index + 1)
+
+    controller.release()
+    for thread in threads:
+        thread.join(timeout=5.0)
+    assert order == [0, 1, 2, 3, 4]
+    stats = controller.stats()
+    assert (stats["in_flight"], stats["queued"], stats["admitted"]) == (0, 0, 6)
+
+
+def test_new_caller_does_not_overtake_waiters():
+    controller = AdmissionController(max_concurrent=1, max_queue=10, queue_timeout=5.0)
+    controller.acquire()
+    admitted = threading.Event()
+    thread = threading.Thread(target=lambda: (controller.acquire(), admitted.set()))
+    thread.start()
+    _wait_until(lambda: controller.stats()["queued"] == 1)
+
+    # 枠は待っていたスレッドに引き継がれ、空きは増えない
+    controller.release()
+    assert admitted.wait(5.0)
+    assert controller.stats()["in_flight"] == 1
+    thread.join(timeout=5.0)
+    controller.release()
+
+
+def test_rejects_when_queue_is_full():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5.0)
+    controller.acquire()
+    thread = threading.Thread(target=lambda: controller.admit().__enter__())
+    thread.start()
+    _wait_until(lambda: controller.stats()["queued"] == 1)
+
+    with pytest.raises(AdmissionRejected) as error:
+        controller.acquire()
+    assert error.value.reason == "queue_full"
+    assert controller.stats()["rejected_queue_full"] == 1
+
+    controller.release()
+    thread.join(timeout=5.0)
+
+
+def test_rejects_after_queue_timeout():
+    controller = AdmissionController(max_concurrent=1, max_queue=5, queue_timeout=0.05)
+    controller.acquire()
+    with pytest.raises(AdmissionRejected) as error:
+        controller.acquire()
+    assert error.value.reason == "timeout"
+    stats = controller.stats()
+    assert (stats["in_flight"], stats["queued"], stats["rejected_timeout"]) == (1, 0, 1)
+
+    # 待ち行列から外れているため、解放した枠は空きに戻る
+    controller.release()
+    controller.acquire()
+    assert controller.stats()["in_flight"] == 1
+
+
+def test_disabled_controller_does_not_limit():
+    controller = AdmissionController(max_concurrent=0, max_queue=0, queue_timeout=0.0)
+    with controller.admit(), controller.admit():
+        assert controller.stats()["in_flight"] == 0
+
+
+def test_async_waiters_are_admitted_in_fifo_order():
+    async def scenario() -> list[int]:
+        controller = AdmissionController(max_concurrent=1, max_queue=10, queue_timeout=5.0)
+        await controller.acquire_async()
+        order = []
+
+        async def worker(index: int) -> None:
+            async with controller.admit_async():
+                order.append(index)
+                await asyncio.sleep(0)
+
+        tasks = []
+        for index in range(5):
+            tasks.append(asyncio.create_task(worker(index)))
+            while controller.stats()["queued"] < index + 1:
+                await asyncio.sleep(0)
+        controller.release()
+        await asyncio.gather(*tasks)
+        assert controller.stats()["in_flight"] == 0
+        return order
+
+    assert asyncio.run(scenario()) == [0, 1, 2, 3, 4]
+
+
+def test_async_cancelled_waiter_leaves_the_queue():
+    async def scenario() -> dict:
+        controller = AdmissionController(max_concurrent=1, max_queue=10, queue_timeout=5.0)
+        await controller.acquire_async()
+        task = asyncio.create_task(controller.acquire_async())
+        while controller.stats()["queued"] < 1:
+            await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        controller.release()
+        return controller.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["in_flight"], stats["queued"]) == (0, 0)
@@ -0,0 +1,123 @@
+"""
+分解可能な集計クエリのテスト
+期間ごとの部分集計をマージした結果が、分割せずに集計した結果と一致することを確認します
+"""
+
+import datetime
+import sqlite3
+from decimal import Decimal
+
+import pytest
+
+from src.external.db.embedded import register_mysql_functions, to_sqlite
+from src.services.aggregate_query import plan_aggregate
+
+CPC_QUERY = (
+    "SELECT campaign_id, SUM(clicks) AS clicks, AVG(cost) AS avg_cost,"
+    " SUM(cost) / NULLIF(SUM(clicks), 0) AS cpc, MAX(date) AS last_day"
+    " FROM campaign_daily_stats WHERE date >= '2024-01-01' AND date <= '2024-01-31'"
+    " GROUP BY campaign_id ORDER BY clicks DESC LIMIT 2"
+)
+
+
+def test_merge_recomputes_averages_and_ratios():
+    plan = plan_aggregate(CPC_QUERY)
+    assert plan.aggregates == [
+        ("SUM", "clicks"),
+        ("SUM", "cost"),
+        ("COUNT", "cost"),
+        ("MAX", "date"),
+    ]
+    first = [
+        {"_g0": 1, "_a0": 10, "_a1": Decimal("100.00"), "_a2": 2, "_a3": datetime.date(2024, 1, 5)},
+        {"_g0": 2, "_a0": 1, "_a1": Decimal("3.00"), "_a2": 1, "_a3": datetime.date(2024, 1, 3)},
+    ]
+    second = [
+        {"_g0": 1, "_a0": 30, "_a1": Decimal("20.00"), "_a2": 1, "_a3": datetime.date(2024, 1, 20)},
+        {"_g0": 3, "_a0": 5, "_a1": None, "_a2": 0, "_a3": None},
+    ]
+    assert plan.merge([first, second]) == [
+        {
+            "campaign_id": 1,
+            "clicks": 40,
+            "avg_cost": Decimal("40"),
+            "cpc": Decimal("3"),
+            "last_day": datetime.date(2024, 1, 20),
+        },
+        {"campaign_id": 3, "clicks": 5, "avg_cost": None, "cpc": None, "last_day": None},
+    ]
+
+
+def test_merge_without_group_by_returns_one_row_for_no_rows():
+    plan = plan_aggregate(
+        "SELECT COUNT(*) AS n, SUM(cost) AS cost FROM campaign_daily_stats"
+        " WHERE date BETWEEN '2024-01-01' AND '2024-01-31'"
+    )
+    assert plan.merge([[], []]) == [{"n": 0, "cost": None}]
+
+
+def test_merge_groups_string_keys_like_ci_collations():
+    plan = plan_aggregate(
+        "SELECT name, SUM(clicks) AS clicks FROM campaign_daily_stats"
+        " WHERE date >= '2024-01-01' AND date <= '2024-01-31' GROUP BY name ORDER BY name"
+    )
+    rows = plan.merge(
+        [
+            [{"_g0": "Brand", "_a0": 1}, {"_g0": "検索", "_a0": 2}],
+            [{"_g0": "brand ", "_a0": 3}, {"_g0": "BRAND", "_a0": 4}],
+        ]
+    )
+    assert rows == [{"name": "Brand", "clicks": 8}, {"name": "検索", "clicks": 2}]
+
+
+def test_shard_ranges_cover_the_period_without_overlap():
+    plan = plan_aggregate(CPC_QUERY)
+    ranges = plan.shard_ranges(3)
+    assert ranges[0][0] == datetime.date(2024, 1, 1)
+    assert ranges[-1][1] == datetime.date(2024, 1, 31)
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert start - end == datetime.timedelta(days=1)
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        CPC_QUERY,
+        "SELECT campaign_id, MIN(impressions) AS low, COUNT(*) AS days,"
+        " ROUND(SUM(clicks) * 100.0 / NULLIF(SUM(impressions), 0), 2) AS ctr"
+        " FROM campaign_daily_stats WHERE date BETWEEN '2024-01-01' AND '2024-01-31'"
+        " AND campaign_id <> 2 GROUP BY campaign_id ORDER BY ctr DESC, campaign_id",
+    ],
+)
+def test_merged_shards_match_the_whole_query(query):
+    connection = sqlite3.connect(":memory:")
+    register_mysql_functions(connection)
+    connection.row_factory = sqlite3.Row
+    connection.execute(
+        "CREATE TABLE campaign_daily_stats"
+        " (campaign_id INTEGER, date TEXT, impressions INTEGER, clicks INTEGER, cost REAL)"
+    )
+    connection.executemany(
+        "INSERT INTO campaign_daily_stats VALUES (?, ?, ?, ?, ?)",
+        [
+            (campaign, f"2024-01-{day:02d}", 100 * campaign + day, day % (campaign + 2), day * 1.25)
+            for campaign in range(1, 5)
+            for day in range(1, 32)
+        ],
+    )
+
+    def run(sql: str, params: dict | None = None) -> list[dict]:
+        return [dict(row) for row in connection.execute(to_sqlite(sql), params or {})]
+
+    plan = plan_aggregate(query)
+    shards = [
+        run(plan.shard_query(1000), {"shard_start": str(start), "shard_end": str(end)})
+        for start, end in plan.shard_ranges(4)
+    ]
+    merged = plan.merge(shards)
+    expected = run(query)
+    assert [list(row) for row in merged] == [list(row) for row in expected]
+    for row, expected_row in zip(merged, expected):
+        # マージ側のROUNDはMySQLと同じくDecimalを返す
+        values = [float(value) if isinstance(value, Decimal) else value for value in row.values()]
+        assert values == pytest.approx(list(expected_row.values()))
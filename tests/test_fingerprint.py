@@ -0,0 +1,37 @@
+"""
+SQLフィンガープリントのテスト
+同じ文とみなすべきSQLの組（fingerprint_cases.py）で fingerprint() の判定を確認します
+"""
+
+from itertools import combinations
+
+import pytest
+
+from src.services.fingerprint import PLACEHOLDER_LIST, fingerprint, normalize
+from tests.fingerprint_cases import EQUIVALENT_GROUPS
+
+
+@pytest.mark.parametrize("group", EQUIVALENT_GROUPS, ids=lambda group: group[0][:40])
+def test_equivalent_queries_share_fingerprint(group):
+    assert len({normalize(query) for query in group}) == 1
+    assert len({fingerprint(query) for query in group}) == 1
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    list(combinations(range(len(EQUIVALENT_GROUPS)), 2)),
+)
+def test_different_groups_do_not_collide(first, second):
+    assert fingerprint(EQUIVALENT_GROUPS[first][0]) != fingerprint(EQUIVALENT_GROUPS[second][0])
+
+
+def test_normalize_replaces_literals_and_lists():
+    normalized = normalize("SELECT `Name` FROM campaigns WHERE id IN (1, 2) AND cost > 1.5;")
+    assert (
+        normalized == f"select name from campaigns where id in ( {PLACEHOLDER_LIST} ) and cost > ?"
+    )
+
+
+def test_normalize_keeps_subquery_in_list():
+    normalized = normalize("SELECT id FROM campaigns WHERE id IN (SELECT campaign_id FROM ads)")
+    assert PLACEHOLDER_LIST not in normalized
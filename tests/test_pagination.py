@@ -0,0 +1,142 @@
+"""
+キーセットページネーションのテスト
+継続トークンのエンコード・デコードと、続きのページを全て取得した結果を確認します
+"""
+
+import base64
+import datetime
+import json
+from decimal import Decimal
+
+import pytest
+
+from src.external.db.session import execute_sql
+from src.services.pagination import (
+    InvalidContinuationToken,
+    KeysetTracker,
+    decode_token,
+    fetch_next_page,
+)
+from src.settings import settings
+
+
+def _token(query: str, rows: list[dict]) -> str | None:
+    tracker = KeysetTracker(query)
+    tracker.observe(rows)
+    return tracker.token()
+
+
+def _encode(payload: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def test_token_round_trip():
+    rows = [
+        {"campaign_id": 1, "date": datetime.date(2024, 1, 1), "cost": Decimal("10.50")},
+        {"campaign_id": 1, "date": datetime.date(2024, 1, 2), "cost": Decimal("0.25")},
+    ]
+    token = _token(
+        "SELECT campaign_id, date, cost FROM campaign_daily_stats"
+        " WHERE cost > 0 ORDER BY campaign_id DESC, date LIMIT 2",
+        rows,
+    )
+    cursor = decode_token(token)
+    assert cursor.query == (
+        "SELECT campaign_id, date, cost FROM campaign_daily_stats"
+        " WHERE cost > 0 ORDER BY campaign_id DESC, date"
+    )
+    assert cursor.keys == [("campaign_id", "DESC"), ("date", "ASC")]
+    assert cursor.values == [1, datetime.date(2024, 1, 2)]
+    assert cursor.page_size == 2
+
+
+def test_token_records_null_and_decimal_keys():
+    rows = [{"id": 3, "end_date": None, "budget": Decimal("1.5")}]
+    token = _token(
+        "SELECT id, end_date, budget FROM campaigns ORDER BY end_date, budget, id LIMIT 1", rows
+    )
+    assert decode_token(token).values == [None, Decimal("1.5"), 3]
+
+
+@pytest.mark.parametrize(
+    "query, rows",
+    [
+        # 最後のページ（行数がページの行数に満たない）
+        ("SELECT id FROM campaigns ORDER BY id LIMIT 3", [{"id": 1}, {"id": 2}]),
+        # 並び順が一意でない
+        (
+            "SELECT id, status FROM campaigns ORDER BY status LIMIT 1",
+            [{"id": 1, "status": "ENABLED"}],
+        ),
+        (
+            "SELECT campaign_id, cost FROM campaign_daily_stats ORDER BY campaign_id LIMIT 1",
+            [{"campaign_id": 1, "cost": 1}],
+        ),
+        # 別名で一意キーの列名を付けた式
+        ("SELECT cost AS id FROM campaign_daily_stats ORDER BY id LIMIT 1", [{"id": 1}]),
+        # 集計・結合・OFFSET・ORDER BYなし
+        (
+            "SELECT campaign_id, SUM(cost) AS cost FROM campaign_daily_stats"
+            " GROUP BY campaign_id ORDER BY campaign_id LIMIT 1",
+            [{"campaign_id": 1, "cost": 1}],
+        ),
+        (
+            "SELECT c.id FROM campaigns c JOIN ad_groups g ON g.campaign_id = c.id"
+            " ORDER BY c.id LIMIT 1",
+            [{"id": 1}],
+        ),
+        ("SELECT id FROM campaigns ORDER BY id LIMIT 1 OFFSET 1", [{"id": 2}]),
+        ("SELECT id FROM campaigns LIMIT 1", [{"id": 1}]),
+    ],
+)
+def test_no_token(query, rows):
+    assert _token(query, rows) is None
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        "not a token",
+        _encode({"q": "SELECT id FROM campaigns", "k": [["id", "ASC"]], "v": [1]}),
+        _encode({"q": "SELECT id FROM campaigns", "k": [["id", "UP"]], "v": [1], "n": 10}),
+        _encode({"q": "SELECT id FROM campaigns", "k": [["id", "ASC"]], "v": [], "n": 10}),
+        _encode({"q": "SELECT id FROM campaigns", "k": [["id", "ASC"]], "v": [1], "n": 0}),
+        _encode({"q": "SELECT user FROM mysql.user", "k": [["user", "ASC"]], "v": ["a"], "n": 10}),
+        _encode({"q": "DELETE FROM campaigns", "k": [["id", "ASC"]], "v": [1], "n": 10}),
+    ],
+)
+def test_invalid_tokens_are_rejected(token):
+    with pytest.raises(InvalidContinuationToken):
+        decode_token(token)
+
+
+def _fetch_all(query: str) -> list[dict]:
+    result = execute_sql(query, settings.max_limit)
+    rows = list(result["data"])
+    token = _token(query, rows)
+    pages = 1
+    while token is not None:
+        page = fetch_next_page(token)
+        assert page["success"]
+        rows += page["data"]
+        token = page["continuation_token"]
+        pages += 1
+    assert pages > 1
+    return rows
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "SELECT campaign_id, date, clicks FROM campaign_daily_stats"
+        " WHERE campaign_id <= 3 ORDER BY campaign_id DESC, date LIMIT 7",
+        "SELECT id, name, end_date FROM campaigns ORDER BY end_date DESC, id DESC LIMIT 2",
+        "SELECT id, name, end_date FROM campaigns ORDER BY end_date, id LIMIT 4",
+        "SELECT * FROM ad_groups ORDER BY id LIMIT 5",
+    ],
+)
+def test_pages_cover_every_row_once(embedded_db, query):
+    unpaged = query.rsplit(" LIMIT ", 1)[0]
+    expected = execute_sql(unpaged, settings.max_limit)["data"]
+    assert len(expected) < settings.max_limit
+    assert _fetch_all(query) == expected
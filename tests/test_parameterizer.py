@@ -0,0 +1,107 @@
+"""
+リテラルのパラメータ化のテスト
+置き換えたリテラルを戻すと元のSQLになること、置き換えてはいけないリテラルが残ることを確認します
+"""
+
+import sqlite3
+from decimal import Decimal
+
+import pytest
+
+from src.services.parameterizer import parameterize
+from src.services.sql_tokenizer import PARAM, tokenize
+
+
+def _literal(value) -> str:
+    if isinstance(value, str):
+        escaped = value.replace("'", "''")
+        return f"'{escaped}'"
+    return str(value)
+
+
+def _inline(template: str, params: tuple) -> str:
+    """テンプレートの "?" をパラメータのリテラル表記に戻す"""
+    values = iter(params)
+    parts = []
+    for token in tokenize(template):
+        if token.kind == PARAM and token.value == "?":
+            parts.append(_literal(next(values)))
+        else:
+            parts.append(token.value)
+    assert next(values, None) is None
+    return "".join(parts)
+
+
+@pytest.mark.parametrize(
+    "query, params",
+    [
+        (
+            "SELECT id FROM campaigns WHERE status = 'ENABLED' AND budget > 1000 LIMIT 10",
+            ("ENABLED", 1000, 10),
+        ),
+        (
+            "SELECT SUM(cost) FROM campaign_daily_stats"
+            " WHERE date BETWEEN '2024-01-01' AND '2024-01-31' AND cost >= 1.5",
+            ("2024-01-01", "2024-01-31", Decimal("1.5")),
+        ),
+        ("SELECT name FROM campaigns WHERE name = 'it''s' OR id IN (1, 16)", ("it's", 1, 16)),
+        (
+            "SELECT id FROM campaigns WHERE id IN (SELECT campaign_id FROM ad_groups"
+            " WHERE status = 'PAUSED') AND status = 'ENABLED'",
+            ("PAUSED", "ENABLED"),
+        ),
+        (
+            "SELECT campaign_id, SUM(clicks) FROM campaign_daily_stats GROUP BY campaign_id"
+            " HAVING SUM(clicks) > 100",
+            (100,),
+        ),
+    ],
+)
+def test_round_trip(query, params):
+    statement = parameterize(query)
+    assert statement.params == params
+    assert _inline(statement.template, statement.params) == query
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        # 関数の引数
+        "SELECT id FROM campaigns WHERE DATE_FORMAT(start_date, '%Y') = DATE_FORMAT(NOW(), '%Y')",
+        # 型付きリテラル・文字セット指定・16進リテラル
+        "SELECT id FROM campaigns WHERE start_date >= DATE '2024-01-01'",
+        "SELECT id FROM campaigns WHERE name = _utf8mb4'検索'",
+        "SELECT id FROM campaigns WHERE name = N'検索' OR name = X'41'",
+        # SELECT / GROUP BY / ORDER BY のリテラル
+        "SELECT 'total' AS label, campaign_id FROM campaign_daily_stats GROUP BY 2 ORDER BY 1",
+    ],
+)
+def test_keeps_literals_that_change_results(query):
+    statement = parameterize(query)
+    assert statement.params == ()
+    assert statement.template == query
+
+
+def test_hex_literal_is_bound_as_integer():
+    statement = parameterize("SELECT id FROM campaigns WHERE id = 0x10")
+    assert (statement.template, statement.params) == (
+        "SELECT id FROM campaigns WHERE id = ?",
+        (16,),
+    )
+
+
+def test_parameterized_query_returns_same_rows():
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE campaigns (id INTEGER, name TEXT, budget REAL)")
+    connection.executemany(
+        "INSERT INTO campaigns VALUES (?, ?, ?)",
+        [(1, "検索", 1000.0), (2, "it's", 2500.5), (3, "ディスプレイ", 300.0)],
+    )
+    query = "SELECT id FROM campaigns WHERE (name = 'it''s' OR budget < 500.25) AND id > 0 LIMIT 5"
+    statement = parameterize(query)
+    params = [float(value) if isinstance(value, Decimal) else value for value in statement.params]
+    assert (
+        connection.execute(statement.template, params).fetchall()
+        == connection.execute(query).fetchall()
+        == [(2,), (3,)]
+    )
@@ -0,0 +1,142 @@
+"""
+SQLクエリチェッカーのテスト
+許可されていないテーブルの検出・LIMITの付与・メモの破棄・一括チェックを確認します
+"""
+
+import pytest
+
+from src.services import query_checker
+from src.services.query_checker import (
+    CheckStats,
+    check_queries,
+    check_query,
+    clear_query_check_cache,
+    get_query_check_stats,
+)
+from src.settings import settings
+
+
+@pytest.fixture(autouse=True)
+def _limits(monkeypatch):
+    monkeypatch.setattr(settings, "default_limit", 100)
+    monkeypatch.setattr(settings, "max_limit", 1000)
+    monkeypatch.setattr(settings, "query_check_cache_size", 1024)
+    clear_query_check_cache()
+    yield
+    clear_query_check_cache()
+
+
+@pytest.mark.parametrize(
+    "query, table",
+    [
+        ("SELECT c.id FROM campaigns c, mysql.user u", "mysql.user"),
+        (
+            "SELECT id, (SELECT authentication_string FROM mysql.user LIMIT 1) FROM campaigns",
+            "mysql.user",
+        ),
+        (
+            "SELECT EXTRACT(YEAR FROM (SELECT MAX(created_at) FROM secrets)) FROM campaigns",
+            "secrets",
+        ),
+        ("SELECT id FROM campaigns UNION SELECT user FROM mysql.user", "mysql.user"),
+        (
+            "SELECT t.table_name FROM (SELECT table_name FROM information_schema.tables) t",
+            "information_schema.tables",
+        ),
+    ],
+)
+def test_rejects_disallowed_tables(query, table):
+    result = check_query(query)
+    assert not result.is_valid
+    assert result.error_code == "disallowed_table"
+    assert table in result.error
+
+
+@pytest.mark.parametrize(
+    "query, error_code",
+    [
+        ("SELECT id FROM campaigns FOR UPDATE", "dml"),
+        ("SELECT id FROM campaigns; DROP TABLE campaigns", "multiple_statements"),
+        ("SELECT id FROM campaigns -- comment", "comment"),
+        ("WITH c AS (SELECT id FROM campaigns) SELECT id FROM c", "not_select"),
+        ("DELETE FROM campaigns", "not_select"),
+        ("", "empty"),
+    ],
+)
+def test_rejects_unsafe_statements(query, error_code):
+    result = check_query(query)
+    assert not result.is_valid
+    assert result.error_code == error_code
+
+
+def test_allows_union_and_subqueries_of_allowed_tables():
+    result = check_query(
+        "SELECT id FROM campaigns WHERE id IN (SELECT campaign_id FROM ad_groups)"
+        " UNION SELECT campaign_id FROM campaign_daily_stats"
+    )
+    assert result.is_valid
+    assert result.metadata.tables == ("ad_groups", "campaign_daily_stats", "campaigns")
+
+
+def test_appends_default_limit():
+    result = check_query("SELECT id FROM campaigns;")
+    assert result.query == "SELECT id FROM campaigns LIMIT 100"
+    assert result.metadata.limit == 100
+
+
+def test_clamps_offset_limit_to_max_limit():
+    result = check_query("SELECT id FROM campaigns LIMIT 5, 100000")
+    assert result.query == "SELECT id FROM campaigns LIMIT 5, 1000"
+    assert (result.metadata.limit, result.metadata.offset) == (1000, 5)
+
+
+def test_clamps_limit_offset_to_max_limit():
+    result = check_query("SELECT id FROM campaigns LIMIT 100000 OFFSET 5")
+    assert result.query == "SELECT id FROM campaigns LIMIT 1000 OFFSET 5"
+
+
+def test_memo_returns_cached_result():
+    hits = get_query_check_stats()["hits"]
+    first = check_query("SELECT id FROM campaigns")
+    assert check_query("SELECT id FROM campaigns") is first
+    assert get_query_check_stats()["hits"] == hits + 1
+
+
+def test_memo_is_invalidated_when_allowed_tables_change(monkeypatch):
+    assert not check_query("SELECT id FROM secrets").is_valid
+    monkeypatch.setattr(query_checker, "ALLOWED_TABLES", query_checker.ALLOWED_TABLES | {"secrets"})
+    assert check_query("SELECT id FROM secrets").is_valid
+
+
+def test_memo_is_invalidated_when_limits_change(monkeypatch):
+    assert check_query("SELECT id FROM campaigns").query.endswith("LIMIT 100")
+    monkeypatch.setattr(settings, "default_limit", 10)
+    assert check_query("SELECT id FROM campaigns").query.endswith("LIMIT 10")
+    monkeypatch.setattr(settings, "max_limit", 5)
+    assert check_query("SELECT id FROM campaigns LIMIT 50").query.endswith("LIMIT 5")
+
+
+def test_check_queries_keeps_order_and_counts_errors():
+    queries = ["SELECT id FROM campaigns", "SELECT id FROM secrets", "UPDATE campaigns SET id = 1"]
+    stats = CheckStats()
+    records = list(check_queries(queries, stats=stats))
+    assert [record.index for record in records] == [0, 1, 2]
+    assert [record.is_valid for record in records] == [True, False, False]
+    assert records[0].query == "SELECT id FROM campaigns LIMIT 100"
+    assert stats.as_dict()["errors"] == {"disallowed_table": 1, "not_select": 1}
+
+
+def test_check_queries_bypasses_the_memo():
+    before = get_query_check_stats()
+    list(check_queries(["SELECT id FROM campaigns"] * 3))
+    after = get_query_check_stats()
+    assert (after["hits"], after["misses"]) == (before["hits"], before["misses"])
+    assert after["entries"] == 0
+
+
+def test_check_queries_with_workers_keeps_order():
+    queries = [f"SELECT id FROM campaigns WHERE id = {i}" for i in range(20)] + ["SELECT 1"]
+    records = list(check_queries(queries, workers=2, chunksize=3))
+    assert [record.index for record in records] == list(range(21))
+    assert records[5].query == "SELECT id FROM campaigns WHERE id = 5 LIMIT 100"
+    assert records[-1].error_code == "no_table"
@@ -0,0 +1,101 @@
+"""
+日次実績スナップショットのテスト
+組み込みバックエンドで、スナップショットの回答がSQLの実行結果と一致することを確認します
+"""
+
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from src.external.db.session import execute_sql
+from src.services import stats_snapshot
+from src.services.stats_snapshot import IncompleteSnapshot, answer_from_snapshot, get_snapshot
+from src.settings import settings
+
+
+@pytest.fixture
+def snapshots(embedded_db, monkeypatch):
+    monkeypatch.setattr(settings, "stats_snapshot_enabled", True)
+    monkeypatch.setattr(
+        settings, "stats_snapshot_tables", ["campaign_daily_stats", "display_ad_daily_stats"]
+    )
+    monkeypatch.setattr(stats_snapshot, "_snapshots", {})
+
+
+def _plain_value(value):
+    # SQLiteはDATEを文字列で返すため、MySQLと同じ型の値と比較できるようにする
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+def _plain(rows: list[dict]) -> list[list]:
+    return [[_plain_value(value) for value in row.values()] for row in rows]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "SELECT campaign_id, SUM(impressions) AS impressions, SUM(clicks) AS clicks,"
+        " SUM(cost) AS cost FROM campaign_daily_stats"
+        " WHERE date >= '2024-01-01' AND date <= '2024-06-30'"
+        " GROUP BY campaign_id ORDER BY campaign_id",
+        "SELECT COUNT(*) AS days, AVG(cost) AS avg_cost, MIN(clicks) AS low, MAX(cost) AS high"
+        " FROM campaign_daily_stats WHERE date BETWEEN '2023-01-01' AND '2023-12-31'",
+        "SELECT campaign_id, SUM(cost) / NULLIF(SUM(clicks), 0) AS cpc,"
+        " SUM(conversion_value) / NULLIF(SUM(cost), 0) AS roas FROM campaign_daily_stats"
+        " WHERE date >= '2022-01-01' AND date < '2024-01-01' AND campaign_id IN (1, 3, 5)"
+        " GROUP BY campaign_id ORDER BY cpc DESC",
+        "SELECT c.date, SUM(c.clicks) AS clicks FROM campaign_daily_stats c"
+        " WHERE c.date >= '2024-01-01' AND c.date <= '2024-12-31'"
+        " GROUP BY c.date ORDER BY clicks DESC LIMIT 3",
+        "SELECT ad_id, SUM(impressions) AS impressions FROM display_ad_daily_stats"
+        " WHERE date >= '2020-01-01' AND date <= '2024-12-31' GROUP BY ad_id ORDER BY ad_id",
+    ],
+)
+def test_snapshot_answers_match_sql(snapshots, query):
+    answer = answer_from_snapshot(query)
+    assert answer is not None and answer["snapshot"]
+    result = execute_sql(query, settings.max_limit)
+    assert result["success"]
+    assert answer["row_count"] == result["row_count"] > 0
+    assert [list(row) for row in answer["data"]] == [list(row) for row in result["data"]]
+    for row, expected in zip(_plain(answer["data"]), _plain(result["data"])):
+        assert row == pytest.approx(expected)
+
+
+def test_snapshot_is_not_used_when_disabled(snapshots, monkeypatch):
+    monkeypatch.setattr(settings, "stats_snapshot_enabled", False)
+    assert (
+        answer_from_snapshot(
+            "SELECT SUM(clicks) FROM campaign_daily_stats"
+            " WHERE date >= '2024-01-01' AND date <= '2024-01-31'"
+        )
+        is None
+    )
+
+
+def test_load_reads_every_row(snapshots):
+    snapshot = get_snapshot("campaign_daily_stats")
+    snapshot.load()
+    count = execute_sql("SELECT COUNT(*) AS n FROM campaign_daily_stats")["data"][0]["n"]
+    assert snapshot.row_count == count
+
+
+def test_load_rejects_a_truncated_read(snapshots, monkeypatch):
+    fetch_columnar = stats_snapshot.fetch_columnar
+
+    def truncated(query, params=None):
+        if "COUNT(*)" not in query:
+            query = f"{query} LIMIT 10"
+        return fetch_columnar(query, params)
+
+    monkeypatch.setattr(stats_snapshot, "fetch_columnar", truncated)
+    snapshot = get_snapshot("campaign_daily_stats")
+    with pytest.raises(IncompleteSnapshot):
+        snapshot.load()
+    assert snapshot.row_count == 0
+    assert snapshot.current() is None